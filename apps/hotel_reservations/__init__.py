@@ -3,14 +3,25 @@ import py4web
 
 assert py4web.check_compatible("1.20190709.1")
 
-# by importing controllers you expose the actions defined in it
-from . import controllers
+import multiprocessing
 
-# by importing db you expose it to the _dashboard/dbadmin
-from .models import db
+from py4web.core import Session
 
-# import the scheduler
-from .tasks import scheduler
+# the worker processes of invoices.pool (forkserver or spawn) import this
+# package only to reach the rendering and hashing functions: they must not
+# load the app again, connect to the database or start another scheduler.
+# The command line tools (python -m apps.hotel_reservations.<tool>) import
+# it before py4web is set up, without a session secret: they load the app
+# afterwards with cli.boot()
+if multiprocessing.parent_process() is None and Session.SECRET:
+    # by importing controllers you expose the actions defined in it
+    from . import controllers
+
+    # by importing db you expose it to the _dashboard/dbadmin
+    from .models import db
+
+    # import the scheduler
+    from .tasks import scheduler
 
 # optional parameters
 __version__ = "0.0.0"
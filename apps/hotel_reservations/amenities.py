@@ -0,0 +1,166 @@
+"""
+This file defines the amenity catalog and its inverted index
+
+rooms.amenities stays the free-text list shown to users; its entries are
+normalized into db.amenities and linked to rooms through db.room_amenities.
+In memory, every amenity maps to the set of ids of the rooms that have it,
+so "Jacuzzi AND Balcony" or "Kitchenette OR Sofa Bed" is an intersection or
+a union of sets, proportional to the rooms involved, instead of a LIKE scan.
+
+The index is loaded on first use and reloaded whenever the data version
+(versions.py) of rooms, amenities or room_amenities has moved, whoever made
+the change: another worker, the room_import tool or raw SQL. Loading only
+reads: every writer of rooms.amenities syncs the links of its rooms
+(sync_rooms), and the rooms created before the catalog existed are linked
+once, when the models are set up (link_unlinked_rooms).
+"""
+
+import threading
+
+from .bulk import insert_many
+from .versions import versions
+
+TABLES = ("rooms", "amenities", "room_amenities")
+
+
+def parse_amenities(text):
+    """Split a comma separated amenities string into unique, trimmed names"""
+    names = []
+    seen = set()
+    for item in (text or "").split(","):
+        name = " ".join(item.split())
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return names
+
+
+class AmenityIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None  # the data versions the index was loaded at
+        self.names = {}  # lowercase name -> display name
+        self.rooms = {}  # lowercase name -> set of room ids
+
+    def load(self, db):
+        """(Re)build the index from db.room_amenities"""
+        # read before the links, see versions.py
+        version = versions.get(db, *TABLES)
+        rows = db(db.room_amenities.amenity_id == db.amenities.id).select(
+            db.amenities.name, db.room_amenities.room_id
+        )
+        names = {}
+        rooms = {}
+        for row in rows:
+            key = row.amenities.name.lower()
+            names[key] = row.amenities.name
+            rooms.setdefault(key, set()).add(row.room_amenities.room_id)
+        with self.lock:
+            self.names = names
+            self.rooms = rooms
+            self.version = version
+
+    def ensure_loaded(self, db):
+        """The index, reloaded first if the rooms or their amenities changed"""
+        version = versions.get(db, *TABLES)
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.load(db)
+        return self
+
+    def match(self, all_of=(), any_of=()):
+        """
+        Set of the rooms having every amenity in all_of and at least one in
+        any_of; None when neither filter is given (no restriction)
+        """
+        with self.lock:
+            rooms = None
+            # the rarest amenity first, every intersection is then at most its size
+            for room_ids in sorted(
+                (self.rooms.get(name.strip().lower(), set()) for name in all_of), key=len
+            ):
+                rooms = set(room_ids) if rooms is None else rooms & room_ids
+            if any_of:
+                union = set()
+                for name in any_of:
+                    union |= self.rooms.get(name.strip().lower(), set())
+                rooms = union if rooms is None else rooms & union
+        return rooms
+
+    def matching_room_ids(self, all_of=(), any_of=()):
+        rooms = self.match(all_of, any_of)
+        return None if rooms is None else sorted(rooms)
+
+    def catalog(self):
+        """[(name, number of rooms)] sorted by name"""
+        with self.lock:
+            return sorted(
+                (self.names[key], len(room_ids))
+                for key, room_ids in self.rooms.items()
+                if room_ids
+            )
+
+
+def sync_room(db, room_id, text):
+    """
+    Make db.room_amenities match the amenities string of a room, creating
+    missing db.amenities entries. Runs inside the caller's transaction and
+    returns the parsed names
+    """
+    return sync_rooms(db, {room_id: text})[room_id]
+
+
+def sync_rooms(db, texts):
+    """
+    sync_room for many rooms at once ({room_id: amenities string}), with one
+    lookup of the catalog and one insert of the links. Returns {room_id: names}
+    """
+    names = {room_id: parse_amenities(text) for room_id, text in texts.items()}
+    wanted = {name.lower(): name for room_names in names.values() for name in room_names}
+    catalog = {
+        row.name.lower(): row.id
+        for row in db(db.amenities.name.lower().belongs(list(wanted))).select(
+            db.amenities.id, db.amenities.name
+        )
+    } if wanted else {}
+    for key, name in wanted.items():
+        if key not in catalog:
+            catalog[key] = db.amenities.insert(name=name)
+    db(db.room_amenities.room_id.belongs(list(names))).delete()
+    insert_links(db, [
+        (room_id, catalog[name.lower()])
+        for room_id, room_names in names.items()
+        for name in room_names
+    ])
+    return names
+
+
+def link_unlinked_rooms(db, chunk_size=1000):
+    """
+    Sync the rooms that have amenities but no room_amenities rows yet, e.g.
+    created before the catalog existed. Commits, returns the number of rooms
+    linked; a room whose amenities string has no names is left alone
+    """
+    unlinked = db(
+        ~db.rooms.id.belongs(db(db.room_amenities)._select(db.room_amenities.room_id))
+    ).select(db.rooms.id, db.rooms.amenities)
+    texts = {room.id: room.amenities for room in unlinked if parse_amenities(room.amenities)}
+    room_ids = list(texts)
+    try:
+        for k in range(0, len(room_ids), chunk_size):
+            sync_rooms(db, {room_id: texts[room_id] for room_id in room_ids[k : k + chunk_size]})
+        db.commit()
+    except Exception:
+        # another process linked them at the same time
+        db.rollback()
+        return 0
+    return len(room_ids)
+
+
+def insert_links(db, links):
+    """Insert (room_id, amenity_id) pairs with one executemany (see bulk.py)"""
+    insert_many(db, db.room_amenities, ("room_id", "amenity_id"), links)
+
+
+amenity_index = AmenityIndex()
@@ -0,0 +1,196 @@
+"""
+This file defines the revenue analytics (ADR, RevPAR, occupancy, pickup)
+
+The reservations overlapping the requested window are read with one select
+into NumPy columns, every stay is expanded into its nights with np.repeat
+(night = first night + position inside the stay), and the metrics are
+group-bys done with np.bincount over room, bed count and day:
+
+- sold: room-nights sold in the window
+- available: room-nights that could have been sold (rooms x days)
+- occupancy: sold / available
+- ADR (average daily rate): revenue / sold
+- RevPAR (revenue per available room): revenue / available
+- pickup: room-nights of the window put on the books per booking day
+  (reservations.created_on) and their running total, the booking pace
+
+Revenue is total_cost split evenly over the nights of the stay, the same
+rule as the daily_room_stats rollup.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+from .availability import to_date
+
+EPOCH = date(1970, 1, 1).toordinal()
+
+
+def days(values, unit="D"):
+    """Days since 1970-01-01 of dates, datetimes or their strings (NaT for None)"""
+    array = np.array(list(values), dtype="datetime64[%s]" % unit)
+    return array.astype("datetime64[D]").astype(np.int64)
+
+
+def day_string(day):
+    return str(date.fromordinal(int(day) + EPOCH))
+
+
+def ratio(numerator, denominator):
+    """Elementwise numerator / denominator, 0 where the denominator is 0"""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def kpis(sold, revenue, available):
+    return dict(
+        sold=sold,
+        available=available,
+        revenue=revenue,
+        occupancy=ratio(sold, available),
+        adr=ratio(revenue, sold),
+        revpar=ratio(revenue, available),
+    )
+
+
+def rows_of(metrics, labels, label_name):
+    """Turn a dict of metric arrays into one dict per label"""
+    columns = {}
+    for key, value in metrics.items():
+        value = np.asarray(value)
+        if np.issubdtype(value.dtype, np.integer):
+            columns[key] = value.tolist()
+        else:
+            columns[key] = np.round(value.astype(float), 4).tolist()
+    return [
+        dict({label_name: label}, **{key: columns[key][k] for key in columns})
+        for k, label in enumerate(labels)
+    ]
+
+
+def load(db, start, end, room_ids=None):
+    """The columns of the reservations overlapping [start, end) and of the rooms"""
+    rooms_query = db.rooms.id > 0
+    if room_ids:
+        rooms_query &= db.rooms.id.belongs(room_ids)
+    room_rows = db.executesql(
+        db(rooms_query)._select(db.rooms.id, db.rooms.number_of_beds, orderby=db.rooms.id)
+    )
+    room_id, beds = (
+        (np.array(c, dtype=np.int64) for c in zip(*room_rows))
+        if room_rows
+        else (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    )
+    res = db.reservations
+    query = (res.start_date < end) & (res.end_date > start)
+    if room_ids:
+        query &= res.room_id.belongs(room_ids)
+    rows = db.executesql(
+        db(query)._select(res.room_id, res.start_date, res.end_date, res.total_cost, res.created_on)
+    )
+    if rows:
+        r_room, r_start, r_end, r_cost, r_created = zip(*rows)
+    else:
+        r_room = r_start = r_end = r_cost = r_created = ()
+    return dict(
+        room_id=room_id,
+        beds=beds,
+        res_room=np.array(r_room, dtype=np.int64),
+        res_start=days(r_start),
+        res_end=days(r_end),
+        res_cost=np.array([c or 0 for c in r_cost], dtype=float),
+        res_created=days(r_created, "s"),
+    )
+
+
+def compute(columns, start, end):
+    """The analytics payload for the window [start, end)"""
+    start = to_date(start).toordinal() - EPOCH
+    end = to_date(end).toordinal() - EPOCH
+    window = max(end - start, 0)
+    room_id, beds = columns["room_id"], columns["beds"]
+
+    # expand every stay into its nights
+    stay_nights = np.maximum(columns["res_end"] - columns["res_start"], 0)
+    total = int(stay_nights.sum())
+    stay = np.repeat(np.arange(len(stay_nights)), stay_nights)
+    first_of_stay = np.repeat(np.cumsum(stay_nights) - stay_nights, stay_nights)
+    night = columns["res_start"][stay] + (np.arange(total) - first_of_stay)
+    per_night = ratio(columns["res_cost"], stay_nights)[stay]
+    # row of the room of every stay in the (id sorted) rooms columns, -1 if gone
+    room_row = np.searchsorted(room_id, columns["res_room"])
+    found = room_row < len(room_id)
+    found[found] = room_id[room_row[found]] == columns["res_room"][found]
+    room_row = np.where(found, room_row, -1)[stay]
+
+    # keep the nights inside the window, of rooms that still exist
+    keep = (night >= start) & (night < end) & (room_row >= 0)
+    night, per_night, room_row, stay = night[keep], per_night[keep], room_row[keep], stay[keep]
+    day = night - start
+
+    # by room
+    room_sold = np.bincount(room_row, minlength=len(room_id))
+    room_revenue = np.bincount(room_row, weights=per_night, minlength=len(room_id))
+    by_room = kpis(room_sold, room_revenue, np.full(len(room_id), window))
+
+    # by bed count
+    bed_counts, bed_group = np.unique(beds, return_inverse=True)
+    bed_group = bed_group.reshape(-1)
+    groups = len(bed_counts)
+    by_beds = kpis(
+        np.bincount(bed_group[room_row], minlength=groups),
+        np.bincount(bed_group[room_row], weights=per_night, minlength=groups),
+        np.bincount(bed_group, minlength=groups) * window,
+    )
+    by_beds["rooms"] = np.bincount(bed_group, minlength=groups)
+
+    # by day
+    daily = kpis(
+        np.bincount(day, minlength=window),
+        np.bincount(day, weights=per_night, minlength=window),
+        np.full(window, len(room_id)),
+    )
+
+    # pickup: room-nights of the window booked on each day, and the running total
+    created = columns["res_created"][stay]
+    known = created >= 0  # NaT (no created_on) is a large negative number
+    booked_on, counts = np.unique(created[known], return_counts=True)
+    revenue_on = np.bincount(
+        np.searchsorted(booked_on, created[known]),
+        weights=per_night[known],
+        minlength=len(booked_on),
+    )
+    lead = night[known] - created[known]
+
+    totals = kpis(
+        room_sold.sum(keepdims=True),
+        room_revenue.sum(keepdims=True),
+        np.array([len(room_id) * window]),
+    )
+    totals = rows_of(totals, [window], "days")[0]
+    totals["rooms"] = len(room_id)
+    totals["average_lead_days"] = round(float(lead.mean()), 2) if lead.size else None
+    return dict(
+        start_date=day_string(start),
+        end_date=day_string(end),
+        totals=totals,
+        by_room=rows_of(by_room, room_id.tolist(), "room_id"),
+        by_beds=rows_of(by_beds, bed_counts.tolist(), "beds"),
+        daily=rows_of(daily, [day_string(start + k) for k in range(window)], "date"),
+        pickup=rows_of(
+            dict(room_nights=counts, revenue=revenue_on, on_the_books=np.cumsum(counts)),
+            [day_string(d) for d in booked_on.tolist()],
+            "date",
+        ),
+    )
+
+
+def report(db, start_date=None, end_date=None, room_ids=None):
+    """Analytics of [start_date, end_date), by default the last 30 days"""
+    end = to_date(end_date) if end_date else date.today()
+    start = to_date(start_date) if start_date else end - timedelta(days=30)
+    return compute(load(db, start, end, room_ids), start, end)
@@ -0,0 +1,110 @@
+"""
+This file defines the in-memory availability engine
+
+For every room it keeps the reservations as a list of half-open
+[start, end) intervals sorted by start date. Reservations of the same room
+never overlap (make_reservation refuses conflicts), so the list is sorted by
+end date as well and a conflict probe is a single bisect: O(log n) per room.
+
+The index is loaded from db.reservations the first time it is used. The
+actions add and discard their own reservations right after their commit,
+and every use first applies the changes other processes have made since,
+read from the change log of db.reservations (changes.py). It only answers
+the pre-checks (check_availability, the validation of a booking): the
+booking itself checks the table again under the room lock (booking.py).
+"""
+
+import threading
+from bisect import bisect_left
+from datetime import date, datetime
+
+from .changes import ChangeFeed
+
+
+def to_date(value):
+    """Accept a date, a datetime or a 'YYYY-MM-DD' string and return a date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value).strip(), "%Y-%m-%d").date()
+
+
+class AvailabilityIndex:
+    """Per-room sorted interval index over db.reservations"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.feed = ChangeFeed()  # the changes of db.reservations applied so far
+        # room_id -> sorted list of (start_ordinal, end_ordinal, reservation_id)
+        self.rooms = {}
+
+    def load(self, db):
+        """(Re)build the index from db.reservations"""
+        with self.lock:
+            # before the reservations, see changes.py
+            self.feed.start(db)
+            rows = db(db.reservations).select(
+                db.reservations.id,
+                db.reservations.room_id,
+                db.reservations.start_date,
+                db.reservations.end_date,
+                orderby=db.reservations.room_id | db.reservations.start_date,
+            )
+            rooms = {}
+            for row in rows:
+                start = to_date(row.start_date).toordinal()
+                end = to_date(row.end_date).toordinal()
+                rooms.setdefault(row.room_id, []).append((start, end, row.id))
+            self.rooms = rooms
+
+    def ensure_loaded(self, db):
+        """The index, with the changes made since its last use applied"""
+        with self.lock:
+            changes = self.feed.read(db)
+            if changes is None:
+                self.load(db)
+            for change in changes or ():
+                if change.op == "add":
+                    self.add(change.reservation_id, change.room_id, change.start_date, change.end_date)
+                else:
+                    self.discard(change.reservation_id, change.room_id, change.start_date, change.end_date)
+        return self
+
+    def add(self, reservation_id, room_id, start_date, end_date):
+        """Register a committed reservation, it is not an error if it is known"""
+        item = (to_date(start_date).toordinal(), to_date(end_date).toordinal(), int(reservation_id))
+        with self.lock:
+            intervals = self.rooms.setdefault(int(room_id), [])
+            k = bisect_left(intervals, item)
+            if k == len(intervals) or intervals[k] != item:
+                intervals.insert(k, item)
+
+    def discard(self, reservation_id, room_id, start_date, end_date):
+        """Forget a deleted reservation, it is not an error if it is unknown"""
+        item = (to_date(start_date).toordinal(), to_date(end_date).toordinal(), int(reservation_id))
+        with self.lock:
+            intervals = self.rooms.get(int(room_id), [])
+            k = bisect_left(intervals, item)
+            if k < len(intervals) and intervals[k] == item:
+                del intervals[k]
+            if not intervals:
+                self.rooms.pop(int(room_id), None)
+
+    def conflict(self, room_id, start_date, end_date):
+        """Return the id of a reservation overlapping [start, end) or None"""
+        start = to_date(start_date).toordinal()
+        end = to_date(end_date).toordinal()
+        with self.lock:
+            intervals = self.rooms.get(int(room_id))
+            if not intervals:
+                return None
+            # the last interval that starts before our end is the only candidate
+            k = bisect_left(intervals, (end,))
+            if k > 0 and intervals[k - 1][1] > start:
+                return intervals[k - 1][2]
+        return None
+
+
+# one per process: every worker process holds and updates its own copy
+availability = AvailabilityIndex()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the hot endpoints, with a baseline to catch regressions
+
+Run it from the folder that contains apps/:
+
+    python -m apps.hotel_reservations.benchmark
+    python -m apps.hotel_reservations.benchmark --sizes small --requests 100
+    python -m apps.hotel_reservations.benchmark --update-baseline
+
+Every size in SIZES has its dataset, generated once with synthetic.py (and
+a manager account) into databases/bench_<size>.seed.db; --regenerate makes
+it again. The data and the dates of the requests are laid out around the
+fixed day TODAY, so that runs made on different days compare. Every size then runs in its own process: the seed database is
+copied to bench_<size>.db, the app is booted in-process (cli.boot, with
+HOTEL_DB_URI pointing at the copy), the manager logs in through
+auth/api/login and each endpoint of ENDPOINTS is called --requests times
+through the WSGI callable, with seeded random arguments, after --warmup
+calls. For each endpoint it records the p50/p95/p99 latency, the SQL
+statements per request (counted by a pydal execution handler) and the
+errors (answers other than 2xx/304), and for each size the peak RSS.
+
+The results are written to --output and compared with --baseline: a
+tracked metric (TRACKED) worse than the baseline by more than its tolerance
+fails the run with exit status 1. Baselines depend on the machine, so make
+one with --update-baseline on the machine that runs the comparison.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+
+from .cli import APP_FOLDER, APP_NAME, boot
+
+DB_FOLDER = os.path.join(APP_FOLDER, "databases")
+SIZES = dict(
+    small=dict(rooms=50, customers=2000, reservations=20000),
+    medium=dict(rooms=300, customers=30000, reservations=500000),
+    large=dict(rooms=2000, customers=200000, reservations=10000000),
+)
+# the datasets are generated around a fixed day, the requests pick their dates around it
+TODAY = date(2030, 9, 1)
+FUTURE = 120  # days of bookings after TODAY
+MANAGER = dict(username="bench", password="bench-password", email="bench@example.test")
+# metric: (relative tolerance, absolute slack), a regression is new > old * (1 + tolerance) + slack
+TRACKED = dict(
+    p50_ms=(0.25, 0.5),
+    p95_ms=(0.25, 1.0),
+    p99_ms=(0.5, 2.0),
+    queries=(0.0, 0.5),
+    errors=(0.0, 0),
+    peak_rss_mb=(0.2, 10.0),
+)
+
+
+def day(offset):
+    return str(TODAY + timedelta(days=offset))
+
+
+def stay(rng, first, last, nights=7):
+    start = rng.randint(first, last)
+    return day(start), day(start + rng.randint(1, nights))
+
+
+def rooms_available(rng, data):
+    start, end = stay(rng, 0, 90)
+    return "GET", "api/rooms/available", dict(start_date=start, end_date=end), None
+
+
+def check_availability(rng, data):
+    start, end = stay(rng, 0, 90)
+    query = dict(room_id=rng.choice(data["room_ids"]), start_date=start, end_date=end)
+    return "GET", "api/check-availability", query, None
+
+
+def make_reservation(rng, data):
+    # past the generated history, so that most of them succeed
+    start, end = stay(rng, 400, 4000, 5)
+    body = dict(
+        room_id=rng.choice(data["room_ids"]),
+        start_date=start,
+        end_date=end,
+        customer_identifier=rng.choice(data["emails"]),
+    )
+    return "POST", "api/make-reservation", {}, body
+
+
+def calendar_reservations(rng, data):
+    offset = rng.randint(-60, 60)
+    return "GET", "api/calendar/reservations", dict(start=day(offset), end=day(offset + 30)), None
+
+
+def availability_data(rng, data):
+    offset = rng.randint(0, 60)
+    return "GET", "api/availability-data", dict(start_date=day(offset), end_date=day(offset + 30)), None
+
+
+def manager_customers(rng, data):
+    return "GET", "api/manager/customers", dict(limit=50), None
+
+
+ENDPOINTS = dict(
+    rooms_available=rooms_available,
+    check_availability=check_availability,
+    make_reservation=make_reservation,
+    calendar_reservations=calendar_reservations,
+    availability_data=availability_data,
+    manager_customers=manager_customers,
+)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, int(round(p / 100.0 * len(values) + 0.5)) - 1))
+    return values[k]
+
+
+def paths(size):
+    """(seed database, database, uri) of size"""
+    return (
+        os.path.join(DB_FOLDER, "bench_%s.seed.db" % size),
+        os.path.join(DB_FOLDER, "bench_%s.db" % size),
+        "sqlite://bench_%s.db" % size,
+    )
+
+
+def remove_database(size):
+    """Delete the databases of size and their migration (.table) files"""
+    seed_path, path, uri = paths(size)
+    uri_hash = hashlib.md5(uri.encode("utf8")).hexdigest()
+    for name in os.listdir(DB_FOLDER):
+        if name.startswith(uri_hash + "_") or os.path.join(DB_FOLDER, name) in (seed_path, path):
+            os.remove(os.path.join(DB_FOLDER, name))
+
+
+def generate(size, seed):
+    """Runs in a child process with HOTEL_DB_URI set: make the seed database of size"""
+    boot()
+    from . import synthetic
+    from .customer_import import password_crypt
+    from .models import db
+
+    print(f"generating {size}: {SIZES[size]}")
+    synthetic.generate(db, seed=seed, end_date=TODAY + timedelta(days=FUTURE), rollup=True,
+                       **SIZES[size])
+    user_id = db.auth_user.insert(
+        username=MANAGER["username"],
+        email=MANAGER["email"],
+        password=str(password_crypt(db)(MANAGER["password"])[0]),
+    )
+    db.managers.insert(user_id=user_id, name="Benchmark", email=MANAGER["email"],
+                       phone_number="+15550000000")
+    db.commit()
+    db.close()
+
+
+class Client:
+    """Calls a WSGI application in-process, keeping the cookies"""
+
+    def __init__(self, app):
+        self.app = app
+        self.cookies = {}
+
+    def call(self, method, path, query=None, body=None):
+        data = json.dumps(body).encode("utf8") if body is not None else b""
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": "/%s/%s" % (APP_NAME, path),
+            "QUERY_STRING": urlencode(query or {}),
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "8000",
+            "HTTP_HOST": "localhost:8000",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(data),
+            "wsgi.errors": sys.stderr,
+            "CONTENT_LENGTH": str(len(data)),
+            "CONTENT_TYPE": "application/json",
+        }
+        if self.cookies:
+            environ["HTTP_COOKIE"] = "; ".join("%s=%s" % item for item in self.cookies.items())
+        answer = {}
+
+        def start_response(status, headers, exc_info=None):
+            answer["status"] = int(status.split()[0])
+            answer["headers"] = headers
+
+        content = b"".join(self.app(environ, start_response))
+        for name, value in answer["headers"]:
+            if name.lower() == "set-cookie":
+                key, _, rest = value.partition("=")
+                self.cookies[key] = rest.split(";")[0]
+        return answer["status"], content
+
+
+def run(size, requests, warmup, seed):
+    """Runs in a child process: boot the app on a copy of the seed database and measure"""
+    from pydal.helpers.classes import ExecutionHandler
+
+    app = boot()
+    from .models import db
+
+    class QueryCounter(ExecutionHandler):
+        count = 0
+
+        def after_execute(self, command):
+            QueryCounter.count += 1
+
+    db._adapter.execution_handlers.append(QueryCounter)
+    data = dict(
+        room_ids=[row.id for row in db(db.rooms).select(db.rooms.id)],
+        emails=[row.email for row in db(db.customers).select(db.customers.email, limitby=(0, 500))],
+    )
+    db.commit()
+    client = Client(app)
+    status, content = client.call("POST", "auth/api/login",
+                                  body=dict(email=MANAGER["username"], password=MANAGER["password"]))
+    if status != 200:
+        raise RuntimeError("login failed: %s %s" % (status, content[:200]))
+
+    endpoints = {}
+    for name, make in ENDPOINTS.items():
+        rng = random.Random("%s:%s" % (seed, name))
+        for _ in range(warmup):
+            client.call(*make(rng, data))
+        timings, queries, errors, sizes = [], 0, 0, 0
+        for _ in range(requests):
+            method, path, query, body = make(rng, data)
+            QueryCounter.count = 0
+            t0 = time.perf_counter()
+            status, content = client.call(method, path, query, body)
+            timings.append((time.perf_counter() - t0) * 1000)
+            queries += QueryCounter.count
+            sizes += len(content)
+            if not (200 <= status < 300 or status == 304) or b'"success": false' in content:
+                errors += 1
+        timings.sort()
+        endpoints[name] = dict(
+            requests=requests,
+            p50_ms=round(percentile(timings, 50), 3),
+            p95_ms=round(percentile(timings, 95), 3),
+            p99_ms=round(percentile(timings, 99), 3),
+            max_ms=round(timings[-1], 3),
+            queries=round(queries / requests, 2),
+            errors=errors,
+            bytes=sizes // requests,
+        )
+        print(f"{size:>8} {name:<24} p50 {endpoints[name]['p50_ms']:>8.2f}ms"
+              f"  p95 {endpoints[name]['p95_ms']:>8.2f}ms  p99 {endpoints[name]['p99_ms']:>8.2f}ms"
+              f"  queries {endpoints[name]['queries']:>6}  errors {errors}")
+    return dict(
+        dataset=SIZES[size],
+        endpoints=endpoints,
+        peak_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    )
+
+
+def child(*args, uri=None):
+    """Run this module again with args, in a new process"""
+    env = dict(os.environ, HOTEL_DB_URI=uri) if uri else os.environ
+    command = [sys.executable, "-m", "apps.%s.benchmark" % APP_NAME]
+    subprocess.run(command + list(args), check=True, env=env,
+                   cwd=os.path.dirname(os.path.dirname(APP_FOLDER)))
+
+
+def regressions(baseline, results):
+    """[(size, endpoint or None, metric, old, new)] of the tracked metrics that got worse"""
+    found = []
+
+    def check(size, endpoint, old, new):
+        for metric, (tolerance, slack) in TRACKED.items():
+            if metric in old and metric in new and old[metric] is not None:
+                if new[metric] > old[metric] * (1 + tolerance) + slack:
+                    found.append((size, endpoint, metric, old[metric], new[metric]))
+
+    for size, result in results["sizes"].items():
+        old = baseline.get("sizes", {}).get(size)
+        if not old:
+            continue
+        check(size, None, old, result)
+        for endpoint, metrics in result["endpoints"].items():
+            if endpoint in old.get("endpoints", {}):
+                check(size, endpoint, old["endpoints"][endpoint], metrics)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sizes", default="small,medium", help="comma separated, from: %s" % ", ".join(SIZES))
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="requests per endpoint before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--regenerate", action="store_true", help="generate the datasets again")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=os.path.join(APP_FOLDER, "benchmark_baseline.json"))
+    parser.add_argument("--update-baseline", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--generate", help=argparse.SUPPRESS)
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        generate(args.generate, args.seed)
+        return 0
+    if args.run:
+        result = run(args.run, args.requests, args.warmup, args.seed)
+        with open(args.result_file, "w") as stream:
+            json.dump(result, stream)
+        return 0
+
+    results = dict(
+        created_on=datetime.now().isoformat(timespec="seconds"),
+        python=platform.python_version(),
+        machine=platform.platform(),
+        requests=args.requests,
+        sizes={},
+    )
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        if size not in SIZES:
+            parser.error("unknown size %s" % size)
+        seed_path, path, uri = paths(size)
+        if args.regenerate or not os.path.exists(seed_path):
+            remove_database(size)
+            child("--generate", size, "--seed", str(args.seed), uri=uri)
+            shutil.copyfile(path, seed_path)
+        # every run starts from the same data, make_reservation writes
+        shutil.copyfile(seed_path, path)
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as stream:
+            result_file = stream.name
+        try:
+            child("--run", size, "--requests", str(args.requests), "--warmup", str(args.warmup),
+                  "--seed", str(args.seed), "--result-file", result_file, uri=uri)
+            with open(result_file) as stream:
+                results["sizes"][size] = json.load(stream)
+        finally:
+            os.remove(result_file)
+        print(f"{size:>8} peak RSS {results['sizes'][size]['peak_rss_mb']} MB")
+
+    with open(args.output, "w") as stream:
+        json.dump(results, stream, indent=2)
+    print(f"results written to {args.output}")
+    if args.update_baseline:
+        with open(args.baseline, "w") as stream:
+            json.dump(results, stream, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare with, make one with --update-baseline")
+        return 0
+    with open(args.baseline) as stream:
+        baseline = json.load(stream)
+    found = regressions(baseline, results)
+    for size, endpoint, metric, old, new in found:
+        print(f"REGRESSION {size} {endpoint or '-'} {metric}: {old} -> {new}")
+    if not found:
+        print("no regression against %s" % args.baseline)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+"""
+This file defines the booking coordinator
+
+A reservation is a check-then-insert: look for an overlapping reservation of
+the room and, if there is none, insert. Two workers running that sequence for
+the same room at the same time can both pass the check, so the sequence runs
+while holding a lock on the room:
+
+- inside the process, one of a fixed set of striped locks (room_id % stripes),
+  so threads booking different rooms rarely wait on each other
+- in the database, the rooms rows are selected FOR UPDATE on PostgreSQL (row
+  locks, bookings of other rooms proceed) while on SQLite, which only has a
+  database-wide write lock, the transaction starts with BEGIN IMMEDIATE and is
+  retried while the file is locked
+
+rooms() is the transaction: it takes both locks, commits when its block
+completes and rolls back when it raises, and only then releases the striped
+locks, so everything else the booking writes (the rollup, the invoice, the
+outbox) commits while the room is still held:
+
+    with booking.rooms([room_id]):
+        ids = booking.insert(legs)
+        invoices.enqueue(db, ids)
+
+book() is that block for a booking with nothing else to write. Rooms are
+always locked in ascending id order to avoid deadlocks.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from .availability import to_date
+from .common import db
+from .models import overlapping
+
+
+class RoomUnavailable(Exception):
+    """Raised by book() when one of the rooms is taken for the requested dates"""
+
+    def __init__(self, room_id, reservation_id=None):
+        self.room_id = room_id
+        self.reservation_id = reservation_id
+        Exception.__init__(self, "Room %s is not available for selected dates" % room_id)
+
+
+class BookingCoordinator:
+    def __init__(self, db, stripes=64, retries=8, retry_delay=0.05):
+        self.db = db
+        self.locks = [threading.Lock() for _ in range(stripes)]
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def stripes_for(self, room_ids):
+        return sorted({int(room_id) % len(self.locks) for room_id in room_ids})
+
+    @contextmanager
+    def rooms(self, room_ids):
+        """
+        Hold the process and database locks of room_ids for the body of the block,
+        one transaction: committed when the body completes, rolled back if it raises
+        """
+        room_ids = sorted({int(room_id) for room_id in room_ids})
+        stripes = self.stripes_for(room_ids)
+        for k in stripes:
+            self.locks[k].acquire()
+        try:
+            self.lock_rows(room_ids)
+            try:
+                yield room_ids
+            except BaseException:
+                self.db.rollback()
+                raise
+            self.db.commit()
+        finally:
+            for k in reversed(stripes):
+                self.locks[k].release()
+
+    def lock_rows(self, room_ids):
+        db = self.db
+        # 'sqlite:memory' for an in-memory database
+        if db._dbname.split(":")[0] != "sqlite":
+            db(db.rooms.id.belongs(room_ids)).select(
+                db.rooms.id, orderby=db.rooms.id, for_update=True
+            )
+            return
+        if db._adapter.connection.in_transaction:
+            # this connection already holds the write lock, BEGIN IMMEDIATE would fail
+            return
+        for attempt in range(self.retries + 1):
+            try:
+                db.executesql("BEGIN IMMEDIATE;")
+                return
+            except Exception as e:
+                if "locked" not in str(e) or attempt == self.retries:
+                    raise
+                time.sleep(self.retry_delay * 2**attempt)
+
+    def conflict(self, room_id, start_date, end_date):
+        """Return the first reservation of room_id overlapping [start, end), or None"""
+        db = self.db
+        return db(
+            (db.reservations.room_id == room_id)
+            & overlapping(start_date, end_date, db.reservations)
+        ).select(db.reservations.id, limitby=(0, 1), orderby_on_limitby=False).first()
+
+    def insert(self, legs):
+        """
+        Insert a list of reservations, inside rooms() for all their rooms. Every
+        leg is a dict of db.reservations fields and must include room_id,
+        start_date and end_date. Returns the new ids in the order of legs,
+        raises RoomUnavailable on conflict
+        """
+        for k, leg in enumerate(legs):
+            # legs of the same request must not overlap each other either
+            for other in legs[:k]:
+                if int(other["room_id"]) == int(leg["room_id"]) and (
+                    to_date(other["start_date"]) < to_date(leg["end_date"])
+                    and to_date(other["end_date"]) > to_date(leg["start_date"])
+                ):
+                    raise RoomUnavailable(leg["room_id"])
+            row = self.conflict(leg["room_id"], leg["start_date"], leg["end_date"])
+            if row:
+                raise RoomUnavailable(leg["room_id"], row.id)
+        return self.db.reservations.bulk_insert(legs)
+
+    def book(self, legs):
+        """Insert a list of reservations all-or-nothing and commit, see insert()"""
+        with self.rooms([leg["room_id"] for leg in legs]):
+            return self.insert(legs)
+
+booking = BookingCoordinator(db)
@@ -0,0 +1,56 @@
+"""
+This file defines the executemany inserts used by the bulk tools
+
+table.bulk_insert builds, represents and runs one INSERT per row, which
+dominates imports of hundreds of thousands of rows. insert_many sends one
+parameterized INSERT and all the rows with cursor.executemany instead; the
+rows must already hold values the driver can store as pydal would: dates
+and datetimes as ISO strings (or date objects), booleans through boolean().
+
+It bypasses pydal entirely: no defaults, no computed fields and no
+_after_insert callbacks, and it returns no ids. The database triggers of
+versions.watch still bump the versions of the table.
+"""
+
+# DB-API paramstyle -> placeholder
+PLACEHOLDERS = dict(qmark="?", format="%s", pyformat="%s")
+
+
+def placeholder(db):
+    """The driver's placeholder, None when executemany is not supported here"""
+    return PLACEHOLDERS.get(getattr(db._adapter.driver, "paramstyle", None))
+
+
+def boolean(db, value):
+    """A Python bool as a boolean field stores it (CHAR(1) 'T'/'F' by default)"""
+    if db._adapter.types["boolean"].upper().startswith("CHAR"):
+        return "T" if value else "F"
+    return bool(value)
+
+
+def insert_many(db, table, fieldnames, rows):
+    """Insert rows (sequences of values in the order of fieldnames), in the caller's transaction"""
+    if not rows:
+        return
+    mark = placeholder(db)
+    if not mark:
+        table.bulk_insert([dict(zip(fieldnames, row)) for row in rows])
+        return
+    db._adapter.cursor.executemany(
+        "INSERT INTO %s (%s) VALUES (%s);"
+        % (
+            table._rname,
+            ", ".join(table[name]._rname for name in fieldnames),
+            ", ".join([mark] * len(fieldnames)),
+        ),
+        rows,
+    )
+
+
+def reset_sequence(db, table):
+    """After rows were inserted with explicit ids, move PostgreSQL's id sequence past them"""
+    if db._dbname == "postgres":
+        db.executesql(
+            "SELECT setval(pg_get_serial_sequence('%s', 'id'), COALESCE(MAX(id), 1)) FROM %s;"
+            % (table._rname, table._rname)
+        )
@@ -0,0 +1,185 @@
+"""
+This file defines the change log of db.reservations
+
+The in-memory engines (availability.py, occupancy.py) are loaded from
+db.reservations once, then follow it through db.reservation_changes: one row
+per reservation inserted ('add') or deleted ('del'), an update of its room
+or dates being both, written by the triggers that watch() installs on SQLite
+and PostgreSQL, in the transaction of the write, whoever the writer is. On
+other databases pydal callbacks write the log instead, which only covers
+writes made through pydal.
+
+Each engine has a ChangeFeed, the id up to which it has applied the log,
+and on every use reads the changes above it: a range probe of the primary
+key that finds nothing most of the time. The changes are applied in id
+order, which for a room is the order of its writes (booking.py). Applying a
+change twice is harmless, so the actions apply their own writes right after
+their commit (controllers.reservation_added) and the feed replays them later.
+
+On PostgreSQL the ids are taken at insert time and a transaction can commit
+after a later one. A missing id holds the feed back and the changes above it
+are replayed on every read, until it shows up or it has been missing for
+GRACE seconds (a rolled back insert leaves a hole for good).
+
+prune() keeps the last KEEP changes (the prune_reservation_changes task); an
+engine whose changes are gone from the log loads the reservations again.
+"""
+
+import time
+
+# seconds a missing change id holds the feed back
+GRACE = 60
+
+# changes replayed after a load, in case older ones commit after it
+REPLAY = 100
+
+# changes kept by prune()
+KEEP = 100000
+
+SQLITE_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS %(tablename)s_change_insert AFTER INSERT ON %(table)s"
+    " BEGIN %(add)s; END;",
+    "CREATE TRIGGER IF NOT EXISTS %(tablename)s_change_delete AFTER DELETE ON %(table)s"
+    " BEGIN %(del)s; END;",
+    "CREATE TRIGGER IF NOT EXISTS %(tablename)s_change_update"
+    " AFTER UPDATE OF %(room_id)s, %(start_date)s, %(end_date)s ON %(table)s"
+    " BEGIN %(del)s; %(add)s; END;",
+)
+
+POSTGRES_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION log_%(tablename)s_change() RETURNS trigger AS $$"
+    " BEGIN"
+    " IF TG_OP <> 'INSERT' THEN %(del)s; END IF;"
+    " IF TG_OP <> 'DELETE' THEN %(add)s; END IF;"
+    " RETURN NULL; END; $$ LANGUAGE plpgsql;"
+)
+
+POSTGRES_TRIGGER = (
+    "DROP TRIGGER IF EXISTS %(tablename)s_change ON %(table)s;"
+    " CREATE TRIGGER %(tablename)s_change"
+    " AFTER INSERT OR DELETE OR UPDATE OF %(room_id)s, %(start_date)s, %(end_date)s ON %(table)s"
+    " FOR EACH ROW EXECUTE PROCEDURE log_%(tablename)s_change();"
+)
+
+LOG = (
+    "INSERT INTO %(log)s (%(reservation_id)s, %(room_id)s, %(start_date)s, %(end_date)s, %(op)s)"
+    " VALUES (%(row)s.%(id)s, %(row)s.%(room_id)s, %(row)s.%(start_date)s, %(row)s.%(end_date)s,"
+    " '%(value)s')"
+)
+
+
+def watch(db, table, log):
+    """Write the changes of table (db.reservations) to log, safe to call on every start"""
+    names = dict(
+        table=table._rname,
+        tablename=table._tablename,
+        log=log._rname,
+        id=table.id._rname,
+        room_id=table.room_id._rname,
+        start_date=table.start_date._rname,
+        end_date=table.end_date._rname,
+        reservation_id=log.reservation_id._rname,
+        op=log.op._rname,
+    )
+    names["add"] = LOG % dict(names, row="NEW", value="add")
+    names["del"] = LOG % dict(names, row="OLD", value="del")
+    triggers = False
+    try:
+        # 'sqlite:memory' for an in-memory database
+        dbname = db._dbname.split(":")[0]
+        if dbname == "sqlite":
+            for trigger in SQLITE_TRIGGERS:
+                db.executesql(trigger % names)
+            triggers = True
+        elif dbname == "postgres":
+            db.executesql(POSTGRES_FUNCTION % names)
+            db.executesql(POSTGRES_TRIGGER % names)
+            triggers = True
+        db.commit()
+    except Exception:
+        # e.g. no permission to create triggers, fall back to the callbacks
+        db.rollback()
+        triggers = False
+    if not triggers:
+
+        def record(rows, op):
+            for row in rows.select(table.id, table.room_id, table.start_date, table.end_date):
+                log.insert(
+                    reservation_id=row.id,
+                    room_id=row.room_id,
+                    start_date=row.start_date,
+                    end_date=row.end_date,
+                    op=op,
+                )
+
+        table._after_insert.append(lambda fields, id: record(db(table.id == id), "add"))
+        table._before_delete.append(lambda rows: record(rows, "del"))
+        table._before_update.append(lambda rows, fields: record(rows, "del"))
+        table._after_update.append(lambda rows, fields: record(rows, "add"))
+
+
+class ChangeFeed:
+    """The position of one engine in db.reservation_changes"""
+
+    def __init__(self):
+        self.seen = None  # every change up to this id is applied, None before a load
+        self.missing = None  # (id, time) of the first change id found missing
+
+    def start(self, db):
+        """Position the feed for a load of the reservations, call it right before reading them"""
+        changes = db.reservation_changes
+        first, last = changes.id.min(), changes.id.max()
+        row = db(changes).select(first, last).first()
+        if row[last] is None:
+            self.seen = 0
+        else:
+            self.seen = max(row[last] - REPLAY, row[first] - 1)
+        self.missing = None
+
+    def read(self, db):
+        """
+        The changes to apply, in id order, or None when the reservations have
+        to be loaded: before the first load and when changes were pruned
+        """
+        if self.seen is None:
+            return None
+        changes = db.reservation_changes
+        rows = db(changes.id > self.seen).select(
+            changes.id,
+            changes.reservation_id,
+            changes.room_id,
+            changes.start_date,
+            changes.end_date,
+            changes.op,
+            orderby=changes.id,
+        )
+        if not rows:
+            return rows
+        if rows.first().id != self.seen + 1:
+            first = changes.id.min()
+            if db(changes).select(first).first()[first] > self.seen + 1:
+                return None
+        seen = self.seen
+        for row in rows:
+            if row.id != seen + 1:
+                break
+            seen = row.id
+        if seen == rows.last().id:
+            self.missing = None
+        elif self.missing is None or self.missing[0] != seen + 1:
+            self.missing = (seen + 1, time.monotonic())
+        elif time.monotonic() - self.missing[1] > GRACE:
+            seen = rows.last().id
+            self.missing = None
+        self.seen = seen
+        return rows
+
+
+def prune(db, keep=KEEP):
+    """Delete all but the last keep changes, returns how many were deleted"""
+    changes = db.reservation_changes
+    last = changes.id.max()
+    last = db(changes).select(last).first()[last]
+    if last is None:
+        return 0
+    return db(changes.id <= last - max(keep, 1)).delete()
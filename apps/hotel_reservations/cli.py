@@ -0,0 +1,32 @@
+"""
+This file boots the app for the command line tools
+
+The tools (room_import, customer_import, synthetic, benchmark, the booking
+stress test) run from the folder that contains apps/:
+
+    python -m apps.hotel_reservations.room_import --sample
+
+python -m imports this package first, before py4web is set up, and the
+package then leaves the app alone (see __init__.py). boot() loads it the way
+py4web run does, with py4web.core.wsgi, on settings.DB_URI (HOTEL_DB_URI).
+"""
+
+import os
+import sys
+
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+APP_NAME = os.path.basename(APP_FOLDER)
+
+
+def boot():
+    """Load the app once in this process and return its WSGI application"""
+    from py4web.core import Reloader, bottle, wsgi
+
+    if Reloader.MODULES.get(APP_NAME) is not None:
+        # already loaded, by py4web or by the tests
+        return bottle.default_app()
+    app = wsgi(apps_folder=os.path.dirname(APP_FOLDER), app_names=APP_NAME, yes=True)
+    if Reloader.ERRORS.get(APP_NAME):
+        sys.stderr.write(Reloader.ERRORS[APP_NAME])
+        raise RuntimeError("could not load %s" % APP_NAME)
+    return app
@@ -3,26 +3,104 @@ This file defines cache, session, and translator T object for the app
 These are fixtures that every app needs so probably you will not be editing this file
 """
 
+import logging
 import os
 import sys
 
 from pydal.tools.scheduler import Scheduler
 from pydal.tools.tags import Tags
 
-from py4web import DAL, Cache, Field, Flash, Session, Translator, action
+from py4web import DAL, URL, Cache, Field, Flash, Session, Translator, abort, action, redirect
+from py4web.core import Fixture
 from py4web.server_adapters.logging_utils import make_logger
 from py4web.utils.auth import Auth
 from py4web.utils.downloader import downloader
 from py4web.utils.factories import ActionFactory
 from py4web.utils.mailer import Mailer
 
-from . import settings
+from . import images, settings
+from .metrics import RequestMetrics
 
 # #######################################################
 # implement custom loggers form settings.LOGGERS
 # #######################################################
 logger = make_logger("py4web:" + settings.APP_NAME, settings.LOGGERS)
 
+
+class LogRecord:
+    """event key=value ... formatted only if a handler actually emits it"""
+
+    def __init__(self, route, event, fields):
+        self.route = route
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        parts = ["event=%s" % self.event]
+        if self.route:
+            parts.append("route=%s" % self.route)
+        for key, value in self.fields.items():
+            if callable(value):
+                value = value()
+            parts.append("%s=%r" % (key, value))
+        return " ".join(parts)
+
+
+class StructuredLogger:
+    """
+    Structured, sampled logging on top of logger:
+
+        log.debug("customer_created", customer_id=customer_id)
+
+    Nothing is formatted unless the level is enabled and the record survives
+    the sampling of its route (settings.LOG_SAMPLING); values can be callables,
+    evaluated only then
+    """
+
+    def __init__(self, logger, sampling=None):
+        self.logger = logger
+        self.sampling = sorted((sampling or {}).items(), key=lambda item: -len(item[0]))
+
+    def route(self):
+        try:
+            from py4web import request
+
+            return request.path.split("/", 2)[-1]
+        except Exception:
+            return None
+
+    def sampled(self, route):
+        import random
+
+        for prefix, rate in self.sampling:
+            if route and route.startswith(prefix):
+                return random.random() < rate
+        return True
+
+    def log(self, level, event, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        route = self.route()
+        if level < logging.WARNING and not self.sampled(route):
+            return
+        # stacklevel: report the line of the action, not this wrapper
+        self.logger.log(level, "%s", LogRecord(route, event, fields), stacklevel=3)
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+
+log = StructuredLogger(logger, settings.LOG_SAMPLING)
+
 # #######################################################
 # connect to db
 # #######################################################
@@ -34,6 +112,12 @@ db = DAL(
     fake_migrate=settings.DB_FAKE_MIGRATE,
 )
 
+# #######################################################
+# per-route request and query metrics (see metrics.py), list it first:
+# @action.uses(metrics, db, ...)
+# #######################################################
+metrics = RequestMetrics(db)
+
 # #######################################################
 # define global objects that may or may not be used by the actions
 # #######################################################
@@ -201,10 +285,18 @@ if settings.OAUTH2OKTA_CLIENT_ID:
 if settings.UPLOAD_FOLDER:
 
     @action("download/<filename>")
-    @action.uses(db)
+    @action.uses(metrics, db)
     def download(filename):
         return downloader(db, settings.UPLOAD_FOLDER, filename)
 
+    # fixed-size variants of the room images (see images.py)
+    @action("images/<name>/<filename>")
+    @action.uses(metrics, db)
+    def image_variant(name, filename):
+        return images.serve(db, settings.UPLOAD_FOLDER, name, filename) or downloader(
+            db, settings.UPLOAD_FOLDER, filename
+        )
+
     # To take advantage of this in Form(s)
     # for every field of type upload you MUST specify:
     #
@@ -227,6 +319,36 @@ else:
 # #######################################################
 auth.enable(uses=(session, T, db), env=dict(T=T))
 
+# #######################################################
+# Role fixtures for manager-only actions
+# #######################################################
+class ManagerRequired(Fixture):
+    """
+    Like auth.user, but the logged in user must also be a manager, else 403
+    (or a redirect to redirect_to). The role is looked up on every request, a
+    probe of managers_user_id_idx: it is an authorization check, and a role
+    cached in the session would outlive a revocation made by another worker
+    """
+
+    def __init__(self, redirect_to=None):
+        self.__prerequisites__ = [auth.user, db]
+        self.redirect_to = redirect_to
+
+    def is_manager(self, user_id):
+        return not db(db.managers.user_id == user_id).isempty()
+
+    def on_request(self, context):
+        user = auth.get_user()
+        if user and self.is_manager(user["id"]):
+            return
+        if self.redirect_to:
+            redirect(URL(self.redirect_to))
+        abort(403)
+
+
+manager_required = ManagerRequired()
+manager_page = ManagerRequired(redirect_to="index")
+
 # #######################################################
 # Define convenience decorators
 # They can be used instead of @action and @action.uses
@@ -234,5 +356,5 @@ auth.enable(uses=(session, T, db), env=dict(T=T))
 # If you need to provide extra fixtures for a specific controller
 # add them like this: @authenticated(uses=[extra_fixture])
 # #######################################################
-unauthenticated = ActionFactory(db, session, T, flash, auth)
-authenticated = ActionFactory(db, session, T, flash, auth.user)
+unauthenticated = ActionFactory(metrics, db, session, T, flash, auth)
+authenticated = ActionFactory(metrics, db, session, T, flash, auth.user)
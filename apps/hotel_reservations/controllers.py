@@ -25,10 +25,16 @@ session, db, T, auth, and tempates are examples of Fixtures.
 Warning: Fixtures MUST be declared with @action.uses({fixtures}) else your app will result in undefined behavior
 """
 
+import hmac
+
 from yatl.helpers import A
 
-from py4web import URL, abort, action, redirect, request
+from py4web import URL, abort, action, redirect, request, response
 
+from .amenities import amenity_index, sync_room
+from .availability import availability, to_date
+from . import analytics, customer_search, export, images, invoices, outbox, rollup
+from .booking import RoomUnavailable, booking
 from .common import (
     T,
     auth,
@@ -36,10 +42,22 @@ from .common import (
     cache,
     db,
     flash,
+    scheduler,
+    settings,
+    log,
     logger,
+    manager_page,
+    manager_required,
+    metrics,
     session,
     unauthenticated,
 )
+from .models import free_rooms, overlapping
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .occupancy import occupancy
+from .pagination import InvalidCursor, paginate
+from .room_catalog import room_catalog, room_payload
+from .versions import ConditionalGet
 
 # check compatibility
 import py4web
@@ -60,15 +78,37 @@ __version__ = "0.0.0"
 __author__ = "you <you@example.com>"
 __license__ = "anything you want"
 
+def reservation_added(reservation_id, room_id, start_date, end_date):
+    """Keep the in-memory availability engines in sync after a committed insert"""
+    availability.add(reservation_id, room_id, start_date, end_date)
+    occupancy.add(room_id, start_date, end_date)
+
+
+def reservation_removed(rows):
+    """Keep the in-memory availability engines in sync after a committed delete"""
+    for r in rows:
+        availability.discard(r.id, r.room_id, r.start_date, r.end_date)
+        occupancy.discard(r.room_id, r.start_date, r.end_date)
+
+
+def page(query, keys, params, descending=False, **attributes):
+    """One keyset page of db(query) for the limit and cursor in params, 400 on a bad cursor"""
+    try:
+        return paginate(
+            db, query, keys, params.get('limit'), params.get('cursor'), descending, **attributes
+        )
+    except InvalidCursor as e:
+        abort(400, str(e))
+
+
 @action("index")
-@action.uses("index.html", auth, T)
+@action.uses(metrics, "index.html", auth, T)
 def index():
     user = auth.get_user()
 
     if user:
-        # Check user type from auth_user table
-        manager = db(db.managers.user_id == user['id']).select().first()
-        account_type = 'manager' if manager else 'customer'
+        # Check user type
+        account_type = 'manager' if manager_required.is_manager(user['id']) else 'customer'
         if account_type == 'manager':
             redirect(URL('reservations'))
         else:
@@ -79,17 +119,13 @@ def index():
 
 
 @action('customer')
-@action.uses('customer.html', auth.user)
+@action.uses(metrics, 'customer.html', auth.user)
 def customer():
     user = auth.get_user()    
-    print(f"DEBUG CUSTOMER: Current user: {user}")
-    print(f"DEBUG CUSTOMER: User ID: {user['id']}")
     
     customer = db(db.customers.user_id == user['id']).select().first()
-    print(f"DEBUG CUSTOMER: Found existing customer: {customer}")
     
     if not customer:
-        print("DEBUG CUSTOMER: Creating new customer...")
         customer_id = db.customers.insert(
             user_id=user['id'],
             name=f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
@@ -98,47 +134,23 @@ def customer():
             address=''
         )
         db.commit()
-        print(f"DEBUG CUSTOMER: Created customer with ID: {customer_id}")
-        
-        # Fetch the newly created customer
-        customer = db(db.customers.id == customer_id).select().first()
-        print(f"DEBUG CUSTOMER: Newly created customer: {customer}")
+        log.info("customer_created", user_id=user['id'], customer_id=customer_id)
     else:
-        print(f"DEBUG CUSTOMER: Found existing customer: {customer}")
+        log.debug("customer_found", user_id=user['id'], customer_id=customer.id)
     
     return dict()
 
 @action('api/reservations')
-@action.uses(db, auth.user)
+@action.uses(metrics, db, auth.user)
 def get_reservations():
     user = auth.get_user()
-    print(f"DEBUG: Current user: {user}")
-    print(f"DEBUG: User ID: {user['id']}")
     
     # find the matching customer id based on the user id
-    customer = db(db.customers.user_id == user['id']).select().first()
-    print(f"DEBUG: Found customer: {customer}")
-    
-    if customer:
-        print(f"DEBUG: Customer ID: {customer.id}")
-        print(f"DEBUG: Customer name: {customer.name}")
-        print(f"DEBUG: Customer email: {customer.email}")
-    
-    # Let's also check ALL customers to see what's in the database
-    all_customers = db(db.customers).select()
-    print(f"DEBUG: All customers in database:")
-    for c in all_customers:
-        print(f"  - ID: {c.id}, User ID: {c.user_id}, Name: {c.name}, Email: {c.email}")
-    
-    # Let's check ALL reservations
-    all_reservations = db(db.reservations).select()
-    print(f"DEBUG: All reservations in database:")
-    for r in all_reservations:
-        print(f"  - ID: {r.id}, Customer ID: {r.customer_id}, Room ID: {r.room_id}, Dates: {r.start_date} to {r.end_date}")
+    customer = db(db.customers.user_id == user['id']).select(db.customers.id).first()
 
     # return an empty list if no customer is found
     if not customer:
-        print("DEBUG: No customer found for current user!")
+        log.warning("customer_missing", user_id=user['id'])
         return dict(reservations=[])
     
     # retrieve all room information associated with the customer reservation
@@ -150,83 +162,57 @@ def get_reservations():
         left=db.rooms.on(db.rooms.id == db.reservations.room_id)
     )
     
-    print(f"DEBUG: Found {len(reservations)} reservations for customer {customer.id}")
-    for r in reservations:
-        print(f"  - Reservation: {r.reservations.id}, Room: {r.reservations.room_id}, Dates: {r.reservations.start_date} to {r.reservations.end_date}")
-    
-    print("RESERVATIONS", dict(reservations=[r.as_dict() for r in reservations]))
+    log.debug("reservations_listed", customer_id=customer.id, count=len(reservations))
     # return in JSON dictionary format
     return dict(reservations=[r.as_dict() for r in reservations])
 
 @action('api/customers')
-@action.uses(db, auth.user)
+@action.uses(metrics, db, auth.user)
 def get_customer_info():
     user = auth.get_user()
-    print(f"API: Current user: {user}")  # Debug print
     
     # get customer information for current user only
     customer = db(db.customers.user_id == user['id']).select().first()
-    print(f"API: Found customer: {customer}")  # Debug print
     
     if not customer:
-        print("API: No customer found!")  # Debug print
+        log.warning("customer_missing", user_id=user['id'])
         return dict(customers=[])
     
     return dict(customers=[customer.as_dict()])
 
 @action('manager/customers')
-@action.uses('layout_plain.html', 'manager-customers.html', auth.user)
+@action.uses(metrics, 'layout_plain.html', 'manager-customers.html', manager_page)
 def manager_customers():
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
     return dict()
 
 
 # get all the customers
 @action('api/manager/customers', method=['GET'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def get_all_customers():
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
-    """Get all customers, excluding managers"""
-
-    manager_user_ids = db(db.managers).select(db.managers.user_id)
-    manager_ids = [m.user_id for m in manager_user_ids]
-    
-    if manager_ids:
-        customers = db(
-            (db.customers.user_id != None) & 
-            (~db.customers.user_id.belongs(manager_ids))
-        ).select(orderby=db.customers.name)
-    else:
-        customers = db(db.customers).select(orderby=db.customers.name)
-    
-    return dict(customers=[c.as_dict() for c in customers])
+    """One page of customers ordered by name, excluding managers"""
+    managers = db(db.managers)._select(db.managers.user_id)
+    customers, next_cursor = page(
+        ~db.customers.user_id.belongs(managers),
+        [db.customers.name, db.customers.id],
+        request.query,
+    )
+    return dict(customers=[c.as_dict() for c in customers], next_cursor=next_cursor)
 
 # add a new cust
 @action('api/manager/customers', method=['POST'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def add_customer():
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
     """Add a new customer"""
+    from .customer_import import password_crypt
     data = request.json
     try:
-        # new account
+        # new account (requires[0] is IS_STRONG, which does not hash)
         user_id = db.auth_user.insert(
             email=data.get('email'),
             first_name=data.get('name', '').split()[0] if data.get('name') else '',
             last_name=' '.join(data.get('name', '').split()[1:]) if data.get('name') else '',
-            password=db.auth_user.password.requires[0]('defaultpassword')[0]  
+            password=str(password_crypt(db)('defaultpassword')[0])
         )
         
         # Create customer record
@@ -243,21 +229,54 @@ def add_customer():
         db.rollback()
         return dict(success=False, error=str(e))
 
+@action('api/manager/customers/import', method=['POST'])
+@action.uses(metrics, db, manager_required)
+def import_customers():
+    """
+    Create customers (and their accounts) in bulk, see customer_import.py.
+    Body: {"customers": [{name, email, phone_number, address, password}, ...],
+           "default_password": optional}
+    The request lasts as long as the import (the hashing runs in forkserver
+    workers, see invoices.pool); large guest lists belong to the command line
+    tool. It is not queued as a task: its inputs would keep the passwords in
+    task_run in clear
+    """
+    # imported here, customer_import is also run as a script (python -m)
+    from . import customer_import, room_import
+    data = request.json
+    records = data.get('customers') if isinstance(data, dict) else data
+    if not isinstance(records, list):
+        return dict(success=False, error="Expected a list of customers")
+    totals = customer_import.import_customers(
+        db,
+        (
+            (k, room_import.normalize(record, customer_import.ALIASES))
+            for k, record in enumerate(records, 1)
+        ),
+        processes=settings.IMPORT_PROCESSES,
+        default_password=data.get('default_password') if isinstance(data, dict) else None,
+    )
+    totals['errors'] = [dict(position=k, error=error) for k, error in totals['errors']]
+    return dict(success=not totals['invalid'], **totals)
+
 # del a customer
 @action('api/manager/customers/<customer_id:int>', method=['DELETE'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def delete_customer(customer_id):
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
     """Delete a customer and their user account"""
     try:
         #  search
         customer = db(db.customers.id == customer_id).select().first()
+        deleted = []
         if customer:
             # Delete all reservations for this customer
+            deleted = db(db.reservations.customer_id == customer_id).select(
+                db.reservations.id, db.reservations.room_id,
+                db.reservations.start_date, db.reservations.end_date,
+                db.reservations.total_cost
+            )
+            rollup.remove(db, deleted)
+            outbox.reservations_cancelled(db, [r.id for r in deleted])
             db(db.reservations.customer_id == customer_id).delete()
             # Delete the customer record
             db(db.customers.id == customer_id).delete()
@@ -265,99 +284,356 @@ def delete_customer(customer_id):
             if customer.user_id:
                 db(db.auth_user.id == customer.user_id).delete()
         db.commit()
+        reservation_removed(deleted)
         return dict(success=True)
     except Exception as e:
         db.rollback()
         return dict(success=False, error=str(e))
 
+# typeahead for the booking form and the customer pages
+@action('api/manager/customers/search', method=['GET'])
+@action.uses(metrics, db, manager_required)
+def search_customers():
+    """Ranked customer matches for ?q=, best first"""
+    try:
+        limit = min(int(request.query.get('limit') or 10), 50)
+    except ValueError:
+        limit = 10
+    customers = customer_search.lookup(db, request.query.get('q'), limit=limit)
+    return dict(customers=[
+        dict(id=c.id, name=c.name, email=c.email, phone_number=c.phone_number, address=c.address)
+        for c in customers
+    ])
+
 # specific customers reservations
 @action('api/manager/customers/<customer_id:int>/reservations', method=['GET'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def get_customer_reservations(customer_id):
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
-    reservations = db(db.reservations.customer_id == customer_id).select(
-        db.reservations.ALL,
-        orderby=~db.reservations.start_date
+    """One page of the reservations of a customer, latest first"""
+    reservations, next_cursor = page(
+        db.reservations.customer_id == customer_id,
+        [db.reservations.start_date, db.reservations.id],
+        request.query,
+        descending=True,
     )
-    return dict(reservations=[r.as_dict() for r in reservations])
+    return dict(reservations=[r.as_dict() for r in reservations], next_cursor=next_cursor)
 
 # delete a reservation
 @action('api/manager/reservations/<reservation_id:int>', method=['DELETE'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def delete_reservation(reservation_id):
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
     """Delete a reservation"""
     try:
+        deleted = db(db.reservations.id == reservation_id).select(
+            db.reservations.id, db.reservations.room_id,
+            db.reservations.start_date, db.reservations.end_date,
+            db.reservations.total_cost
+        )
+        rollup.remove(db, deleted)
+        outbox.reservations_cancelled(db, [reservation_id])
         db(db.reservations.id == reservation_id).delete()
         db.commit()
+        reservation_removed(deleted)
         return dict(success=True)
     except Exception as e:
         db.rollback()
         return dict(success=False, error=str(e))
 
+# revenue KPIs for the managers
+@action('api/manager/analytics', method=['GET'])
+@action.uses(metrics, db, manager_required)
+def get_analytics():
+    """
+    ADR, RevPAR, occupancy and pickup for [start, end) (default: the last 30
+    days), in total, by room, by bed count and by day. Optional room filter
+    (comma separated ids)
+    """
+    try:
+        rooms = request.query.get('room')
+        room_ids = [int(r) for r in rooms.split(',') if r.strip()] if rooms else None
+        report = analytics.report(
+            db, request.query.get('start'), request.query.get('end'), room_ids
+        )
+    except ValueError as e:
+        abort(400, "Invalid parameter: %s" % e)
+    return dict(success=True, **report)
+
+# invoices, rendered by the generate_invoices scheduler task
+@action('api/manager/invoices/generate', method=['POST'])
+@action.uses(metrics, db, manager_required)
+def generate_invoices():
+    """
+    Queue the missing invoices of the stays ending in [start, end) (all stays
+    when no range is given) and ask the scheduler for a run now
+    """
+    data = request.json or {}
+    query = ~db.reservations.id.belongs(db(db.invoices)._select(db.invoices.reservation_id))
+    try:
+        if data.get('start'):
+            query &= db.reservations.end_date >= to_date(data['start'])
+        if data.get('end'):
+            query &= db.reservations.end_date < to_date(data['end'])
+    except ValueError as e:
+        return dict(success=False, error="Invalid date: %s" % e)
+    reservation_ids = [r.id for r in db(query).select(db.reservations.id)]
+    invoices.enqueue(db, reservation_ids)
+    db.commit()
+    if scheduler:
+        scheduler.enqueue_run("generate_invoices", inputs={}, timeout=3600)
+    queued = db(db.invoices.status == 'queued').count()
+    return dict(success=True, added=len(reservation_ids), queued=queued, scheduled=bool(scheduler))
+
+@action('api/manager/invoices/<reservation_id:int>', method=['GET'])
+@action.uses(metrics, db, manager_required)
+def get_invoice(reservation_id):
+    """The rendered invoice of a reservation, ?format=pdf for the PDF"""
+    invoice = db(db.invoices.reservation_id == reservation_id).select().first()
+    if not invoice:
+        abort(404, "No invoice for this reservation")
+    if invoice.status != 'rendered':
+        return dict(success=False, status=invoice.status, error=invoice.error)
+    pdf = request.query.get('format') == 'pdf'
+    digest = invoice.pdf_hash if pdf else invoice.content_hash
+    if not digest:
+        abort(404, "No PDF rendering (reportlab is not installed)")
+    path = invoices.content_path(settings.UPLOAD_FOLDER, digest, 'pdf' if pdf else 'html')
+    with open(path, 'rb') as stream:
+        content = stream.read()
+    response.headers['Content-Type'] = 'application/pdf' if pdf else 'text/html; charset=utf-8'
+    response.headers['Content-Disposition'] = 'inline; filename="%s.%s"' % (
+        invoice.number, 'pdf' if pdf else 'html')
+    return content
+
+# email outbox
+@action('api/manager/outbox', method=['GET'])
+@action.uses(metrics, db, manager_required)
+def outbox_stats():
+    """Outbox messages by status and the send metrics of this process"""
+    return outbox.stats(db)
+
+# request metrics, Prometheus text exposition (see metrics.py)
+@action('metrics', method=['GET'])
+def get_metrics():
+    """Not instrumented itself; with settings.METRICS_TOKEN set, scrapers send it as a bearer token"""
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(
+        request.headers.get('Authorization') or '', 'Bearer %s' % token
+    ):
+        abort(401)
+    response.headers['Content-Type'] = METRICS_CONTENT_TYPE
+    response.headers['Cache-Control'] = 'no-store'
+    return metrics.exposition()
+
+# accounting export, streamed
+@action('api/manager/reservations/export', method=['GET'])
+@action.uses(metrics, db, manager_required)
+def export_reservations():
+    """
+    Stream the reservations, joined with their room and customer, as CSV
+    (?format=csv, the default) or NDJSON (?format=ndjson). Optional filters:
+    start/end (stays overlapping [start, end)) and room (comma separated ids)
+    """
+    fmt = request.query.get('format') or 'csv'
+    if fmt not in export.FORMATS:
+        abort(400, "format must be one of: %s" % ", ".join(export.FORMATS))
+    query = db.reservations.id > 0
+    try:
+        # the two halves of overlapping(start, end), either may be left open
+        start_date = request.query.get('start')
+        if start_date:
+            query &= db.reservations.end_date > to_date(start_date)
+        end_date = request.query.get('end')
+        if end_date:
+            query &= db.reservations.start_date < to_date(end_date)
+        rooms = request.query.get('room')
+        if rooms:
+            query &= db.reservations.room_id.belongs([int(r) for r in rooms.split(',') if r.strip()])
+    except ValueError as e:
+        abort(400, "Invalid filter: %s" % e)
+    log.info("reservations_exported", format=fmt, start=start_date, end=end_date, rooms=rooms)
+    response.headers['Content-Type'] = export.FORMATS[fmt]
+    response.headers['Content-Disposition'] = 'attachment; filename="reservations.%s"' % fmt
+    return export.stream(db, query, fmt)
+
 @action('api/rooms')
-@action.uses(db, auth.user)
+@action.uses(metrics, db, auth.user, ConditionalGet('rooms'))
 def get_all_rooms():
-    """API endpoint to get all rooms information for managers"""
-    rooms = db(db.rooms).select()
-    
-    rooms_data = []
-    for room in rooms:
-        room_dict = room.as_dict()
-        # can add URL here later for image, if wanted
-        if room_dict.get('image'):
-            room_dict['image_url'] = URL('download', room_dict['image'])
-        rooms_data.append(room_dict)
-    
-    return dict(rooms=rooms_data)
-
+    """API endpoint to get one page of rooms, by id, for managers"""
+    limit, cursor = request.query.get('limit'), request.query.get('cursor')
+    return room_catalog.get(db, ('page', limit, cursor), lambda: rooms_page(limit, cursor))
+
+
+def rooms_page(limit, cursor):
+    rooms, next_cursor = page(db.rooms.id > 0, [db.rooms.id], dict(limit=limit, cursor=cursor))
+    result = dict(rooms=[room_payload(room, URL) for room in rooms], next_cursor=next_cursor)
+    if not cursor:
+        # totals for the whole catalog, the client only holds the pages it loaded
+        price = db.rooms.price_per_night
+        count, avg, low, high = db.rooms.id.count(), price.avg(), price.min(), price.max()
+        row = db(db.rooms).select(count, avg, low, high).first()
+        result['summary'] = dict(
+            total=row[count],
+            avg_price=row[avg] or 0,
+            min_price=row[low] or 0,
+            max_price=row[high] or 0,
+        )
+    return result
+
+
+def amenity_filter(query):
+    """
+    Room ids matching the amenities (AND) and amenities_any (OR) parameters,
+    answered by the in-memory amenity index. None when neither is given
+    """
+    all_of = [a for a in (query.get('amenities') or '').split(',') if a.strip()]
+    any_of = [a for a in (query.get('amenities_any') or '').split(',') if a.strip()]
+    if not all_of and not any_of:
+        return None
+    return amenity_index.ensure_loaded(db).matching_room_ids(all_of, any_of)
+
+@action('api/amenities')
+@action.uses(metrics, db, auth.user)
+def get_amenities():
+    """Amenity catalog with the number of rooms offering each one"""
+    catalog = amenity_index.ensure_loaded(db).catalog()
+    return dict(amenities=[dict(name=name, rooms=count) for name, count in catalog])
+
+ROOM_SORTS = {
+    'id': db.rooms.id,
+    'price': db.rooms.price_per_night,
+    '-price': ~db.rooms.price_per_night,
+    'beds': db.rooms.number_of_beds,
+    '-beds': ~db.rooms.number_of_beds,
+}
 
 @action('api/rooms/available')
-@action.uses(db, auth.user)
+@action.uses(metrics, db, auth.user)
 def get_available_rooms():
-    """API endpoint to get available rooms for specific dates"""
+    """
+    API endpoint to get available rooms for specific dates.
+    Optional filters: beds, min_price, max_price, amenities (comma separated, all required),
+    amenities_any (comma separated, at least one), sort (id, price, -price, beds, -beds) and limit
+    """
     start_date = request.query.get('start_date')
     end_date = request.query.get('end_date')
     
     if not start_date or not end_date:
         return dict(error="start_date and end_date parameters required"), 400
     
-    # get all rooms
-    all_rooms = db(db.rooms).select()
+    from datetime import datetime
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except ValueError:
+        return dict(error="Dates must be in YYYY-MM-DD format"), 400
     
-    # find rooms that are NOT reserved during the specified period
-    reserved_room_ids = db(
-        (db.reservations.start_date <= end_date) & 
-        (db.reservations.end_date >= start_date)
-    ).select(db.reservations.room_id, distinct=True)
+    # every filter is part of the one query, so only matching rooms leave the database
+    query = free_rooms(start, end)
+    try:
+        if request.query.get('beds'):
+            query &= db.rooms.number_of_beds == int(request.query.get('beds'))
+        if request.query.get('min_price'):
+            query &= db.rooms.price_per_night >= float(request.query.get('min_price'))
+        if request.query.get('max_price'):
+            query &= db.rooms.price_per_night <= float(request.query.get('max_price'))
+        limit = int(request.query.get('limit') or 0)
+    except ValueError:
+        return dict(error="Invalid number format"), 400
+    room_ids = amenity_filter(request.query)
+    if room_ids is not None:
+        query &= db.rooms.id.belongs(room_ids)
     
-    reserved_ids = [r.room_id for r in reserved_room_ids]
+    orderby = ROOM_SORTS.get(request.query.get('sort') or 'id', db.rooms.id)
+    if orderby is not db.rooms.id:
+        orderby = orderby | db.rooms.id
+    
+    rooms = db(query).select(
+        orderby=orderby,
+        limitby=(0, limit) if limit > 0 else None
+    )
     
-    # filter out the already reserved rooms
     available_rooms = []
-    for room in all_rooms:
-        if room.id not in reserved_ids:
-            room_dict = room.as_dict()
-            #this isn't needed but option to display room photos for now here
-            if room_dict.get('image'):
-                room_dict['image_url'] = URL('download', room_dict['image'])
-            available_rooms.append(room_dict)
+    for room in rooms:
+        room_dict = room.as_dict()
+        #this isn't needed but option to display room photos for now here
+        if room_dict.get('image'):
+            room_dict['image_url'] = URL('download', room_dict['image'])
+            room_dict.update(images.urls(URL, room_dict['image']))
+        available_rooms.append(room_dict)
     
     return dict(
         available_rooms=available_rooms,
         date_range=dict(start_date=start_date, end_date=end_date)
     )
 
+@action('api/rooms/flexible')
+@action.uses(metrics, db, auth.user)
+def flexible_search():
+    """
+    Every (room, start_date) where a stay of `nights` nights fits between
+    start_date and end_date, e.g. any 3 nights in March for a 2-bed room.
+    Optional filters: beds, min_price, max_price, amenities, amenities_any, limit
+    """
+    from datetime import datetime, timedelta
+    try:
+        span_start = datetime.strptime(request.query.get('start_date') or '', '%Y-%m-%d').date()
+        span_end = datetime.strptime(request.query.get('end_date') or '', '%Y-%m-%d').date()
+        nights = int(request.query.get('nights') or 0)
+        limit = int(request.query.get('limit') or 500)
+    except ValueError:
+        return dict(success=False, error="start_date, end_date (YYYY-MM-DD) and nights parameters required")
+    
+    if nights <= 0:
+        return dict(success=False, error="nights must be at least 1")
+    if span_end <= span_start or (span_end - span_start).days > 366:
+        return dict(success=False, error="end_date must be after start_date and within a year")
+    
+    query = db.rooms.id > 0
+    try:
+        if request.query.get('beds'):
+            query &= db.rooms.number_of_beds == int(request.query.get('beds'))
+        if request.query.get('min_price'):
+            query &= db.rooms.price_per_night >= float(request.query.get('min_price'))
+        if request.query.get('max_price'):
+            query &= db.rooms.price_per_night <= float(request.query.get('max_price'))
+    except ValueError:
+        return dict(success=False, error="Invalid number format")
+    room_ids = amenity_filter(request.query)
+    if room_ids is not None:
+        query &= db.rooms.id.belongs(room_ids)
+    rooms = db(query).select(
+        db.rooms.id, db.rooms.number_of_beds, db.rooms.price_per_night, orderby=db.rooms.id
+    )
+    
+    # one sweep per room over the occupancy matrix, not one query per candidate date
+    free = occupancy.ensure_loaded(db).free_windows(
+        [room.id for room in rooms], span_start, span_end, nights
+    )
+    
+    windows = []
+    for room in rooms:
+        for offset in free[room.id]:
+            start = span_start + timedelta(days=offset)
+            windows.append(dict(
+                room_id=room.id,
+                beds=room.number_of_beds,
+                start_date=str(start),
+                end_date=str(start + timedelta(days=nights)),
+                nights=nights,
+                total_cost=float(room.price_per_night) * nights
+            ))
+    windows.sort(key=lambda w: (w['start_date'], w['total_cost'], w['room_id']))
+    
+    return dict(
+        success=True,
+        nights=nights,
+        date_range=dict(start_date=str(span_start), end_date=str(span_end)),
+        total=len(windows),
+        windows=windows[:limit]
+    )
+
 @action('reservations')
-@action.uses('reservations.html', auth.user, db)
+@action.uses(metrics, 'reservations.html', auth.user, db)
 def reservations():
     """Main reservations page with calendar and booking form"""
     user = auth.get_user()
@@ -377,12 +653,12 @@ def reservations():
         customer = db(db.customers.id == customer_id).select().first()
     
     # Get available rooms
-    rooms = db(db.rooms).select()
+    rooms = room_catalog.rooms(db, URL)
     
     return dict(customer=customer, rooms=rooms)
 
 @action('api/calendar/reservations')
-@action.uses(db, auth.user)
+@action.uses(metrics, db, auth.user, ConditionalGet('reservations', 'rooms', 'customers'))
 def calendar_reservations():
     """API endpoint to get reservation data for calendar display"""
     user = auth.get_user()
@@ -428,7 +704,7 @@ def calendar_reservations():
     return events  # Return events directly, not wrapped in dict
 
 @action('api/check-availability')
-@action.uses(db, auth.user)
+@action.uses(metrics, db, auth.user)
 def check_availability():
     """Check room availability for given dates"""
     room_id = request.query.get('room_id')
@@ -437,16 +713,15 @@ def check_availability():
     
     if not all([room_id, start_date, end_date]):
         return dict(available=False, error="Missing required parameters")
+    try:
+        room_id = int(room_id)
+        to_date(start_date), to_date(end_date)
+    except ValueError:
+        response.status = 400
+        return dict(available=False, error="room_id must be a number and dates YYYY-MM-DD")
     
     # Check for conflicting reservations
-    conflict = db(
-        (db.reservations.room_id == room_id) &
-        (
-            ((db.reservations.start_date <= start_date) & (db.reservations.end_date > start_date)) |
-            ((db.reservations.start_date < end_date) & (db.reservations.end_date >= end_date)) |
-            ((db.reservations.start_date >= start_date) & (db.reservations.end_date <= end_date))
-        )
-    ).select().first()
+    conflict = availability.ensure_loaded(db).conflict(room_id, start_date, end_date)
     
     available = conflict is None
     
@@ -466,15 +741,21 @@ def check_availability():
         nights=(datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days if available else 0
     )
 
+def find_customer(customer_identifier):
+    """
+    The customer to book for: the exact email or the exact name of a single
+    customer (customer_search.identify), never a prefix or fuzzy match
+    """
+    return customer_search.identify(db, customer_identifier)
+
 @action('api/make-reservation', method=['POST'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, auth.user)
 def make_reservation():
     """Create a new reservation with customer identification"""
     user = auth.get_user()
     data = request.json
     
-    # Debug logging
-    print(f"Received reservation data: {data}")
+    log.debug("reservation_requested", user_id=user['id'], data=lambda: data)
     
     try:
         # Validate required fields
@@ -485,22 +766,16 @@ def make_reservation():
                 missing_fields.append(field)
         
         if missing_fields:
-            print(f"Missing fields: {missing_fields}")
+            log.info("reservation_rejected", reason="missing_fields", fields=missing_fields)
             return dict(success=False, error=f"Missing required fields: {', '.join(missing_fields)}")
         
         customer_identifier = data['customer_identifier'].strip()
-        print(f"Looking for customer with identifier: '{customer_identifier}'")
-        
-        # Try to find existing customer by email first, then by name
-        customer = None
-        
-        # Check if identifier looks like an email
-        if '@' in customer_identifier:
-            customer = db(db.customers.email == customer_identifier).select().first()
+        log.debug("customer_lookup", identifier=customer_identifier)
         
-        # If not found by email, try to find by name
-        if not customer:
-            customer = db(db.customers.name.contains(customer_identifier)).select().first()
+        try:
+            customer = find_customer(customer_identifier)
+        except customer_search.AmbiguousCustomer as e:
+            return dict(success=False, error=str(e))
         
         # If customer not found, return error
         if not customer:
@@ -514,14 +789,7 @@ def make_reservation():
         start_date = data['start_date']
         end_date = data['end_date']
         
-        conflict = db(
-            (db.reservations.room_id == room_id) &
-            (
-                ((db.reservations.start_date <= start_date) & (db.reservations.end_date > start_date)) |
-                ((db.reservations.start_date < end_date) & (db.reservations.end_date >= end_date)) |
-                ((db.reservations.start_date >= start_date) & (db.reservations.end_date <= end_date))
-            )
-        ).select().first()
+        conflict = availability.ensure_loaded(db).conflict(room_id, start_date, end_date)
         
         if conflict:
             return dict(success=False, error="Room is not available for selected dates")
@@ -541,8 +809,8 @@ def make_reservation():
         
         total_cost = float(room.price_per_night) * nights
         
-        # Create reservation
-        reservation_id = db.reservations.insert(
+        # Create reservation, the coordinator re-checks the table under a room lock
+        leg = dict(
             room_id=room_id,
             customer_id=customer.id,
             start_date=start_date,
@@ -550,8 +818,19 @@ def make_reservation():
             notes=data.get('notes', ''),
             total_cost=total_cost
         )
-        
-        db.commit()
+        try:
+            # the rollup and the queued invoice commit together with the reservation,
+            # before the room lock is released
+            with booking.rooms([room_id]):
+                reservation_id, = booking.insert([leg])
+                rollup.add(db, [leg])
+                invoices.enqueue(db, [reservation_id])
+                outbox.reservations_confirmed(db, [reservation_id])
+        except RoomUnavailable:
+            return dict(success=False, error="Room is not available for selected dates")
+        reservation_added(reservation_id, room_id, start_date, end_date)
+        log.info("reservation_created", reservation_id=reservation_id, room_id=room_id,
+                 customer_id=customer.id, nights=nights)
         
         return dict(
             success=True, 
@@ -560,19 +839,118 @@ def make_reservation():
             customer_name=customer.name
         )
         
+    except Exception as e:
+        db.rollback()
+        log.error("reservation_failed", error=str(e))
+        return dict(success=False, error=str(e))
+
+@action('api/make-group-reservation', method=['POST'])
+@action.uses(metrics, db, auth.user)
+def make_group_reservation():
+    """
+    Book several rooms for one customer, all-or-nothing.
+    Expects {customer_identifier, legs: [{room_id, start_date, end_date, notes}]}
+    """
+    data = request.json or {}
+    
+    try:
+        legs = data.get('legs') or []
+        customer_identifier = (data.get('customer_identifier') or '').strip()
+        if not customer_identifier or not legs:
+            return dict(success=False, error="Missing required fields: customer_identifier, legs")
+        
+        try:
+            customer = find_customer(customer_identifier)
+        except customer_search.AmbiguousCustomer as e:
+            return dict(success=False, error=str(e))
+        if not customer:
+            return dict(
+                success=False, 
+                error=f"Customer not found with identifier '{customer_identifier}'. Please check the name or email and try again."
+            )
+        
+        # one query for all the rooms of the group
+        room_ids = set()
+        for leg in legs:
+            try:
+                room_ids.add(int(leg.get('room_id')))
+            except (TypeError, ValueError):
+                return dict(success=False, error="Every leg needs a valid room_id")
+        rooms = {r.id: r for r in db(db.rooms.id.belongs(room_ids)).select()}
+        
+        # validate every leg in one pass before touching the database
+        from datetime import datetime
+        index = availability.ensure_loaded(db)
+        rows = []
+        results = []
+        for k, leg in enumerate(legs):
+            room = rooms.get(int(leg['room_id']))
+            if not room:
+                return dict(success=False, leg=k, error=f"Room {leg['room_id']} not found")
+            try:
+                start = datetime.strptime(leg.get('start_date') or '', '%Y-%m-%d')
+                end = datetime.strptime(leg.get('end_date') or '', '%Y-%m-%d')
+            except ValueError:
+                return dict(success=False, leg=k, error="Dates must be in YYYY-MM-DD format")
+            nights = (end - start).days
+            if nights <= 0:
+                return dict(success=False, leg=k, error="End date must be after start date")
+            if index.conflict(room.id, leg['start_date'], leg['end_date']):
+                return dict(success=False, leg=k, error=f"Room {room.id} is not available for selected dates")
+            cost = float(room.price_per_night) * nights
+            rows.append(dict(
+                room_id=room.id,
+                customer_id=customer.id,
+                start_date=leg['start_date'],
+                end_date=leg['end_date'],
+                notes=leg.get('notes', data.get('notes', '')),
+                total_cost=cost
+            ))
+            results.append(dict(
+                room_id=room.id,
+                start_date=leg['start_date'],
+                end_date=leg['end_date'],
+                nights=nights,
+                cost=cost
+            ))
+        
+        # one locked transaction, one bulk insert, one commit
+        try:
+            with booking.rooms(room_ids):
+                reservation_ids = booking.insert(rows)
+                rollup.add(db, rows)
+                invoices.enqueue(db, reservation_ids)
+                outbox.reservations_confirmed(db, reservation_ids)
+        except RoomUnavailable as e:
+            return dict(success=False, error=f"Room {e.room_id} is not available for selected dates")
+        
+        for reservation_id, row in zip(reservation_ids, rows):
+            reservation_added(reservation_id, row['room_id'], row['start_date'], row['end_date'])
+            
+        for reservation_id, result in zip(reservation_ids, results):
+            result['reservation_id'] = reservation_id
+        
+        return dict(
+            success=True,
+            reservation_ids=reservation_ids,
+            legs=results,
+            total_cost=sum(r['cost'] for r in results),
+            customer_name=customer.name
+        )
+        
     except Exception as e:
         db.rollback()
         return dict(success=False, error=str(e))
 
 # Customer registration and reservation history
 @action('customer/register')
-@action.uses('customer-register.html', db)
+@action.uses(metrics, 'customer-register.html', db)
 def customer_register():
     """Simple customer registration page"""
     return dict()
 
 @action('api/customer/register', method=['POST'])
-@action.uses(db, auth, session)
+@action.uses(metrics, db, auth, session)
 def api_customer_register():
     data = request.json
 
@@ -614,12 +992,12 @@ def api_customer_register():
         return dict(success=False, error=str(e))
 
 @action('manager/register')
-@action.uses('manager-register.html', db)
+@action.uses(metrics, 'manager-register.html', db)
 def manager_register():
     return dict()
 
 @action('api/manager/register', method=['POST'])
-@action.uses(db, auth, session)
+@action.uses(metrics, db, auth, session)
 def api_manager_register():
     data = request.json or {}
     required = ['username', 'password', 'email', 'name', 'phone_number']
@@ -663,13 +1041,13 @@ def api_manager_register():
 
 
 @action('customer/history')
-@action.uses('customer-history.html', db)
+@action.uses(metrics, 'customer-history.html', db)
 def customer_history():
     """Customer reservation history lookup"""
     return dict()
 
 @action('api/customer/history', method=['POST'])
-@action.uses(db)
+@action.uses(metrics, db)
 def api_customer_history():
     """Get customer reservation history by email"""
     data = request.json
@@ -678,18 +1056,21 @@ def api_customer_history():
     if not email:
         return dict(success=False, error="Email is required")
     
+    customer = db(db.customers.email == email).select().first()
+    if not customer:
+        return dict(success=False, error="No customer found with this email")
+    
+    # outside the try: a bad cursor is a 400, not a success=False
+    reservations, next_cursor = page(
+        db.reservations.customer_id == customer.id,
+        [db.reservations.start_date, db.reservations.id],
+        data,
+        descending=True,
+        fields=[db.reservations.ALL, db.rooms.ALL],
+        left=db.rooms.on(db.rooms.id == db.reservations.room_id),
+    )
+    
     try:
-        customer = db(db.customers.email == email).select().first()
-        if not customer:
-            return dict(success=False, error="No customer found with this email")
-        
-        reservations = db(db.reservations.customer_id == customer.id).select(
-            db.reservations.ALL,
-            db.rooms.ALL,
-            left=db.rooms.on(db.rooms.id == db.reservations.room_id),
-            orderby=~db.reservations.start_date
-        )
-        
         reservation_list = []
         for r in reservations:
             reservation_list.append({
@@ -708,7 +1089,8 @@ def api_customer_history():
         return dict(
             success=True, 
             customer=customer.as_dict(),
-            reservations=reservation_list
+            reservations=reservation_list,
+            next_cursor=next_cursor
         )
         
     except Exception as e:
@@ -716,19 +1098,19 @@ def api_customer_history():
 
 # Room availability visualization
 @action('availability-chart')
-@action.uses('availability-chart.html', db)
+@action.uses(metrics, 'availability-chart.html', db)
 def availability_chart():
     """Simple room availability chart/calendar view"""
     # Get all rooms for the chart
-    rooms = db(db.rooms).select(orderby=db.rooms.id)
+    rooms = room_catalog.rooms(db, URL)
     return dict(rooms=rooms)
 
 @action('api/availability-data')
-@action.uses(db)
+@action.uses(metrics, db)
 def api_availability_data():
     """Get room availability data for visualization"""
-    start_date = request.vars.get('start_date')
-    end_date = request.vars.get('end_date')
+    start_date = request.query.get('start_date')
+    end_date = request.query.get('end_date')
     
     # Default to next 30 days if no dates provided
     if not start_date or not end_date:
@@ -740,13 +1122,12 @@ def api_availability_data():
     
     try:
         # Get all rooms
-        rooms = db(db.rooms).select(orderby=db.rooms.id)
+        rooms = room_catalog.rooms(db, URL)
         
-        # Get reservations in date range
-        reservations = db(
-            (db.reservations.start_date <= end_date) & 
-            (db.reservations.end_date >= start_date)
-        ).select(
+        # Get reservations in date range (the chart shows end_date inclusive)
+        from datetime import datetime, timedelta
+        window_end = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
+        reservations = db(overlapping(start_date, window_end)).select(
             db.reservations.room_id,
             db.reservations.start_date,
             db.reservations.end_date,
@@ -754,30 +1135,39 @@ def api_availability_data():
             left=db.customers.on(db.customers.id == db.reservations.customer_id)
         )
         
+        # Group reservations by room in a single pass
+        by_room = {}
+        for res in reservations:
+            by_room.setdefault(res.reservations.room_id, []).append({
+                'start': str(res.reservations.start_date),
+                'end': str(res.reservations.end_date),
+                'customer': res.customers.name if res.customers else 'Unknown'
+            })
+        
+        # Per-day flags and counts come from the occupancy matrix
+        chart = occupancy.ensure_loaded(db).chart(
+            [room.id for room in rooms], start_date, window_end
+        )
+        
         # Format data for chart
         room_data = []
         for room in rooms:
-            room_reservations = []
-            for res in reservations:
-                if res.reservations.room_id == room.id:
-                    room_reservations.append({
-                        'start': str(res.reservations.start_date),
-                        'end': str(res.reservations.end_date),
-                        'customer': res.customers.name if res.customers else 'Unknown'
-                    })
-            
             room_data.append({
                 'id': room.id,
                 'beds': room.number_of_beds,
                 'price': float(room.price_per_night),
                 'amenities': room.amenities,
-                'reservations': room_reservations
+                'reservations': by_room.get(room.id, []),
+                'occupied': chart['occupied'][room.id]
             })
         
         return dict(
             success=True,
             start_date=start_date,
             end_date=end_date,
+            dates=chart['dates'],
+            daily_occupancy=chart['daily_occupancy'],
+            booked_slots=chart['booked_slots'],
             rooms=room_data
         )
         
@@ -787,51 +1177,27 @@ def api_availability_data():
 
 
 @action('manager/rooms')
-@action.uses('manager-rooms.html', auth.user, db)
+@action.uses(metrics, 'manager-rooms.html', manager_page, db)
 def manager_rooms():
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index'))
     return dict()
 
 
 #room addition
 @action('api/manager/rooms', method=['POST'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def add_room():
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
     """Add a new room"""
+    # imported here, room_import is also run as a script (python -m)
+    from . import room_import
     data = request.json
     try:
-        required_fields = ['number_of_beds', 'amenities', 'price_per_night']
-        for field in required_fields:
-            if not data.get(field):
-                return dict(success=False, error=f"Missing required field: {field}")
-        
-        #validators
         try:
-            beds = int(data['number_of_beds'])
-            price = float(data['price_per_night'])
-        except ValueError:
-            return dict(success=False, error="Invalid number format")
+            values = room_import.clean_room(data)
+        except room_import.InvalidRoom as e:
+            return dict(success=False, error=str(e))
         
-        if beds < 1 or beds > 5:
-            return dict(success=False, error="Number of beds must be between 1 and 5")
-        
-        if price <= 0:
-            return dict(success=False, error="Price must be greater than 0")
-        
-        room_id = db.rooms.insert(
-            number_of_beds=beds,
-            amenities=data['amenities'].strip(),
-            price_per_night=price
-        )
+        room_id = db.rooms.insert(**values)
+        sync_room(db, room_id, values['amenities'])
         
         db.commit()
         return dict(success=True, id=room_id, message="Room added successfully")
@@ -842,13 +1208,8 @@ def add_room():
 
 # edits to a room
 @action('api/manager/rooms/<room_id:int>', method=['PUT'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def update_room(room_id):
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
     """Update a room"""
     data = request.json
     try:
@@ -894,6 +1255,8 @@ def update_room(room_id):
         
         if update_data:
             db(db.rooms.id == room_id).update(**update_data)
+            if 'amenities' in update_data:
+                sync_room(db, room_id, update_data['amenities'])
             db.commit()
         
         return dict(success=True, message="Room updated successfully")
@@ -904,13 +1267,8 @@ def update_room(room_id):
 
 # get rid of a room
 @action('api/manager/rooms/<room_id:int>', method=['DELETE'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def delete_room(room_id):
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
     """Delete a room"""
     try:
         room = db(db.rooms.id == room_id).select().first()
@@ -921,6 +1279,7 @@ def delete_room(room_id):
         if reservations_count > 0:
             return dict(success=False, error="Cannot delete room with existing reservations")
         
+        db(db.room_amenities.room_id == room_id).delete()
         db(db.rooms.id == room_id).delete()
         db.commit()
         
@@ -930,23 +1289,44 @@ def delete_room(room_id):
         db.rollback()
         return dict(success=False, error=str(e))
 
+@action('api/manager/rooms/import', method=['POST'])
+@action.uses(metrics, db, manager_required)
+def import_rooms():
+    """
+    Insert or update (by code) rooms in bulk, see room_import.py.
+    Body: {"rooms": [{code, number_of_beds, amenities, price_per_night}, ...]}
+    """
+    from . import room_import
+    data = request.json
+    records = data.get('rooms') if isinstance(data, dict) else data
+    if not isinstance(records, list):
+        return dict(success=False, error="Expected a list of rooms")
+    totals = room_import.import_rooms(
+        db, ((k, room_import.normalize(record)) for k, record in enumerate(records, 1))
+    )
+    totals['errors'] = [dict(position=k, error=error) for k, error in totals['errors']]
+    return dict(success=not totals['invalid'], **totals)
+
+@action('api/manager/rooms/cache', method=['GET'])
+@action.uses(metrics, db, manager_required)
+def room_cache_stats():
+    """Hit and miss counters of the room catalog cache"""
+    return room_catalog.stats()
+
 @action('api/manager/rooms/<room_id:int>/reservations', method=['GET'])
-@action.uses(db, auth.user)
+@action.uses(metrics, db, manager_required)
 def get_room_reservations(room_id):
-    user = auth.get_user()
-    manager = db(db.managers.user_id == user['id']).select().first()
-    if not manager:
-        print('redirect works')
-        redirect(URL('index')) 
-    """Get all reservations for a specific room"""
+    """Get one page of the reservations of a room, by check-in date"""
+    # outside the try: a bad cursor is a 400, not a success=False
+    reservations, next_cursor = page(
+        db.reservations.room_id == room_id,
+        [db.reservations.start_date, db.reservations.id],
+        request.query,
+        fields=[db.reservations.ALL, db.customers.name],
+        left=db.customers.on(db.customers.id == db.reservations.customer_id),
+    )
+    
     try:
-        reservations = db(db.reservations.room_id == room_id).select(
-            db.reservations.ALL,
-            db.customers.name,
-            left=db.customers.on(db.customers.id == db.reservations.customer_id),
-            orderby=db.reservations.start_date
-        )
-        
         reservation_list = []
         for r in reservations:
             reservation_list.append({
@@ -958,7 +1338,7 @@ def get_room_reservations(room_id):
                 'notes': r.reservations.notes or ''
             })
         
-        return dict(success=True, reservations=reservation_list)
+        return dict(success=True, reservations=reservation_list, next_cursor=next_cursor)
         
     except Exception as e:
         return dict(success=False, error=str(e))
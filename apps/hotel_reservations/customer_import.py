@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Bulk import of customers (a guest list) from CSV or JSON
+
+Run it from the folder that contains apps/, against the app's database:
+
+    python -m apps.hotel_reservations.customer_import guests.csv
+    python -m apps.hotel_reservations.customer_import guests.ndjson --processes 8
+    python -m apps.hotel_reservations.customer_import guests.csv --default-password welcome
+
+Every record has name and email, optionally phone_number (or phone), address
+and password. Each one becomes an auth_user account and its db.customers row,
+like add_customer. A record is skipped when its email already belongs to an
+account or a customer, or appeared earlier in the import (compared ignoring
+case); emails are stored lowercase. Records without a password get
+default_password or, when there is none, a random one: those guests set
+theirs with the reset password link.
+
+Hashing the passwords (the CRYPT validator of auth_user.password) is the
+expensive part, so it runs in a process pool over all the cores, a chunk
+ahead of the main process, which inserts the previous chunk (a bulk_insert
+into auth_user, one into customers, one commit) meanwhile.
+"""
+
+import argparse
+import itertools
+import os
+import secrets
+import time
+
+from pydal.validators import CRYPT
+
+from .cli import boot
+from .invoices import pool
+from .room_import import read_records
+
+CHUNK_SIZE = 2000
+ALIASES = dict(phone="phone_number", full_name="name", email_address="email")
+
+
+class InvalidCustomer(ValueError):
+    pass
+
+
+def password_crypt(db):
+    """The CRYPT validator of auth_user.password (requires starts with IS_STRONG)"""
+    requires = db.auth_user.password.requires
+    for validator in requires if isinstance(requires, (list, tuple)) else [requires]:
+        if isinstance(validator, CRYPT):
+            return validator
+    return CRYPT()
+
+
+def hash_passwords(crypt, passwords):
+    """Runs in a worker process"""
+    return [str(crypt(password)[0]) for password in passwords]
+
+
+def clean_customer(db, data):
+    """The auth_user and customers values of a record, checked with the model's validators"""
+    if not isinstance(data, dict):
+        raise InvalidCustomer("Not a customer record")
+    values = dict(
+        name=" ".join(str(data.get("name") or "").split()),
+        email=str(data.get("email") or "").strip().lower(),
+        phone_number=str(data.get("phone_number") or "").strip(),
+        address=str(data.get("address") or "").strip(),
+    )
+    for field in ("name", "email", "phone_number"):
+        if field == "phone_number" and not values[field]:
+            continue
+        error = db.customers[field].validate(values[field])[1]
+        if error:
+            raise InvalidCustomer("%s: %s" % (field, error))
+    values["password"] = str(data.get("password") or "")
+    return values
+
+
+def prepare(db, chunk, seen, default_password=None):
+    """Clean and deduplicate a chunk of (line, record), returns (customers, stats)"""
+    stats = dict(invalid=0, duplicates=0, existing=0, errors=[])
+    customers = []
+    for line, record in chunk:
+        try:
+            values = clean_customer(db, record)
+        except InvalidCustomer as e:
+            stats["invalid"] += 1
+            stats["errors"].append((line, str(e)))
+            continue
+        if values["email"] in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(values["email"])
+        values["password"] = values["password"] or default_password or secrets.token_urlsafe(16)
+        customers.append(values)
+    if customers:
+        # the emails stored before the import may be mixed case
+        emails = [c["email"] for c in customers]
+        taken = {
+            (row.email or "").lower()
+            for row in db(db.auth_user.email.lower().belongs(emails)).select(db.auth_user.email)
+        } | {
+            (row.email or "").lower()
+            for row in db(db.customers.email.lower().belongs(emails)).select(db.customers.email)
+        }
+        if taken:
+            stats["existing"] = sum(1 for c in customers if c["email"] in taken)
+            customers = [c for c in customers if c["email"] not in taken]
+    return customers, stats
+
+
+def insert(db, customers, hashes):
+    """Insert the accounts and the customers, in the caller's transaction"""
+    user_ids = db.auth_user.bulk_insert([
+        dict(
+            email=c["email"],
+            first_name=c["name"].split()[0] if c["name"] else "",
+            last_name=" ".join(c["name"].split()[1:]),
+            password=hashed,
+        )
+        for c, hashed in zip(customers, hashes)
+    ])
+    db.customers.bulk_insert([
+        dict(
+            user_id=user_id,
+            name=c["name"],
+            email=c["email"],
+            phone_number=c["phone_number"],
+            address=c["address"],
+        )
+        for c, user_id in zip(customers, user_ids)
+    ])
+
+
+def import_customers(db, records, chunk_size=CHUNK_SIZE, processes=None,
+                     default_password=None, progress=None):
+    """
+    Import (line, record) pairs in chunks, each chunk hashed in the pool
+    while the previous one is inserted and committed. progress(totals) is
+    called after every chunk. Returns the totals
+    """
+    totals = dict(records=0, inserted=0, invalid=0, duplicates=0, existing=0, errors=[],
+                  chunks=0, elapsed=0.0, rows_per_sec=0.0)
+    crypt = password_crypt(db)
+    workers = processes or os.cpu_count() or 1
+    seen = set()
+    t0 = time.time()
+
+    def done(pending):
+        customers, futures, stats, size = pending
+        hashes = [hashed for future in futures for hashed in future.result()]
+        try:
+            if customers:
+                insert(db, customers, hashes)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        totals["records"] += size
+        totals["inserted"] += len(customers)
+        totals["chunks"] += 1
+        for key in ("invalid", "duplicates", "existing"):
+            totals[key] += stats[key]
+        totals["errors"].extend(stats["errors"])
+        totals["elapsed"] = time.time() - t0
+        totals["rows_per_sec"] = totals["records"] / totals["elapsed"] if totals["elapsed"] else 0.0
+        if progress:
+            progress(totals)
+
+    records = iter(records)
+    pending = None
+    with pool(workers) as executor:
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            customers, stats = prepare(db, chunk, seen, default_password)
+            passwords = [c.pop("password") for c in customers]
+            size = -(-len(passwords) // workers) or 1
+            futures = [
+                executor.submit(hash_passwords, crypt, passwords[k : k + size])
+                for k in range(0, len(passwords), size)
+            ]
+            if pending:
+                done(pending)
+            pending = (customers, futures, stats, len(chunk))
+        if pending:
+            done(pending)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("path", help="CSV, JSON or NDJSON file")
+    parser.add_argument("--format", choices=["csv", "json", "ndjson"], default=None,
+                        help="file format (default: from the extension)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="records per transaction")
+    parser.add_argument("--processes", type=int, default=None, help="hashing processes (default: cores)")
+    parser.add_argument("--default-password", default=None,
+                        help="password of the records without one (default: random)")
+    parser.add_argument("--max-errors", type=int, default=20, help="invalid records to list")
+    args = parser.parse_args()
+
+    boot()
+    from .models import db
+
+    def progress(totals):
+        print(f"chunk {totals['chunks']}: {totals['records']} records,"
+              f" {totals['inserted']} inserted, {totals['rows_per_sec']:.0f} rows/sec")
+
+    totals = import_customers(
+        db,
+        read_records(args.path, args.format, "customers", ALIASES),
+        args.chunk_size,
+        args.processes,
+        args.default_password,
+        progress,
+    )
+    print(f"records:    {totals['records']}")
+    print(f"inserted:   {totals['inserted']}")
+    print(f"existing:   {totals['existing']}")
+    print(f"duplicates: {totals['duplicates']}")
+    print(f"invalid:    {totals['invalid']}")
+    print(f"elapsed:    {totals['elapsed']:.2f}s")
+    print(f"rows/sec:   {totals['rows_per_sec']:.1f}")
+    for line, error in totals["errors"][: args.max_errors]:
+        print(f"  line {line}: {error}")
+    if len(totals["errors"]) > args.max_errors:
+        print(f"  ... and {len(totals['errors']) - args.max_errors} more")
+    db.close()
+    return 1 if totals["invalid"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,201 @@
+"""
+This file defines the customer search index and the ranked customer lookup
+
+On SQLite the customers names and emails are mirrored into an FTS5 table
+(customers_fts, an external-content index kept in sync by triggers); on
+PostgreSQL the names get a pg_trgm GIN index plus a lower(name) prefix index.
+Other databases fall back to LIKE.
+
+lookup() ranks candidates in three tiers and stops as soon as it has enough:
+
+1. exact email (case insensitive)
+2. name prefix ("jo" -> "John Smith", "john sm" -> "John Smith")
+3. fuzzy: every word of the identifier starts a word of the name or email
+   (SQLite, ordered by bm25) or trigram similarity (PostgreSQL)
+
+Those tiers are for the typeahead. A booking is made for identify(), which
+only accepts the exact email or the exact name of a single customer, so a
+typo or an unknown email never books (and bills) somebody else.
+"""
+
+import re
+
+FTS_TABLE = "customers_fts"
+
+
+class AmbiguousCustomer(ValueError):
+    """Raised by identify() when the identifier matches more than one customer"""
+
+
+def search_backend(db):
+    """'fts5', 'trigram' or 'like', decided once create_search_index has run"""
+    return getattr(db, "_customer_search_backend", "like")
+
+
+def create_search_index(db):
+    """Create the search structures idempotently, safe to call on every start"""
+    backend = "like"
+    try:
+        # 'sqlite:memory' for an in-memory database
+        dbname = db._dbname.split(":")[0]
+        if dbname == "sqlite":
+            exists = db.executesql(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='%s';" % FTS_TABLE
+            )
+            db.executesql(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+                "name, email, content='customers', content_rowid='id',"
+                " tokenize='unicode61 remove_diacritics 2');" % FTS_TABLE
+            )
+            db.executesql(
+                "CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers BEGIN"
+                " INSERT INTO %(t)s(rowid, name, email) VALUES (new.id, new.name, new.email);"
+                " END;" % dict(t=FTS_TABLE)
+            )
+            db.executesql(
+                "CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers BEGIN"
+                " INSERT INTO %(t)s(%(t)s, rowid, name, email)"
+                " VALUES ('delete', old.id, old.name, old.email);"
+                " END;" % dict(t=FTS_TABLE)
+            )
+            db.executesql(
+                "CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE ON customers BEGIN"
+                " INSERT INTO %(t)s(%(t)s, rowid, name, email)"
+                " VALUES ('delete', old.id, old.name, old.email);"
+                " INSERT INTO %(t)s(rowid, name, email) VALUES (new.id, new.name, new.email);"
+                " END;" % dict(t=FTS_TABLE)
+            )
+            if not exists:
+                # first run: index the customers that are already there
+                db.executesql("INSERT INTO %(t)s(%(t)s) VALUES ('rebuild');" % dict(t=FTS_TABLE))
+            backend = "fts5"
+        elif dbname == "postgres":
+            db.executesql("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+            db.executesql(
+                "CREATE INDEX IF NOT EXISTS customers_name_trgm_idx"
+                " ON customers USING gin (name gin_trgm_ops);"
+            )
+            db.executesql(
+                "CREATE INDEX IF NOT EXISTS customers_name_prefix_idx"
+                " ON customers (lower(name) text_pattern_ops);"
+            )
+            backend = "trigram"
+        db.commit()
+    except Exception:
+        # e.g. SQLite built without FTS5 or no permission to create pg_trgm
+        db.rollback()
+    db._customer_search_backend = backend
+    return backend
+
+
+def words(identifier):
+    return re.findall(r"\w+", identifier.lower())
+
+
+def fts_phrase(tokens):
+    return '"%s"' % " ".join(tokens)
+
+
+def ranked_rows(db, ids):
+    """The customers rows of ids, in the order of ids"""
+    if not ids:
+        return []
+    rows = {row.id: row for row in db(db.customers.id.belongs(ids)).select()}
+    return [rows[i] for i in ids if i in rows]
+
+
+def identify(db, identifier):
+    """
+    The customer an identifier designates, or None: the exact email (case
+    insensitive) when it contains '@', else the exact name (case insensitive).
+    Raises AmbiguousCustomer when that is more than one customer
+    """
+    identifier = " ".join((identifier or "").split())
+    if not identifier:
+        return None
+    if "@" in identifier:
+        # the exact spelling first, served by the unique index on customers.email
+        rows = db(db.customers.email == identifier).select(limitby=(0, 1))
+        query = db.customers.email.lower() == identifier.lower()
+    else:
+        rows = None
+        query = db.customers.name.lower() == identifier.lower()
+    if not rows:
+        # a search of customers_lower_email_idx or customers_lower_name_idx (models.py)
+        rows = db(query).select(orderby=db.customers.id, limitby=(0, 2))
+    if len(rows) > 1:
+        raise AmbiguousCustomer(
+            "More than one customer matches '%s', use their email instead" % identifier
+        )
+    return rows.first() if rows else None
+
+
+def lookup(db, identifier, limit=10):
+    """Customers matching identifier, best match first"""
+    identifier = (identifier or "").strip()
+    if not identifier:
+        return []
+    backend = search_backend(db)
+    found = []
+    seen = set()
+
+    def take(rows):
+        for row in rows:
+            if row.id not in seen and len(found) < limit:
+                seen.add(row.id)
+                found.append(row)
+
+    # 1. exact email, served by the unique index on customers.email
+    if "@" in identifier:
+        take(db(db.customers.email == identifier).select(limitby=(0, 1)))
+        if not found:
+            take(db(db.customers.email.lower() == identifier.lower()).select(limitby=(0, 1)))
+    if len(found) >= limit:
+        return found
+
+    tokens = words(identifier)
+    if not tokens:
+        return found
+
+    if backend == "fts5":
+        # 2. name prefix: the phrase anchored at the first word of the name
+        prefix = "name : ^ %s *" % fts_phrase(tokens)
+        # 3. fuzzy: every word is the prefix of some word of name or email
+        fuzzy = " AND ".join("%s *" % fts_phrase([t]) for t in tokens)
+        for match in (prefix, fuzzy):
+            ids = [
+                r[0]
+                for r in db.executesql(
+                    "SELECT rowid FROM %s WHERE %s MATCH %s ORDER BY bm25(%s) LIMIT %d;"
+                    % (FTS_TABLE, FTS_TABLE, db._adapter.adapt(match), FTS_TABLE, limit)
+                )
+            ]
+            take(ranked_rows(db, ids))
+            if len(found) >= limit:
+                break
+    elif backend == "trigram":
+        text = " ".join(tokens)
+        take(
+            db(db.customers.name.lower().startswith(text)).select(
+                orderby=db.customers.name, limitby=(0, limit)
+            )
+        )
+        if len(found) < limit:
+            quoted = db._adapter.adapt(text)
+            ids = [
+                r[0]
+                for r in db.executesql(
+                    "SELECT id FROM customers WHERE name %% %s"
+                    " ORDER BY similarity(name, %s) DESC LIMIT %d;" % (quoted, quoted, limit)
+                )
+            ]
+            take(ranked_rows(db, ids))
+    else:
+        take(
+            db(db.customers.name.lower().startswith(" ".join(tokens))).select(
+                orderby=db.customers.name, limitby=(0, limit)
+            )
+        )
+        if len(found) < limit:
+            take(db(db.customers.name.contains(identifier)).select(limitby=(0, limit)))
+    return found
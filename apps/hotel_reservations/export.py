@@ -0,0 +1,131 @@
+"""
+This file defines the streaming reservations export (CSV or NDJSON)
+
+The export is a generator: rows are read in chunks of CHUNK_SIZE ordered by
+reservation id, each chunk continuing after the last id of the previous one
+(a keyset walk, the portable equivalent of a server-side cursor: the drivers
+pydal uses buffer a whole result set on the client), formatted and yielded
+before the next chunk is read. Memory stays bounded by one chunk whatever
+the size of the table, and the server sends the body with chunked transfer
+encoding as it is produced.
+
+The rows are plain tuples from executesql, there is no Row object per
+reservation.
+"""
+
+import csv
+import io
+import json
+
+from .availability import to_date
+
+CHUNK_SIZE = 1000
+
+COLUMNS = [
+    "reservation_id",
+    "room_id",
+    "room_beds",
+    "room_price_per_night",
+    "customer_id",
+    "customer_name",
+    "customer_email",
+    "start_date",
+    "end_date",
+    "nights",
+    "total_cost",
+    "notes",
+    "created_on",
+]
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def fields(db):
+    """The selected fields, in the order of COLUMNS up to nights"""
+    return [
+        db.reservations.id,
+        db.reservations.room_id,
+        db.rooms.number_of_beds,
+        db.rooms.price_per_night,
+        db.reservations.customer_id,
+        db.customers.name,
+        db.customers.email,
+        db.reservations.start_date,
+        db.reservations.end_date,
+        db.reservations.total_cost,
+        db.reservations.notes,
+        db.reservations.created_on,
+    ]
+
+
+def records(db, query, chunk_size=CHUNK_SIZE):
+    """Yield lists of export records, one list per chunk, in reservation id order"""
+    left = [
+        db.rooms.on(db.rooms.id == db.reservations.room_id),
+        db.customers.on(db.customers.id == db.reservations.customer_id),
+    ]
+    last_id = 0
+    while True:
+        sql = db(query & (db.reservations.id > last_id))._select(
+            *fields(db),
+            left=left,
+            orderby=db.reservations.id,
+            limitby=(0, chunk_size),
+            orderby_on_limitby=False,
+        )
+        chunk = db.executesql(sql)
+        if not chunk:
+            return
+        yield [record(row) for row in chunk]
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def record(row):
+    (res_id, room_id, beds, price, customer_id, name, email,
+     start_date, end_date, total_cost, notes, created_on) = row
+    nights = (to_date(end_date) - to_date(start_date)).days
+    return [
+        res_id, room_id, beds, price, customer_id, name, email,
+        str(start_date), str(end_date), nights, total_cost, notes,
+        str(created_on) if created_on else None,
+    ]
+
+
+def csv_lines(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf8")
+
+
+def ndjson_lines(chunks):
+    for chunk in chunks:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, values)), default=str) + "\n" for values in chunk
+        ).encode("utf8")
+
+
+def stream(db, query, format="csv", chunk_size=CHUNK_SIZE):
+    """
+    The export body as a generator of bytes. The action returns it and the
+    server consumes it after the db fixture has already given its connection
+    back, so the generator takes a connection of its own while it runs
+    """
+    lines = csv_lines if format == "csv" else ndjson_lines
+    db.get_connection_from_pool_or_new()
+    try:
+        for data in lines(records(db, query, chunk_size)):
+            yield data
+    finally:
+        db.recycle_connection_in_pool_or_close("rollback")
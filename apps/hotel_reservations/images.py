@@ -0,0 +1,158 @@
+"""
+This file defines the room image variants
+
+The room cards only need a small picture, but db.rooms.image holds the
+photo as uploaded, often several megabytes. serve() returns a fixed-size
+variant of the upload instead (VARIANTS, cropped to fill), as WebP when the
+browser accepts it and JPEG otherwise.
+
+A variant is rendered on its first request and written to
+UPLOAD_FOLDER/images/<key[:2]>/<key>.<format>, where key hashes the content
+of the original, the variant, the format and VERSION: the same photo
+uploaded twice shares its variants, and changing the resizing (bump VERSION)
+never serves a stale file. Uploaded file names are never reused, so the
+responses are immutable: they carry the key as a strong ETag and
+Cache-Control: immutable, and bottle's static_file answers Range requests.
+
+Pillow is optional: without it serve() returns None and the caller sends
+the original.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from functools import lru_cache
+
+from pydal.helpers.regex import REGEX_UPLOAD_PATTERN
+
+from py4web import HTTP, request
+from py4web.core import bottle
+
+VERSION = 1
+SUBFOLDER = "images"
+VARIANTS = dict(
+    thumb=(160, 120),
+    card=(480, 360),
+)
+FORMATS = dict(
+    webp=("image/webp", dict(quality=80, method=4)),
+    jpeg=("image/jpeg", dict(quality=82, optimize=True, progressive=True)),
+)
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+locks = {}
+locks_lock = threading.Lock()
+
+
+def urls(url, filename):
+    """The variant links of an upload, by variant name"""
+    return {"%s_url" % name: url("images", name, filename) for name in VARIANTS}
+
+
+@lru_cache(maxsize=1024)
+def source_digest(path, mtime, size):
+    """sha256 of a file, computed once per (path, mtime, size)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_key(digest, name, format):
+    width, height = VARIANTS[name]
+    text = "%s:%s:%s:%dx%d:%s" % (VERSION, digest, name, width, height, format)
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+def variant_path(key, format):
+    return os.path.join(SUBFOLDER, key[:2], "%s.%s" % (key, format))
+
+
+def preferred_format(accept):
+    return "webp" if "image/webp" in (accept or "") else "jpeg"
+
+
+def render(source, size, format):
+    """Resize the image at source to fill size, as bytes of format (None without Pillow)"""
+    try:
+        from io import BytesIO
+
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    with Image.open(source) as image:
+        # JPEG decodes at 1/2, 1/4 or 1/8 scale when that is still large enough
+        image.draft("RGB", (size[0] * 2, size[1] * 2))
+        image = ImageOps.exif_transpose(image)
+        if format == "jpeg" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, format.upper(), **FORMATS[format][1])
+    return buffer.getvalue()
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+    with open(tmp, "wb") as stream:
+        stream.write(content)
+    os.replace(tmp, path)
+
+
+def variant(folder, source, name, format):
+    """
+    (key, path relative to folder) of a variant of the file at source,
+    rendered on the first call; None without Pillow
+    """
+    stat = os.stat(source)
+    key = variant_key(source_digest(source, stat.st_mtime, stat.st_size), name, format)
+    path = variant_path(key, format)
+    fullpath = os.path.join(folder, path)
+    if not os.path.exists(fullpath):
+        with locks_lock:
+            lock = locks.setdefault(key, threading.Lock())
+        # concurrent first requests render the variant once
+        with lock:
+            if not os.path.exists(fullpath):
+                content = render(source, VARIANTS[name], format)
+                if content is None:
+                    return None
+                write(fullpath, content)
+        with locks_lock:
+            locks.pop(key, None)
+    return key, path
+
+
+def serve(db, folder, name, filename):
+    """The response for a variant of a room image, None when it cannot be rendered"""
+    items = re.match(REGEX_UPLOAD_PATTERN, filename)
+    if (
+        name not in VARIANTS
+        or not items
+        or (items.group("table"), items.group("field")) != ("rooms", "image")
+    ):
+        raise HTTP(404)
+    folder = db.rooms.image.uploadfolder or folder
+    source = os.path.join(folder, filename)
+    if not os.path.isfile(source):
+        raise HTTP(404)
+    format = preferred_format(request.headers.get("Accept"))
+    try:
+        found = variant(folder, source, name, format)
+    except (OSError, ValueError):
+        # not an image Pillow can read
+        return None
+    if not found:
+        return None
+    key, path = found
+    etag = '"%s"' % key
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Vary": "Accept"}
+    if etag in [tag.strip() for tag in (request.headers.get("If-None-Match") or "").split(",")]:
+        raise HTTP(304, headers=headers)
+    response = bottle.static_file(path, root=folder, mimetype=FORMATS[format][0])
+    for header, value in headers.items():
+        response.headers[header] = value
+    return response
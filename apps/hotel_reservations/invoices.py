@@ -0,0 +1,251 @@
+"""
+This file defines the invoice pipeline
+
+Booking a room only queues its invoice: the reservation transaction inserts
+a db.invoices row with status "queued". The generate_invoices scheduler
+task (tasks.py) picks the queued rows, reads everything the invoices need in
+one query and renders them in batches in a process pool, off the request
+threads and off the scheduler process itself.
+
+Rendered files are content addressed: an invoice is stored as
+UPLOAD_FOLDER/invoices/<sha256[:2]>/<sha256>.html (and .pdf when reportlab
+is installed), so rendering the same invoice again writes nothing and
+identical documents share one file.
+
+The rendering functions only take and return plain data, so that they can
+run in the worker processes. The pool starts them with forkserver (spawn
+where it is not available), never with a bare fork of the threaded web or
+scheduler process, which would copy its database connections and held
+locks; the workers import this module but not the app (see __init__.py).
+
+An invoice whose reservation no longer exists is marked failed.
+"""
+
+import hashlib
+import html
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from .availability import to_date
+
+BATCH_SIZE = 100
+SUBFOLDER = "invoices"
+
+
+def invoice_number(reservation_id):
+    return "INV-%06d" % int(reservation_id)
+
+
+def content_path(folder, digest, extension):
+    return os.path.join(folder, SUBFOLDER, digest[:2], "%s.%s" % (digest, extension))
+
+
+def invoice_data(db, reservation_ids):
+    """Plain dicts with everything render_html needs, one per reservation"""
+    rows = db(db.reservations.id.belongs(reservation_ids)).select(
+        db.reservations.ALL,
+        db.rooms.number_of_beds,
+        db.rooms.price_per_night,
+        db.customers.name,
+        db.customers.email,
+        db.customers.address,
+        left=[
+            db.rooms.on(db.rooms.id == db.reservations.room_id),
+            db.customers.on(db.customers.id == db.reservations.customer_id),
+        ],
+    )
+    data = []
+    for row in rows:
+        r = row.reservations
+        nights = (to_date(r.end_date) - to_date(r.start_date)).days
+        total = float(r.total_cost or 0)
+        data.append(dict(
+            reservation_id=r.id,
+            number=invoice_number(r.id),
+            issued=str(to_date(r.created_on) if r.created_on else to_date(datetime.now())),
+            customer_name=row.customers.name or "",
+            customer_email=row.customers.email or "",
+            customer_address=row.customers.address or "",
+            room_id=r.room_id,
+            beds=row.rooms.number_of_beds,
+            start_date=str(r.start_date),
+            end_date=str(r.end_date),
+            nights=nights,
+            rate=total / nights if nights > 0 else total,
+            total=total,
+            notes=r.notes or "",
+        ))
+    return data
+
+
+def render_html(invoice):
+    e = lambda value: html.escape(str(value))
+    notes = "<p><strong>Notes:</strong> %s</p>" % e(invoice["notes"]) if invoice["notes"] else ""
+    return """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Invoice %(number)s</title>
+<style>
+body { font-family: sans-serif; margin: 40px; color: #333; }
+table { width: 100%%; border-collapse: collapse; margin-top: 20px; }
+th, td { padding: 8px; border-bottom: 1px solid #ddd; text-align: left; }
+.total { font-weight: bold; text-align: right; }
+</style>
+</head>
+<body>
+<h1>Invoice %(number)s</h1>
+<p>Issued: %(issued)s</p>
+<h3>Billed to</h3>
+<p>%(customer_name)s<br>%(customer_email)s<br>%(customer_address)s</p>
+<table>
+<tr><th>Description</th><th>Nights</th><th>Rate</th><th>Amount</th></tr>
+<tr><td>Room %(room_id)s (%(beds)s bed(s)), %(start_date)s to %(end_date)s</td>
+<td>%(nights)s</td><td>$%(rate).2f</td><td>$%(total).2f</td></tr>
+</table>
+<p class="total">Total: $%(total).2f</p>
+%(notes)s
+</body>
+</html>
+""" % dict(
+        {key: e(value) for key, value in invoice.items()},
+        rate=invoice["rate"],
+        total=invoice["total"],
+        notes=notes,
+    )
+
+
+def render_pdf(invoice):
+    """The invoice as PDF bytes, None when reportlab is not installed"""
+    try:
+        from io import BytesIO
+
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+    except ImportError:
+        return None
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    y = A4[1] - 72
+    lines = [
+        ("Helvetica-Bold", 18, "Invoice %s" % invoice["number"]),
+        ("Helvetica", 11, "Issued: %s" % invoice["issued"]),
+        ("Helvetica", 11, ""),
+        ("Helvetica-Bold", 11, "Billed to"),
+        ("Helvetica", 11, invoice["customer_name"]),
+        ("Helvetica", 11, invoice["customer_email"]),
+        ("Helvetica", 11, invoice["customer_address"]),
+        ("Helvetica", 11, ""),
+        ("Helvetica", 11, "Room %(room_id)s (%(beds)s bed(s)), %(start_date)s to %(end_date)s" % invoice),
+        ("Helvetica", 11, "%(nights)s night(s) at $%(rate).2f" % invoice),
+        ("Helvetica-Bold", 12, "Total: $%.2f" % invoice["total"]),
+    ]
+    for font, size, text in lines:
+        pdf.setFont(font, size)
+        pdf.drawString(72, y, str(text))
+        y -= size + 8
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def store(folder, content, extension):
+    """Write content under its sha256 unless that file already exists, return the digest"""
+    digest = hashlib.sha256(content).hexdigest()
+    path = content_path(folder, digest, extension)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "wb") as stream:
+            stream.write(content)
+        os.replace(tmp, path)
+    return digest
+
+
+def render_batch(folder, invoices):
+    """
+    Runs in a worker process: render and store a batch of invoices.
+    Returns [(reservation_id, html digest, pdf digest or None, error or None)]
+    """
+    results = []
+    for invoice in invoices:
+        try:
+            html_digest = store(folder, render_html(invoice).encode("utf8"), "html")
+            pdf = render_pdf(invoice)
+            pdf_digest = store(folder, pdf, "pdf") if pdf else None
+            results.append((invoice["reservation_id"], html_digest, pdf_digest, None))
+        except Exception as e:
+            results.append((invoice["reservation_id"], None, None, str(e)))
+    return results
+
+
+def enqueue(db, reservation_ids):
+    """Queue invoices for reservations, in the caller's transaction"""
+    existing = {
+        row.reservation_id
+        for row in db(db.invoices.reservation_id.belongs(reservation_ids)).select(
+            db.invoices.reservation_id
+        )
+    }
+    db.invoices.bulk_insert([
+        dict(reservation_id=rid, number=invoice_number(rid), status="queued")
+        for rid in reservation_ids
+        if rid not in existing
+    ])
+
+
+def pool(processes=None):
+    """A process pool whose workers do not inherit the state of this process"""
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=processes, mp_context=context)
+
+
+def generate(db, folder, limit=None, batch_size=BATCH_SIZE, processes=None):
+    """
+    Render the queued invoices (at most limit) and record the results.
+    Returns the number of invoices rendered and failed
+    """
+    query = db.invoices.status == "queued"
+    queued = db(query).select(
+        db.invoices.reservation_id,
+        orderby=db.invoices.id,
+        limitby=(0, limit) if limit else None,
+    )
+    reservation_ids = [row.reservation_id for row in queued]
+    if not reservation_ids:
+        return dict(rendered=0, failed=0)
+    data = invoice_data(db, reservation_ids)
+    rendered = failed = 0
+    # else they would stay queued and be selected again by every run
+    missing = set(reservation_ids) - {invoice["reservation_id"] for invoice in data}
+    if missing:
+        db(db.invoices.reservation_id.belongs(missing)).update(
+            status="failed", error="The reservation no longer exists"
+        )
+        db.commit()
+        failed += len(missing)
+    if not data:
+        return dict(rendered=rendered, failed=failed)
+    batches = [data[k : k + batch_size] for k in range(0, len(data), batch_size)]
+    with pool(processes) as executor:
+        for results in executor.map(render_batch, [folder] * len(batches), batches):
+            for reservation_id, html_digest, pdf_digest, error in results:
+                row = db.invoices.reservation_id == reservation_id
+                if error:
+                    db(row).update(status="failed", error=error)
+                    failed += 1
+                else:
+                    db(row).update(
+                        status="rendered",
+                        content_hash=html_digest,
+                        pdf_hash=pdf_digest,
+                        rendered_on=datetime.now(),
+                        error=None,
+                    )
+                    rendered += 1
+            # commit every batch, a crash later on does not lose the work done
+            db.commit()
+    return dict(rendered=rendered, failed=failed)
@@ -0,0 +1,283 @@
+"""
+This file defines the request metrics fixture and their Prometheus exposition
+
+List the fixture first, so that it times everything the others do:
+
+    @action.uses(metrics, db, auth.user)
+
+and it records, per route (the rule of the action, e.g.
+/hotel_reservations/api/manager/rooms/<room_id:int>, never the actual path):
+
+    hotel_http_requests_total               by method and status
+    hotel_http_request_duration_seconds     histogram (BUCKETS)
+    hotel_http_response_size_bytes          histogram (SIZE_BUCKETS)
+    hotel_http_exceptions_total             unhandled exceptions (status 500)
+    hotel_db_queries_total                  queries run by the action
+    hotel_db_query_duration_seconds_total   time spent executing them
+
+The queries are counted by an execution handler that watch() adds to the
+adapter of db; a query run outside an instrumented action is not counted.
+
+Every thread writes only its own counters (a Shard, reached through a
+threading.local), so recording takes no lock and threads never contend;
+the shards are only read, and summed, when the metrics action renders the
+exposition. A scrape can therefore see a request counted in one series and
+not yet in another, which Prometheus tolerates. When a thread ends, its
+counters are folded into the retired totals and its shard is dropped, so a
+server that keeps replacing its threads does not keep one shard per thread
+it ever ran. The counters live in the process: scrape every worker process,
+not the balancer.
+"""
+
+import bisect
+import itertools
+import sys
+import threading
+import time
+import weakref
+
+from pydal.helpers.classes import ExecutionHandler
+
+from py4web import request, response
+from py4web.core import HTTP, Fixture, bottle, dumps
+
+# seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+PREFIX = "hotel"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RouteCounters:
+    """The counters of one route in one thread"""
+
+    __slots__ = ("requests", "latency", "latency_sum", "sizes", "size_sum",
+                 "exceptions", "queries", "query_seconds")
+
+    def __init__(self):
+        self.requests = {}  # (method, status) -> count
+        self.latency = [0] * (len(BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.sizes = [0] * (len(SIZE_BUCKETS) + 1)
+        self.size_sum = 0
+        self.exceptions = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def observe(self, method, status, seconds, size):
+        key = (method, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        self.latency[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.latency_sum += seconds
+        self.sizes[bisect.bisect_left(SIZE_BUCKETS, size)] += 1
+        self.size_sum += size
+
+
+class Shard:
+    """The counters of one thread, only ever written by that thread"""
+
+    def __init__(self):
+        self.routes = {}
+        # the counters of the request in progress, and when it started
+        self.current = None
+        self.started = 0.0
+
+    def route(self, rule):
+        counters = self.routes.get(rule)
+        if counters is None:
+            counters = self.routes[rule] = RouteCounters()
+        return counters
+
+
+class RequestMetrics(Fixture):
+    """Per-route latency, size, status, exception and query counters"""
+
+    def __init__(self, db=None):
+        self.threads = threading.local()
+        # the routes of the shards of the running threads, by shard number
+        # (not by thread ident: an ident is reused before the old shard is retired)
+        self.shards = {}
+        self.numbers = itertools.count()
+        # the counters of the threads that ended, {rule: RouteCounters}
+        self.retired = {}
+        # taken when a shard is created or retired, and by collect
+        self.lock = threading.RLock()
+        if db is not None:
+            self.watch(db)
+
+    def shard(self):
+        try:
+            return self.threads.shard
+        except AttributeError:
+            shard = self.threads.shard = Shard()
+            with self.lock:
+                number = next(self.numbers)
+                self.shards[number] = shard.routes
+            # the threading.local drops the shard when the thread ends
+            weakref.finalize(shard, self.retire, number)
+            return shard
+
+    def retire(self, number):
+        """Fold the counters of a thread that ended into the retired totals"""
+        with self.lock:
+            fold(self.retired, self.shards.pop(number))
+
+    def watch(self, db):
+        """Count and time the queries db executes during instrumented actions"""
+        metrics = self
+
+        class QueryTimer(ExecutionHandler):
+            def before_execute(self, command):
+                self.t0 = time.perf_counter()
+
+            def after_execute(self, command):
+                counters = metrics.shard().current
+                if counters is not None:
+                    counters.queries += 1
+                    counters.query_seconds += time.perf_counter() - self.t0
+
+        db._adapter.execution_handlers.append(QueryTimer)
+
+    def on_request(self, context):
+        shard = self.shard()
+        shard.current = shard.route(rule())
+        shard.started = time.perf_counter()
+
+    def on_success(self, context):
+        shard = self.shard()
+        counters, shard.current = shard.current, None
+        if counters is None:
+            return
+        exception = sys.exc_info()[1]
+        if isinstance(exception, HTTP):
+            # abort(), redirect() and the 304 of ConditionalGet
+            status, size = exception.status, length(exception.body)
+        elif isinstance(exception, bottle.HTTPResponse):
+            # static_file
+            status = exception.status_code
+            size = int(exception.get_header("Content-Length") or 0)
+        else:
+            output = context["output"]
+            if isinstance(output, (list, dict)):
+                # serialize here, as action.catch_errors would, to measure it
+                response.headers.setdefault("Content-Type", "application/json")
+                output = context["output"] = dumps(output)
+            status, size = response.status_code, length(output)
+        counters.observe(request.method, status, time.perf_counter() - shard.started, size)
+
+    def on_error(self, context):
+        shard = self.shard()
+        counters, shard.current = shard.current, None
+        if counters is None:
+            return
+        status = getattr(context["exception"], "status_code", 500)
+        counters.observe(request.method, status, time.perf_counter() - shard.started, 0)
+        counters.exceptions += 1
+
+    def collect(self):
+        """The counters of all the threads, live and ended, summed: {rule: RouteCounters}"""
+        routes = {}
+        # under the lock the counters of a thread are either live or retired,
+        # never both or neither
+        with self.lock:
+            live = list(self.shards.values())
+            fold(routes, self.retired)
+        for counters_by_rule in live:
+            fold(routes, counters_by_rule)
+        return routes
+
+    def exposition(self):
+        """The Prometheus text exposition of the counters"""
+        routes = sorted(self.collect().items())
+        lines = []
+
+        def family(name, kind, help):
+            lines.append("# HELP %s_%s %s" % (PREFIX, name, help))
+            lines.append("# TYPE %s_%s %s" % (PREFIX, name, kind))
+
+        def sample(name, labels, value):
+            text = ",".join('%s="%s"' % (key, escape(label)) for key, label in labels)
+            lines.append("%s_%s{%s} %s" % (PREFIX, name, text, number(value)))
+
+        def histogram(name, route, bounds, counts, total):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                sample(name + "_bucket", [("route", route), ("le", bound)], cumulative)
+            cumulative += counts[-1]
+            sample(name + "_bucket", [("route", route), ("le", "+Inf")], cumulative)
+            sample(name + "_sum", [("route", route)], total)
+            sample(name + "_count", [("route", route)], cumulative)
+
+        family("http_requests_total", "counter", "Requests handled, by route, method and status.")
+        for rule, counters in routes:
+            for (method, status), count in sorted(counters.requests.items()):
+                sample("http_requests_total",
+                       [("route", rule), ("method", method), ("status", status)], count)
+        family("http_request_duration_seconds", "histogram", "Time spent handling a request.")
+        for rule, counters in routes:
+            histogram("http_request_duration_seconds", rule, BUCKETS, counters.latency,
+                      counters.latency_sum)
+        family("http_response_size_bytes", "histogram", "Size of the response bodies.")
+        for rule, counters in routes:
+            histogram("http_response_size_bytes", rule, SIZE_BUCKETS, counters.sizes,
+                      counters.size_sum)
+        family("http_exceptions_total", "counter", "Requests that raised an unhandled exception.")
+        for rule, counters in routes:
+            sample("http_exceptions_total", [("route", rule)], counters.exceptions)
+        family("db_queries_total", "counter", "Database queries executed by the requests.")
+        for rule, counters in routes:
+            sample("db_queries_total", [("route", rule)], counters.queries)
+        family("db_query_duration_seconds_total", "counter",
+               "Time spent executing the database queries of the requests.")
+        for rule, counters in routes:
+            sample("db_query_duration_seconds_total", [("route", rule)], counters.query_seconds)
+        return "\n".join(lines) + "\n"
+
+
+def fold(routes, counters_by_rule):
+    """Add the counters of counters_by_rule into routes, {rule: RouteCounters}"""
+    for rule, counters in counters_by_rule.copy().items():
+        total = routes.get(rule)
+        if total is None:
+            total = routes[rule] = RouteCounters()
+        for key, count in counters.requests.copy().items():
+            total.requests[key] = total.requests.get(key, 0) + count
+        for k, count in enumerate(counters.latency):
+            total.latency[k] += count
+        for k, count in enumerate(counters.sizes):
+            total.sizes[k] += count
+        total.latency_sum += counters.latency_sum
+        total.size_sum += counters.size_sum
+        total.exceptions += counters.exceptions
+        total.queries += counters.queries
+        total.query_seconds += counters.query_seconds
+
+
+def rule():
+    """The rule of the route that matched the request, its path when there is none"""
+    route = request.environ.get("ombott.route")
+    route = getattr(route, "route", route)
+    return getattr(route, "rule", None) or request.path
+
+
+def length(body):
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body) if body.isascii() else len(body.encode("utf8"))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, (list, dict)):
+        return length(dumps(body))
+    # a generator (a streamed export) or a file: unknown
+    return 0
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
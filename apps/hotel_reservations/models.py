@@ -2,9 +2,16 @@
 This file defines the database models
 """
 
+import datetime
+
+from pydal.objects import Query
 from pydal.validators import *
 
+from . import changes
+from .amenities import link_unlinked_rooms
 from .common import Field, db, auth
+from .customer_search import create_search_index
+from .versions import versions
 
 ### Define your table below
 #
@@ -16,6 +23,8 @@ from .common import Field, db, auth
 #
 
 db.define_table('rooms',
+    # external room code (property system, import files), the upsert key of room_import
+    Field('code', 'string', requires=IS_EMPTY_OR(IS_NOT_IN_DB(db, 'rooms.code'))),
     Field('number_of_beds', 'integer', requires=IS_INT_IN_RANGE(1, 5), notnull=True),
     Field('amenities', 'text', requires=IS_NOT_EMPTY()),
     Field('price_per_night', 'double', requires=IS_FLOAT_IN_RANGE(0, None), notnull=True),
@@ -46,4 +55,140 @@ db.define_table('reservations',
     Field('total_cost', 'double', requires=IS_FLOAT_IN_RANGE(0, None)),
     auth.signature, format="Reservation %(id)s | Room %(room_id)s | Customer %(customer_id)s")
 
-db.commit()
\ No newline at end of file
+db.define_table('amenities',
+    Field('name', 'string', requires=IS_NOT_EMPTY(), notnull=True, unique=True),
+    format="%(name)s")
+
+db.define_table('room_amenities',
+    Field('room_id', 'reference rooms', notnull=True),
+    Field('amenity_id', 'reference amenities', notnull=True))
+
+# daily occupancy and revenue rollup, maintained by rollup.py
+db.define_table('daily_room_stats',
+    Field('day', 'date', notnull=True),
+    Field('room_id', 'reference rooms', notnull=True),
+    Field('occupied', 'integer', notnull=True, default=0),
+    Field('revenue', 'double', notnull=True, default=0))
+
+# invoices, queued with the reservation and rendered by invoices.generate
+db.define_table('invoices',
+    Field('reservation_id', 'reference reservations', notnull=True, unique=True),
+    Field('number', 'string'),
+    Field('status', 'string', default='queued',
+          requires=IS_IN_SET(['queued', 'rendered', 'failed'])),
+    Field('content_hash', 'string'),
+    Field('pdf_hash', 'string'),
+    Field('rendered_on', 'datetime'),
+    Field('error', 'text'))
+
+# outgoing email, queued by the actions and sent by outbox.drain
+db.define_table('outbox',
+    Field('to_address', 'string', notnull=True),
+    Field('subject', 'string'),
+    Field('body', 'text'),
+    Field('kind', 'string'),
+    Field('reservation_id', 'integer'),
+    Field('status', 'string', default='queued',
+          requires=IS_IN_SET(['queued', 'sending', 'sent', 'failed'])),
+    # the drain() run that holds a 'sending' message, until next_attempt_on
+    Field('claim', 'string'),
+    Field('attempts', 'integer', default=0),
+    Field('next_attempt_on', 'datetime'),
+    Field('last_error', 'text'),
+    Field('sent_on', 'datetime'),
+    Field('created_on', 'datetime', default=lambda: datetime.datetime.now()))
+
+# per-table data versions, bumped by the triggers of versions.watch
+db.define_table('table_versions',
+    Field('name', 'string', notnull=True),
+    Field('slot', 'integer', notnull=True, default=0),
+    Field('version', 'bigint', notnull=True, default=0))
+
+# the inserts and deletes of reservations, written by the triggers of
+# changes.watch and followed by the in-memory engines (changes.py)
+db.define_table('reservation_changes',
+    Field('reservation_id', 'bigint', notnull=True),
+    Field('room_id', 'bigint', notnull=True),
+    Field('start_date', 'date', notnull=True),
+    Field('end_date', 'date', notnull=True),
+    Field('op', 'string', length=3, notnull=True))
+
+
+### Indexes
+#
+# pydal does not manage indexes, so they are created here with
+# CREATE INDEX IF NOT EXISTS, which is safe to run on every start
+# on both SQLite and PostgreSQL (customers.email and managers.email
+# are already covered by their unique constraints; rooms.code is
+# unique through its index, as SQLite cannot add a UNIQUE column)
+#
+INDEXES = [
+    ('rooms', 'rooms_code_idx', ['code'], 'unique'),
+    ('reservations', 'reservations_room_dates_idx', ['room_id', 'start_date', 'end_date']),
+    ('reservations', 'reservations_customer_start_idx', ['customer_id', 'start_date']),
+    ('customers', 'customers_user_id_idx', ['user_id']),
+    # keyset pagination of the customers list, ORDER BY name, id
+    ('customers', 'customers_name_id_idx', ['name', 'id']),
+    # the exact, case insensitive, match of customer_search.identify
+    ('customers', 'customers_lower_name_idx', ['lower(name)']),
+    ('customers', 'customers_lower_email_idx', ['lower(email)']),
+    ('managers', 'managers_user_id_idx', ['user_id']),
+    ('room_amenities', 'room_amenities_amenity_room_idx', ['amenity_id', 'room_id']),
+    ('room_amenities', 'room_amenities_room_idx', ['room_id']),
+    ('daily_room_stats', 'daily_room_stats_room_day_idx', ['room_id', 'day']),
+    ('daily_room_stats', 'daily_room_stats_day_idx', ['day']),
+    ('invoices', 'invoices_status_idx', ['status']),
+    ('outbox', 'outbox_due_idx', ['status', 'next_attempt_on']),
+    ('table_versions', 'table_versions_name_slot_idx', ['name', 'slot'], 'unique'),
+]
+
+def create_indexes():
+    # 'sqlite:memory' for an in-memory database
+    if db._dbname.split(':')[0] not in ('sqlite', 'postgres'):
+        return
+    for tablename, name, fieldnames, *unique in INDEXES:
+        table = db[tablename]
+        db.executesql('CREATE %sINDEX IF NOT EXISTS %s ON %s (%s);' % (
+            'UNIQUE ' if unique else '', name, table._rname, ', '.join(index_column(table, f) for f in fieldnames)))
+
+def index_column(table, fieldname):
+    """The column of a field, or lower(field) as an expression, as pydal's field.lower() writes it"""
+    if fieldname.startswith('lower('):
+        return '(LOWER(%s))' % table[fieldname[6:-1]]._rname
+    return table[fieldname]._rname
+
+create_indexes()
+
+# full text (SQLite FTS5) or trigram (PostgreSQL) index used to look up customers
+create_search_index(db)
+
+# the data versions behind the ETags of the read endpoints (versions.ConditionalGet)
+# and the reloads of the amenity index
+versions.watch(db, db.reservations, db.rooms, db.customers, db.amenities, db.room_amenities)
+
+# the change log the availability and occupancy engines apply
+changes.watch(db, db.reservations, db.reservation_changes)
+
+# link the rooms created before the amenity catalog existed, a no-op once they
+# are: every writer of rooms.amenities syncs its links (amenities.sync_rooms)
+link_unlinked_rooms(db)
+
+def overlapping(start_date, end_date, table=None):
+    """
+    Reservations overlapping the half-open range [start_date, end_date).
+    Combined with room_id == x this is a range probe on reservations_room_dates_idx
+    """
+    table = table or db.reservations
+    return (table.start_date < end_date) & (table.end_date > start_date)
+
+def free_rooms(start_date, end_date):
+    """
+    Rooms with no reservation overlapping [start_date, end_date), as an anti-join:
+    NOT EXISTS (a correlated probe on reservations_room_dates_idx)
+    """
+    probe = db(
+        (db.reservations.room_id == db.rooms.id) & overlapping(start_date, end_date)
+    )._select(db.reservations.id, outer_scoped=['rooms'])
+    return Query(db, 'NOT EXISTS (%s)' % probe.rstrip(';'))
+
+db.commit()
@@ -0,0 +1,208 @@
+"""
+This file defines the room x day occupancy matrix
+
+One bit per (room, day): rows are rooms, columns are epoch days counted from
+an origin date, and the bits are packed eight days per byte with numpy.
+Range questions ("which rooms are free for [start, end)", "how many rooms are
+booked on each day") unpack only the columns of the requested window and
+answer with vectorized reductions, instead of looping over rooms and
+reservations in Python.
+
+Like the availability index, the matrix is built from db.reservations on
+first use, then the actions set and clear the bits of their own reservations
+after their commit, and every use first applies the changes other processes
+have made since, from the change log of db.reservations (changes.py).
+
+get_available_rooms does not ask the matrix for its free rooms: it answers
+with the anti-join of models.free_rooms, so that its filters, sort and limit
+stay in the same query.
+"""
+
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+from .availability import to_date
+from .changes import ChangeFeed
+
+# the day axis grows in steps of this many days (a multiple of 8)
+GROW_DAYS = 8 * 46
+
+
+class OccupancyMatrix:
+    """Packed boolean array indexed by room and epoch day"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.feed = ChangeFeed()  # the changes of db.reservations applied so far
+        self.origin = None  # ordinal of the first column
+        self.bits = np.zeros((0, 0), dtype=np.uint8)
+        self.rows = {}  # room_id -> row number
+
+    @property
+    def days(self):
+        return self.bits.shape[1] * 8
+
+    def load(self, db):
+        """(Re)build the matrix from db.reservations"""
+        with self.lock:
+            # before the reservations, see changes.py
+            self.feed.start(db)
+            rows = db(db.reservations).select(
+                db.reservations.room_id,
+                db.reservations.start_date,
+                db.reservations.end_date,
+            )
+            spans = [
+                (row.room_id, to_date(row.start_date).toordinal(), to_date(row.end_date).toordinal())
+                for row in rows
+            ]
+            room_ids = sorted({room_id for room_id, start, end in spans})
+            positions = {room_id: k for k, room_id in enumerate(room_ids)}
+            if spans:
+                first = min(start for room_id, start, end in spans)
+                origin = first - first % 8
+                days = max(end for room_id, start, end in spans) - origin
+                days = -(-days // GROW_DAYS) * GROW_DAYS
+            else:
+                origin, days = None, 0
+            # fill an unpacked matrix once, then pack it
+            matrix = np.zeros((len(room_ids), days), dtype=bool)
+            for room_id, start, end in spans:
+                matrix[positions[room_id], start - origin : end - origin] = True
+            self.origin = origin
+            self.bits = np.packbits(matrix, axis=1)
+            self.rows = positions
+
+    def ensure_loaded(self, db):
+        """The matrix, with the changes made since its last use applied"""
+        with self.lock:
+            changes = self.feed.read(db)
+            if changes is None:
+                self.load(db)
+            for change in changes or ():
+                self.mark(change.room_id, change.start_date, change.end_date, change.op == "add")
+        return self
+
+    def add(self, room_id, start_date, end_date):
+        with self.lock:
+            self.mark(room_id, start_date, end_date, True)
+
+    def discard(self, room_id, start_date, end_date):
+        with self.lock:
+            self.mark(room_id, start_date, end_date, False)
+
+    def mark(self, room_id, start_date, end_date, value):
+        """Set or clear the bits of [start, end) for one room"""
+        start = to_date(start_date).toordinal()
+        end = to_date(end_date).toordinal()
+        if end <= start:
+            return
+        room_id = int(room_id)
+        if room_id not in self.rows:
+            if not value:
+                return
+            self.rows[room_id] = len(self.rows)
+            self.bits = np.vstack(
+                [self.bits, np.zeros((1, self.bits.shape[1]), dtype=np.uint8)]
+            )
+        self.grow(start, end)
+        row = self.rows[room_id]
+        lo = (start - self.origin) // 8
+        hi = (end - self.origin + 7) // 8
+        segment = np.unpackbits(self.bits[row, lo:hi])
+        offset = start - self.origin - lo * 8
+        segment[offset : offset + end - start] = value
+        self.bits[row, lo:hi] = np.packbits(segment)
+
+    def grow(self, start, end):
+        """Extend the day axis so that [start, end) is covered"""
+        if self.origin is None:
+            self.origin = start - start % 8
+        if start < self.origin:
+            extra = -(-(self.origin - start) // GROW_DAYS) * GROW_DAYS
+            pad = np.zeros((self.bits.shape[0], extra // 8), dtype=np.uint8)
+            self.bits = np.hstack([pad, self.bits])
+            self.origin -= extra
+        if end > self.origin + self.days:
+            extra = end - self.origin - self.days
+            extra = -(-extra // GROW_DAYS) * GROW_DAYS
+            pad = np.zeros((self.bits.shape[0], extra // 8), dtype=np.uint8)
+            self.bits = np.hstack([self.bits, pad])
+
+    def window(self, start_date, end_date):
+        """Return (room_ids, bool matrix rooms x days) for [start, end)"""
+        start = to_date(start_date).toordinal()
+        end = max(to_date(end_date).toordinal(), start)
+        with self.lock:
+            room_ids = np.fromiter(self.rows.keys(), dtype=np.int64, count=len(self.rows))
+            out = np.zeros((len(room_ids), end - start), dtype=bool)
+            if self.origin is None:
+                return room_ids, out
+            lo = max(start, self.origin)
+            hi = min(end, self.origin + self.days)
+            if lo < hi:
+                first = (lo - self.origin) // 8
+                last = (hi - self.origin + 7) // 8
+                unpacked = np.unpackbits(self.bits[:, first:last], axis=1)
+                offset = lo - self.origin - first * 8
+                out[:, lo - start : hi - start] = unpacked[:, offset : offset + hi - lo]
+            return room_ids, out
+
+    def free_room_ids(self, room_ids, start_date, end_date):
+        """Filter room_ids down to the rooms with no booked day in [start, end)"""
+        known, matrix = self.window(start_date, end_date)
+        busy = set(known[matrix.any(axis=1)].tolist())
+        return [room_id for room_id in room_ids if room_id not in busy]
+
+    def daily_counts(self, start_date, end_date):
+        """Number of booked rooms for every day of [start, end)"""
+        known, matrix = self.window(start_date, end_date)
+        return matrix.sum(axis=0).astype(int).tolist()
+
+    def free_windows(self, room_ids, start_date, end_date, nights):
+        """
+        Every stay of `nights` nights that fits inside [start, end), per room:
+        returns {room_id: [offset in days from start of each free stay]}.
+        A prefix sum over the booked days gives the booked nights of every
+        candidate stay at once
+        """
+        known, matrix = self.window(start_date, end_date)
+        days = matrix.shape[1]
+        if nights <= 0 or nights > days:
+            return {room_id: [] for room_id in room_ids}
+        position = {room_id: k for k, room_id in enumerate(known.tolist())}
+        rows = np.array([position.get(room_id, -1) for room_id in room_ids], dtype=np.int64)
+        matrix = np.vstack([matrix, np.zeros((1, days), dtype=bool)])
+        booked = np.zeros((len(room_ids), days + 1), dtype=np.int32)
+        np.cumsum(matrix[rows], axis=1, out=booked[:, 1:])
+        free = (booked[:, nights:] - booked[:, : days + 1 - nights]) == 0
+        return {
+            room_id: np.flatnonzero(free[k]).tolist() for k, room_id in enumerate(room_ids)
+        }
+
+    def chart(self, room_ids, start_date, end_date):
+        """
+        Availability chart payload for the days of [start, end):
+        the list of dates, the booked rooms per day and, per room, a 0/1 flag per day
+        """
+        start = to_date(start_date)
+        known, matrix = self.window(start_date, end_date)
+        position = {room_id: k for k, room_id in enumerate(known.tolist())}
+        rows = np.array([position.get(room_id, -1) for room_id in room_ids], dtype=np.int64)
+        # append an empty row so that rooms without reservations index into it
+        matrix = np.vstack([matrix, np.zeros((1, matrix.shape[1]), dtype=bool)])
+        selected = matrix[rows].astype(np.uint8)
+        return dict(
+            dates=[str(start + timedelta(days=k)) for k in range(matrix.shape[1])],
+            daily_occupancy=selected.sum(axis=0).astype(int).tolist(),
+            booked_slots=int(selected.sum()),
+            occupied={
+                room_id: selected[k].tolist() for k, room_id in enumerate(room_ids)
+            },
+        )
+
+
+# one per process: every worker process holds and updates its own copy
+occupancy = OccupancyMatrix()
@@ -0,0 +1,247 @@
+"""
+This file defines the email outbox
+
+Actions never talk to the mail server: the confirmation or cancellation is
+inserted into db.outbox in the same transaction as the reservation change,
+and the send_outbox scheduler task (tasks.py) drains the table.
+
+drain() claims up to batch_size due messages, opens one SMTP connection
+(settings.SMTP_SERVER, "host:port") for the whole batch and sends them one
+after the other. A message that fails is retried after backoff * 2**attempts
+seconds and marked failed after max_attempts; when the connection itself
+cannot be opened the whole batch is rescheduled. Every batch records its
+timings (connect, send, total) in `metrics` and in the log.
+
+Runs can overlap (several Celery workers, the scheduler and a manual run),
+so the batch is claimed first and committed before anything is sent: one
+UPDATE sets status "sending", a random claim token and a lease in
+next_attempt_on, only on rows that are still due, and the run sends the rows
+that carry its token. A run that dies while sending leaves its messages to
+the next run once the lease has expired (they may then go out twice, never
+zero times).
+
+To try it locally, run a debugging SMTP server and point SMTP_SERVER at it:
+
+    python -m aiosmtpd -n -l localhost:1025     (or, up to Python 3.11,
+    python -m smtpd -n -c DebuggingServer localhost:1025)
+"""
+
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+BACKOFF = 60  # seconds before the first retry, doubled after every attempt
+LEASE = 600  # seconds a run holds the messages it claimed
+
+metrics = dict(
+    lock=threading.Lock(),
+    batches=0,
+    sent=0,
+    failed=0,
+    retried=0,
+    last_batch=None,
+)
+
+
+def queue(db, to, subject, body, kind=None, reservation_id=None):
+    """Queue a message, in the caller's transaction"""
+    if not to:
+        return None
+    return db.outbox.insert(
+        to_address=to,
+        subject=subject,
+        body=body,
+        kind=kind,
+        reservation_id=reservation_id,
+        status="queued",
+        attempts=0,
+        next_attempt_on=datetime.now(),
+    )
+
+
+def stays(db, reservation_ids):
+    return db(db.reservations.id.belongs(reservation_ids)).select(
+        db.reservations.id,
+        db.reservations.room_id,
+        db.reservations.start_date,
+        db.reservations.end_date,
+        db.reservations.total_cost,
+        db.customers.name,
+        db.customers.email,
+        left=db.customers.on(db.customers.id == db.reservations.customer_id),
+    )
+
+
+def describe(row):
+    r = row.reservations
+    return "Reservation #%s: room %s, %s to %s, $%.2f" % (
+        r.id, r.room_id, r.start_date, r.end_date, float(r.total_cost or 0)
+    )
+
+
+def reservations_confirmed(db, reservation_ids):
+    """Queue a confirmation per reservation (call after the insert, before the commit)"""
+    for row in stays(db, reservation_ids):
+        queue(
+            db,
+            row.customers.email,
+            "Your reservation #%s is confirmed" % row.reservations.id,
+            "Dear %s,\n\nthank you for your booking.\n\n%s\n"
+            % (row.customers.name, describe(row)),
+            kind="confirmation",
+            reservation_id=row.reservations.id,
+        )
+
+
+def reservations_cancelled(db, reservation_ids):
+    """Queue a cancellation per reservation (call before the delete)"""
+    for row in stays(db, reservation_ids):
+        queue(
+            db,
+            row.customers.email,
+            "Your reservation #%s was cancelled" % row.reservations.id,
+            "Dear %s,\n\nthe following reservation was cancelled.\n\n%s\n"
+            % (row.customers.name, describe(row)),
+            kind="cancellation",
+            reservation_id=row.reservations.id,
+        )
+
+
+def connect(settings, timeout=30):
+    host, _, port = (settings.SMTP_SERVER or "").partition(":")
+    port = int(port or (465 if settings.SMTP_SSL else 25))
+    if settings.SMTP_SSL:
+        server = smtplib.SMTP_SSL(host, port, timeout=timeout)
+    else:
+        server = smtplib.SMTP(host, port, timeout=timeout)
+    try:
+        if settings.SMTP_TLS and not settings.SMTP_SSL:
+            server.starttls()
+        if settings.SMTP_LOGIN:
+            user, _, password = settings.SMTP_LOGIN.partition(":")
+            server.login(user, password)
+    except BaseException:
+        # the socket is open, do not leak it
+        server.close()
+        raise
+    return server
+
+
+def message(row, sender):
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = row.to_address
+    msg["Subject"] = row.subject
+    msg.set_content(row.body or "")
+    return msg
+
+
+def retry(db, row, error, max_attempts, backoff):
+    attempts = (row.attempts or 0) + 1
+    failed = attempts >= max_attempts
+    db(db.outbox.id == row.id).update(
+        attempts=attempts,
+        status="failed" if failed else "queued",
+        claim=None,
+        last_error=str(error)[:1000],
+        next_attempt_on=datetime.now() + timedelta(seconds=backoff * 2 ** (attempts - 1)),
+    )
+    return failed
+
+
+def claim(db, batch_size, lease=LEASE):
+    """Claim up to batch_size due messages for this run and commit, returns their rows"""
+    now = datetime.now()
+    due = db.outbox.status.belongs(("queued", "sending")) & (db.outbox.next_attempt_on <= now)
+    ids = [
+        row.id
+        for row in db(due).select(
+            db.outbox.id, orderby=db.outbox.next_attempt_on | db.outbox.id, limitby=(0, batch_size)
+        )
+    ]
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    # the WHERE is evaluated again under the row locks: a message another run
+    # claimed meanwhile is no longer due and is left out
+    db(db.outbox.id.belongs(ids) & due).update(
+        status="sending", claim=token, next_attempt_on=now + timedelta(seconds=lease)
+    )
+    db.commit()
+    return db((db.outbox.claim == token) & (db.outbox.status == "sending")).select(
+        orderby=db.outbox.id
+    )
+
+
+def release(db, rows):
+    """Give claimed messages that were not tried back to the queue, due now"""
+    db(db.outbox.id.belongs([row.id for row in rows])).update(
+        status="queued", claim=None, next_attempt_on=datetime.now()
+    )
+
+
+def drain(db, settings, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS, backoff=BACKOFF):
+    """Send one batch of due messages over one SMTP connection, returns its metrics"""
+    t0 = time.time()
+    rows = claim(db, batch_size)
+    batch = dict(messages=len(rows), sent=0, failed=0, retried=0,
+                 connect_ms=0.0, send_ms=0.0, total_ms=0.0)
+    if rows:
+        server = None
+        try:
+            server = connect(settings)
+        except (OSError, smtplib.SMTPException) as e:
+            for row in rows:
+                batch["failed" if retry(db, row, e, max_attempts, backoff) else "retried"] += 1
+        batch["connect_ms"] = (time.time() - t0) * 1000
+        if server:
+            t1 = time.time()
+            try:
+                for k, row in enumerate(rows):
+                    try:
+                        server.send_message(message(row, settings.SMTP_SENDER))
+                        db(db.outbox.id == row.id).update(
+                            status="sent", claim=None, sent_on=datetime.now(),
+                            attempts=(row.attempts or 0) + 1,
+                        )
+                        batch["sent"] += 1
+                    except (OSError, smtplib.SMTPException) as e:
+                        key = "failed" if retry(db, row, e, max_attempts, backoff) else "retried"
+                        batch[key] += 1
+                        if isinstance(e, smtplib.SMTPServerDisconnected):
+                            server = None
+                            # the rest of the batch waits for the next run
+                            release(db, list(rows)[k + 1 :])
+                            break
+            finally:
+                if server:
+                    try:
+                        server.quit()
+                    except (OSError, smtplib.SMTPException):
+                        pass
+            batch["send_ms"] = (time.time() - t1) * 1000
+        db.commit()
+    batch["total_ms"] = (time.time() - t0) * 1000
+    with metrics["lock"]:
+        metrics["batches"] += 1
+        for key in ("sent", "failed", "retried"):
+            metrics[key] += batch[key]
+        metrics["last_batch"] = dict(batch, finished_on=str(datetime.now()))
+    return batch
+
+
+def stats(db):
+    counts = {
+        row.outbox.status: row[db.outbox.id.count()]
+        for row in db(db.outbox).select(
+            db.outbox.status, db.outbox.id.count(), groupby=db.outbox.status
+        )
+    }
+    with metrics["lock"]:
+        totals = {key: value for key, value in metrics.items() if key != "lock"}
+    return dict(counts=counts, **totals)
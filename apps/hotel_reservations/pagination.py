@@ -0,0 +1,133 @@
+"""
+This file defines keyset (cursor) pagination for the list endpoints
+
+A page is ordered by a list of keys whose last one is unique (the id), e.g.
+(name, id) or (start_date, id). The next page starts right after the last
+row of the previous one:
+
+    WHERE name >= 'Kim' AND (name > 'Kim' OR (name = 'Kim' AND id > 42))
+    ORDER BY name, id LIMIT 51
+
+so every page is an index range scan, however deep the client has scrolled,
+and rows inserted or deleted meanwhile do not shift the pages like OFFSET
+does. The cursor handed to the client is the sort key of that last row,
+JSON encoded in URL-safe base64; it is opaque to the client.
+
+A key can be NULL (a customer without a name): the cursor stores it as null
+and the seek predicate places NULLs where the database sorts them, first in
+ascending order on SQLite and MySQL, last on PostgreSQL.
+"""
+
+import base64
+import json
+
+from .availability import to_date
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded for the keys of the endpoint"""
+
+
+def page_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """The limit parameter clamped to [1, maximum]"""
+    try:
+        limit = int(value) if value not in (None, "") else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(values):
+    text = json.dumps(
+        [v if v is None or isinstance(v, (int, float)) else str(v) for v in values]
+    )
+    return base64.urlsafe_b64encode(text.encode("utf8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, keys):
+    """The key values stored in cursor, converted to the types of the keys"""
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf8")
+        values = json.loads(text)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("wrong number of values")
+        return [convert(key, value) for key, value in zip(keys, values)]
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor("Invalid cursor: %s" % e)
+
+
+def convert(field, value):
+    if value is None:
+        return None
+    if field.type == "date":
+        return to_date(value)
+    if field.type in ("id", "integer", "bigint") or field.type.startswith("reference"):
+        return int(value)
+    if field.type == "double":
+        return float(value)
+    return str(value)
+
+
+def nulls_sort_last(db):
+    """Whether the database sorts NULLs after the other values in ascending order"""
+    return db._dbname.split(":")[0] == "postgres"
+
+
+def after(keys, values, descending=False, nulls_last=False):
+    """
+    The seek predicate: rows that come after values in the (keys) order.
+    nulls_last tells where NULLs are in ascending order (nulls_sort_last)
+    """
+    # where NULLs are in the order of this page
+    nulls_after = nulls_last != descending
+
+    def beyond(field, value):
+        if value is None:
+            # everything else comes after the NULLs, or nothing does
+            return None if nulls_after else field != None
+        term = (field < value) if descending else (field > value)
+        return term | (field == None) if nulls_after else term
+
+    query = None
+    for k in range(len(keys)):
+        term = beyond(keys[k], values[k])
+        if term is None:
+            continue
+        for key, value in zip(keys[:k], values[:k]):
+            term = (key == value) & term
+        query = term if query is None else query | term
+    # a redundant bound on the leading key lets the planner use a range scan
+    if values[0] is not None and not nulls_after:
+        query = ((keys[0] <= values[0]) if descending else (keys[0] >= values[0])) & query
+    return query
+
+
+def paginate(db, query, keys, limit=None, cursor=None, descending=False, **attributes):
+    """
+    Select one page of db(query) ordered by keys. Extra arguments are passed
+    to select (fields go in attributes["fields"]). Returns (rows, next_cursor),
+    next_cursor is None on the last page
+    """
+    limit = page_limit(limit)
+    if cursor:
+        query = query & after(
+            keys, decode_cursor(cursor, keys), descending, nulls_sort_last(db)
+        )
+    orderby = None
+    for key in keys:
+        key = ~key if descending else key
+        orderby = key if orderby is None else orderby | key
+    fields = attributes.pop("fields", ())
+    # one extra row tells whether there is a next page
+    rows = db(query).select(
+        *fields, orderby=orderby, limitby=(0, limit + 1), orderby_on_limitby=False, **attributes
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[limit - 1]
+        next_cursor = encode_cursor([last[str(key)] for key in keys])
+    return rows, next_cursor
@@ -0,0 +1,138 @@
+"""
+This file maintains db.daily_room_stats, the daily occupancy and revenue rollup
+
+One row per (day, room) with at least one booked night: occupied is the
+number of reservations covering that night (1, unless something went wrong)
+and revenue the share of their total_cost earned that night (total_cost
+divided by the number of nights). Reports read these rows instead of
+expanding every reservation into nights on each request.
+
+add() and remove() run inside the transaction that inserts or deletes the
+reservations, so the rollup commits or rolls back with them; the actions
+call them between the write and their db.commit(). rebuild() recomputes the
+whole table from db.reservations, for repair (tasks.py schedules it).
+
+rebuild() runs in the database: one INSERT ... SELECT ... GROUP BY per range
+of REBUILD_DAYS days, which expands the reservations overlapping the range
+into nights with a recursive query, so neither the reservations nor the
+nights ever come to Python. It locks the rollup against the bookings first
+(the DELETE takes SQLite's write lock, PostgreSQL locks the table), so a
+booking committed meanwhile cannot be wiped or counted twice: its add()
+waits for the rebuild to commit and then applies to the rebuilt rows.
+"""
+
+from datetime import timedelta
+
+from .availability import to_date
+from .bulk import placeholder
+
+REBUILD_DAYS = 92
+
+# the nights of the reservations overlapping [lo, hi), counted per (day, room)
+REBUILD_SQL = dict(
+    sqlite="""
+WITH RECURSIVE nights(room_id, day, end_date, share) AS (
+    SELECT room_id, start_date, end_date,
+           COALESCE(total_cost, 0) * 1.0 / (julianday(end_date) - julianday(start_date))
+    FROM {reservations}
+    WHERE start_date < end_date AND start_date < {p} AND end_date > {p}
+    UNION ALL
+    SELECT room_id, DATE(day, '+1 day'), end_date, share FROM nights
+    WHERE DATE(day, '+1 day') < end_date AND DATE(day, '+1 day') < {p}
+)
+INSERT INTO {stats} (day, room_id, occupied, revenue)
+SELECT day, room_id, COUNT(*), SUM(share) FROM nights
+WHERE day >= {p}
+GROUP BY day, room_id;
+""",
+    postgres="""
+WITH RECURSIVE nights(room_id, day, end_date, share) AS (
+    SELECT room_id, start_date, end_date,
+           COALESCE(total_cost, 0) / (end_date - start_date)
+    FROM {reservations}
+    WHERE start_date < end_date AND start_date < {p} AND end_date > {p}
+    UNION ALL
+    SELECT room_id, day + 1, end_date, share FROM nights
+    WHERE day + 1 < end_date AND day + 1 < {p}
+)
+INSERT INTO {stats} (day, room_id, occupied, revenue)
+SELECT day, room_id, COUNT(*), SUM(share) FROM nights
+WHERE day >= {p}
+GROUP BY day, room_id;
+""",
+)
+
+
+def nights(reservation):
+    """(first night, number of nights, revenue per night) of a reservation"""
+    start = to_date(reservation["start_date"])
+    count = (to_date(reservation["end_date"]) - start).days
+    share = float(reservation.get("total_cost") or 0) / count if count > 0 else 0.0
+    return start, count, share
+
+
+def apply(db, reservation, sign):
+    start, count, share = nights(reservation)
+    if count <= 0:
+        return
+    stats = db.daily_room_stats
+    end = start + timedelta(days=count)
+    in_stay = (
+        (stats.room_id == reservation["room_id"]) & (stats.day >= start) & (stats.day < end)
+    )
+    # one UPDATE for the nights that already have a row...
+    db(in_stay).update(
+        occupied=stats.occupied + sign, revenue=stats.revenue + sign * share
+    )
+    if sign > 0:
+        # ...and one insert per night that has none
+        existing = {to_date(row.day) for row in db(in_stay).select(stats.day)}
+        stats.bulk_insert([
+            dict(day=day, room_id=reservation["room_id"], occupied=1, revenue=share)
+            for day in (start + timedelta(days=k) for k in range(count))
+            if day not in existing
+        ])
+    else:
+        db(in_stay & (stats.occupied <= 0)).delete()
+
+
+def add(db, reservations):
+    """Count reservations (dicts or rows of db.reservations) into the rollup"""
+    for reservation in reservations:
+        apply(db, reservation, 1)
+
+
+def remove(db, reservations):
+    """Take reservations (they need room_id, dates and total_cost) out of the rollup"""
+    for reservation in reservations:
+        apply(db, reservation, -1)
+
+
+def rebuild(db, days=REBUILD_DAYS):
+    """
+    Recompute daily_room_stats from scratch in the caller's transaction, which
+    should commit right after. Returns the number of rows
+    """
+    dialect = db._dbname.split(":")[0]
+    if dialect not in REBUILD_SQL:
+        raise NotImplementedError("rollup.rebuild supports SQLite and PostgreSQL")
+    stats = db.daily_room_stats
+    if dialect == "postgres":
+        # bookings wait to update the rollup until the rebuild commits
+        db.executesql("LOCK TABLE %s IN EXCLUSIVE MODE;" % stats._rname)
+    db(stats).delete()
+    row = db(db.reservations).select(
+        db.reservations.start_date.min(), db.reservations.end_date.max()
+    ).first()
+    first, last = row[db.reservations.start_date.min()], row[db.reservations.end_date.max()]
+    if not first:
+        return 0
+    sql = REBUILD_SQL[dialect].format(
+        reservations=db.reservations._rname, stats=stats._rname, p=placeholder(db)
+    )
+    lo = to_date(first)
+    while lo < to_date(last):
+        hi = lo + timedelta(days=days)
+        db.executesql(sql, placeholders=(str(hi), str(lo), str(hi), str(lo)))
+        lo = hi
+    return db(stats).count()
@@ -0,0 +1,78 @@
+"""
+This file defines the room catalog cache
+
+The rooms change a few times a week and are read on every booking page,
+chart and room list. Their serialized payloads (room dicts with the image
+URLs already built, and the api/rooms pages) are kept in the app's LRU cache
+(common.cache) for ttl seconds, under keys that include the data version of
+db.rooms (versions.py). Any write to the rooms, from any process, moves to a
+new version: the old entries are never read again and age out of the LRU.
+
+hits and misses count the lookups since the process started.
+"""
+
+import threading
+
+from pydal.objects import Row
+
+from . import images
+from .common import cache
+from .versions import versions
+
+
+class RoomCatalog:
+    def __init__(self, cache, ttl=300):
+        self.cache = cache
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db, key, build):
+        """The cached payload of key, build() on a miss"""
+        built = []
+
+        def miss():
+            built.append(True)
+            return build()
+
+        # read before build() reads the rooms, see versions.py
+        self.generation = versions.get(db, "rooms")["rooms"]
+        value = self.cache.get(("rooms", self.generation) + tuple(key), miss, self.ttl)
+        with self.lock:
+            if built:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def rooms(self, db, url):
+        """Every room, by id, as a Row (attribute access, serialized as a dict)"""
+        def build():
+            return [room_payload(room, url) for room in db(db.rooms).select(orderby=db.rooms.id)]
+
+        return self.get(db, ("all",), build)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_ratio=round(self.hits / lookups, 4) if lookups else None,
+                generation=self.generation,
+                ttl=self.ttl,
+            )
+
+
+def room_payload(room, url):
+    """The serialized form of a rooms row, with the image links"""
+    payload = Row(room.as_dict())
+    if payload.get("image"):
+        payload["image_url"] = url("download", payload["image"])
+        payload.update(images.urls(url, payload["image"]))
+    return payload
+
+
+room_catalog = RoomCatalog(cache)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Bulk import of the room catalog from CSV or JSON
+
+Run it from the folder that contains apps/, against the app's database:
+
+    python -m apps.hotel_reservations.room_import rooms.csv
+    python -m apps.hotel_reservations.room_import rooms.ndjson --chunk-size 2000
+    python -m apps.hotel_reservations.room_import --sample
+
+Every record has number_of_beds (or beds), amenities (a comma separated
+string, or a list in JSON), price_per_night (or price) and optionally code,
+the external room code. Records are checked with the rules of add_room;
+a record whose code is already in db.rooms updates that room, the others
+are inserted. JSON files hold a list of records (or {"rooms": [...]}),
+.ndjson/.jsonl files one record per line and are read as a stream.
+
+The records go through in chunks of chunk_size, each one its own transaction:
+one lookup of the codes, one bulk_insert of the new rooms, one bulk_insert
+of their amenity links. Invalid records are reported with their line (or
+position) and skipped. A running app picks the imported rooms up on its
+own: its amenity index and its room cache follow the data versions of the
+tables (versions.py).
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import time
+
+from .amenities import sync_rooms
+from .cli import boot
+
+CHUNK_SIZE = 1000
+ALIASES = dict(beds="number_of_beds", price="price_per_night", room_code="code")
+SAMPLE_ROOMS = [
+    dict(code="SAMPLE-101", number_of_beds=1, price_per_night=89.99,
+         amenities="WiFi, Air Conditioning, TV, Private Bathroom"),
+    dict(code="SAMPLE-102", number_of_beds=2, price_per_night=129.99,
+         amenities="WiFi, Air Conditioning, TV, Private Bathroom, Mini Fridge"),
+    dict(code="SAMPLE-103", number_of_beds=2, price_per_night=149.99,
+         amenities="WiFi, Air Conditioning, TV, Private Bathroom, Mini Fridge, Balcony"),
+    dict(code="SAMPLE-104", number_of_beds=1, price_per_night=109.99,
+         amenities="WiFi, Air Conditioning, TV, Private Bathroom, Kitchenette"),
+    dict(code="SAMPLE-105", number_of_beds=3, price_per_night=189.99,
+         amenities="WiFi, Air Conditioning, TV, Private Bathroom, Mini Fridge, Balcony, Sofa Bed"),
+    dict(code="SAMPLE-106", number_of_beds=2, price_per_night=199.99,
+         amenities="WiFi, Air Conditioning, TV, Private Bathroom, Jacuzzi, Balcony"),
+]
+
+
+class InvalidRoom(ValueError):
+    pass
+
+
+def clean_room(data):
+    """The db.rooms values of a record, checked like add_room; raises InvalidRoom"""
+    if not isinstance(data, dict):
+        raise InvalidRoom("Not a room record")
+    for field in ("number_of_beds", "amenities", "price_per_night"):
+        if not data.get(field):
+            raise InvalidRoom(f"Missing required field: {field}")
+    try:
+        beds = int(data["number_of_beds"])
+        price = float(data["price_per_night"])
+    except (TypeError, ValueError):
+        raise InvalidRoom("Invalid number format")
+    if beds < 1 or beds > 5:
+        raise InvalidRoom("Number of beds must be between 1 and 5")
+    if price <= 0:
+        raise InvalidRoom("Price must be greater than 0")
+    amenities = data["amenities"]
+    if isinstance(amenities, (list, tuple)):
+        amenities = ", ".join(str(name) for name in amenities)
+    amenities = str(amenities).strip()
+    if not amenities:
+        raise InvalidRoom("Amenities cannot be empty")
+    code = str(data.get("code") or "").strip() or None
+    return dict(code=code, number_of_beds=beds, amenities=amenities, price_per_night=price)
+
+
+def normalize(record, aliases=ALIASES):
+    if not isinstance(record, dict):
+        return None
+    keys = ((str(key or "").strip().lower(), value) for key, value in record.items())
+    return {aliases.get(key, key): value for key, value in keys}
+
+
+def read_records(path, format=None, key="rooms", aliases=ALIASES):
+    """
+    (line or position, record) of every record of a CSV, JSON or NDJSON file;
+    a JSON object holds its records under key
+    """
+    format = format or path.rsplit(".", 1)[-1].lower()
+    with open(path, newline="", encoding="utf-8-sig") as stream:
+        if format == "csv":
+            reader = csv.DictReader(stream)
+            for record in reader:
+                yield reader.line_num, normalize(record, aliases)
+        elif format in ("ndjson", "jsonl"):
+            for line, text in enumerate(stream, 1):
+                if text.strip():
+                    try:
+                        yield line, normalize(json.loads(text), aliases)
+                    except ValueError:
+                        yield line, None
+        elif format == "json":
+            records = json.load(stream)
+            if isinstance(records, dict):
+                records = records.get(key) or []
+            for position, record in enumerate(records, 1):
+                yield position, normalize(record, aliases)
+        else:
+            raise ValueError("Unknown format: %s (csv, json, ndjson)" % format)
+
+
+def import_chunk(db, records):
+    """Insert or update one chunk of (line, record), in the caller's transaction"""
+    stats = dict(inserted=0, updated=0, unchanged=0, invalid=0, errors=[])
+    by_code = {}
+    without_code = []
+    for line, record in records:
+        try:
+            values = clean_room(record)
+        except InvalidRoom as e:
+            stats["invalid"] += 1
+            stats["errors"].append((line, str(e)))
+            continue
+        if values["code"]:
+            # the last record of a code wins
+            by_code[values["code"]] = values
+        else:
+            without_code.append(values)
+
+    existing = {
+        row.code: row
+        for row in db(db.rooms.code.belongs(list(by_code))).select(
+            db.rooms.id,
+            db.rooms.code,
+            db.rooms.number_of_beds,
+            db.rooms.amenities,
+            db.rooms.price_per_night,
+        )
+    } if by_code else {}
+    texts = {}
+    for code, row in existing.items():
+        values = by_code.pop(code)
+        if all(row[key] == value for key, value in values.items()):
+            stats["unchanged"] += 1
+            continue
+        db(db.rooms.id == row.id).update(**values)
+        stats["updated"] += 1
+        if values["amenities"] != row.amenities:
+            texts[row.id] = values["amenities"]
+
+    new = list(by_code.values()) + without_code
+    ids = db.rooms.bulk_insert(new) if new else []
+    stats["inserted"] = len(new)
+    texts.update((room_id, values["amenities"]) for room_id, values in zip(ids, new))
+    if texts:
+        sync_rooms(db, texts)
+    return stats
+
+
+def import_rooms(db, records, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Import (line, record) pairs in chunks, committing each chunk.
+    progress(totals) is called after every chunk. Returns the totals
+    """
+    totals = dict(records=0, inserted=0, updated=0, unchanged=0, invalid=0, errors=[],
+                  chunks=0, elapsed=0.0, rows_per_sec=0.0)
+    t0 = time.time()
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        try:
+            stats = import_chunk(db, chunk)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        totals["records"] += len(chunk)
+        totals["chunks"] += 1
+        for key in ("inserted", "updated", "unchanged", "invalid"):
+            totals[key] += stats[key]
+        totals["errors"].extend(stats["errors"])
+        totals["elapsed"] = time.time() - t0
+        totals["rows_per_sec"] = totals["records"] / totals["elapsed"] if totals["elapsed"] else 0.0
+        if progress:
+            progress(totals)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("path", nargs="?", help="CSV, JSON or NDJSON file")
+    parser.add_argument("--format", choices=["csv", "json", "ndjson"], default=None,
+                        help="file format (default: from the extension)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="records per transaction")
+    parser.add_argument("--sample", action="store_true", help="import the six sample rooms")
+    parser.add_argument("--max-errors", type=int, default=20, help="invalid records to list")
+    args = parser.parse_args()
+    if not args.path and not args.sample:
+        parser.error("give a file to import, or --sample")
+
+    boot()
+    from .models import db
+
+    records = (
+        enumerate(SAMPLE_ROOMS, 1) if args.sample else read_records(args.path, args.format)
+    )
+
+    def progress(totals):
+        print(f"chunk {totals['chunks']}: {totals['records']} records,"
+              f" {totals['rows_per_sec']:.0f} rows/sec")
+
+    totals = import_rooms(db, records, args.chunk_size, progress)
+    print(f"records:   {totals['records']}")
+    print(f"inserted:  {totals['inserted']}")
+    print(f"updated:   {totals['updated']}")
+    print(f"unchanged: {totals['unchanged']}")
+    print(f"invalid:   {totals['invalid']}")
+    print(f"elapsed:   {totals['elapsed']:.2f}s")
+    print(f"rows/sec:  {totals['rows_per_sec']:.1f}")
+    for line, error in totals["errors"][: args.max_errors]:
+        print(f"  line {line}: {error}")
+    if len(totals["errors"]) > args.max_errors:
+        print(f"  ... and {len(totals['errors']) - args.max_errors} more")
+    db.close()
+    return 1 if totals["invalid"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
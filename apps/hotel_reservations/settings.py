@@ -20,7 +20,8 @@ APP_NAME = os.path.split(APP_FOLDER)[-1]
 # DB_FOLDER:    Sets the place where migration files will be created
 #               and is the store location for SQLite databases
 DB_FOLDER = required_folder(APP_FOLDER, "databases")
-DB_URI = "sqlite://storage.db"
+# HOTEL_DB_URI lets tools (benchmark.py) run the app against another database
+DB_URI = os.environ.get("HOTEL_DB_URI") or "sqlite://storage.db"
 DB_POOL_SIZE = 1
 DB_MIGRATE = True
 DB_FAKE_MIGRATE = False
@@ -58,6 +59,7 @@ SMTP_SERVER = None
 SMTP_SENDER = "you@example.com"
 SMTP_LOGIN = "username:password"
 SMTP_TLS = False
+OUTBOX_BATCH_SIZE = 50  # messages sent per SMTP connection by the send_outbox task
 
 # session settings
 SESSION_TYPE = "cookies"
@@ -70,6 +72,10 @@ LOGGERS = [
     "warning:stdout"
 ]  # syntax "severity:filename:format" filename can be stderr or stdout
 
+# structured request logging (common.log): fraction of info/debug records kept
+# per route prefix, e.g. {"api/calendar": 0.05}; warnings and errors are always kept
+LOG_SAMPLING = {}
+
 # Disable default login when using OAuth
 DEFAULT_LOGIN_ENABLED = True
 
@@ -113,6 +119,17 @@ T_FOLDER = required_folder(APP_FOLDER, "translations")
 USE_SCHEDULER = False
 SCHEDULER_MAX_CONCURRENT_RUNS = 1
 
+# Invoices (rendered by the generate_invoices scheduler task)
+INVOICE_BATCH_SIZE = 100
+INVOICE_PROCESSES = None  # worker processes, None for one per CPU
+
+# Bulk customer import (api/manager/customers/import): password hashing processes
+IMPORT_PROCESSES = None  # None for one per CPU
+
+# Request metrics (the metrics action): when set, scrapers must send
+# "Authorization: Bearer <token>"; None leaves the endpoint open
+METRICS_TOKEN = None
+
 # Celery settings (alternative to the build-in scheduler)
 USE_CELERY = False
 CELERY_BROKER = "redis://localhost:6379/0"
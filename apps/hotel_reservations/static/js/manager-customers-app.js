@@ -1,30 +1,91 @@
-const { useState, useEffect } = React;
+const { useState, useEffect, useRef } = React;
+
+const CUSTOMERS_API = '/hotel_reservations/api/manager/customers';
+const PAGE_SIZE = 50;
+
+const pageUrl = (base, cursor) => {
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    return `${base}?${params}`;
+};
 
 const ManagerCustomers = () => {
     const [customers, setCustomers] = useState([]);
     const [filteredCustomers, setFilteredCustomers] = useState([]);
     const [searchTerm, setSearchTerm] = useState('');
+    const [searchResults, setSearchResults] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [selectedCustomer, setSelectedCustomer] = useState(null);
     const [showModal, setShowModal] = useState(false);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
+    const sentinel = useRef(null);
+    const fetching = useRef(false);
 
     useEffect(() => {
-        fetchCustomers();
+        fetchCustomers(null);
     }, []);
 
     useEffect(() => {
-        const filtered = customers.filter(customer =>
-            customer.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-            customer.email.toLowerCase().includes(searchTerm.toLowerCase()) ||
-            customer.phone_number.includes(searchTerm)
+        const term = searchTerm.toLowerCase();
+        const local = customers.filter(customer =>
+            customer.name.toLowerCase().includes(term) ||
+            customer.email.toLowerCase().includes(term) ||
+            (customer.phone_number || '').includes(searchTerm)
         );
-        setFilteredCustomers(filtered);
-    }, [searchTerm, customers]);
+        if (!searchTerm) {
+            setFilteredCustomers(local);
+            return;
+        }
+        // the server ranks matches among all the customers, not only the loaded pages
+        const seen = new Set(searchResults.map(c => c.id));
+        setFilteredCustomers(searchResults.concat(local.filter(c => !seen.has(c.id))));
+    }, [searchTerm, searchResults, customers]);
+
+    useEffect(() => {
+        if (!searchTerm.trim()) {
+            setSearchResults([]);
+            return;
+        }
+        const timer = setTimeout(async () => {
+            try {
+                const params = new URLSearchParams({ q: searchTerm, limit: PAGE_SIZE });
+                const response = await fetch(`${CUSTOMERS_API}/search?${params}`);
+                const data = await response.json();
+                setSearchResults(data.customers || []);
+            } catch (err) {
+                console.error("Error searching customers:", err);
+            }
+        }, 250);
+        return () => clearTimeout(timer);
+    }, [searchTerm]);
 
-    const fetchCustomers = async () => {
+    // infinite scroll: load the next page when the end of the table comes into view
+    useEffect(() => {
+        if (!sentinel.current || !nextCursor || searchTerm) {
+            return;
+        }
+        const observer = new IntersectionObserver((entries) => {
+            if (entries[0].isIntersecting) {
+                fetchCustomers(nextCursor);
+            }
+        }, { rootMargin: '400px' });
+        observer.observe(sentinel.current);
+        return () => observer.disconnect();
+    }, [nextCursor, searchTerm, loading]);
+
+    const fetchCustomers = async (cursor) => {
+        // the observer can fire again before the next cursor is in the state
+        if (fetching.current) {
+            return;
+        }
+        fetching.current = true;
+        setLoadingMore(true);
         try {
-            const response = await fetch('/hotel_reservations/api/manager/customers');
+            const response = await fetch(pageUrl(CUSTOMERS_API, cursor));
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -32,17 +93,17 @@ const ManagerCustomers = () => {
 
             const data = await response.json();
 
-            const sortedCustomers = (data.customers || []).sort((a, b) =>
-                a.name.localeCompare(b.name)
-            );
-
-            setCustomers(sortedCustomers);
-            setFilteredCustomers(sortedCustomers);
+            // pages come sorted by name from the server
+            setCustomers(previous => cursor ? previous.concat(data.customers || []) : (data.customers || []));
+            setNextCursor(data.next_cursor || null);
             setLoading(false);
         } catch (err) {
             console.error("Error fetching customers:", err);
             setError("Failed to load customers");
             setLoading(false);
+        } finally {
+            fetching.current = false;
+            setLoadingMore(false);
         }
     };
 
@@ -99,12 +160,12 @@ const ManagerCustomers = () => {
                 <div className="level mt-4 mb-3">
                     <div className="level-left">
                         <p className="has-text-grey">
-                            Showing {filteredCustomers.length} of {customers.length} customers
+                            Showing {filteredCustomers.length} of {customers.length}{nextCursor ? '+' : ''} customers
                         </p>
                     </div>
                     <div className="level-right">
                         <div className="tags">
-                            <span className="tag is-info">Total: {customers.length}</span>
+                            <span className="tag is-info">Loaded: {customers.length}</span>
                         </div>
                     </div>
                 </div>
@@ -163,6 +224,11 @@ const ManagerCustomers = () => {
                                 ))}
                             </tbody>
                         </table>
+                        {nextCursor && !searchTerm && (
+                            <div ref={sentinel} className="has-text-centered has-text-grey p-3">
+                                {loadingMore ? 'Loading more customers...' : ''}
+                            </div>
+                        )}
                     </div>
                 )}
 
@@ -188,17 +254,19 @@ const ManagerCustomers = () => {
 
 const CustomerDetailsModal = ({ customer, onClose }) => {
     const [reservations, setReservations] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
-        fetchCustomerReservations();
+        fetchCustomerReservations(null);
     }, [customer.id]);
 
-    const fetchCustomerReservations = async () => {
+    const fetchCustomerReservations = async (cursor) => {
         try {
-            const response = await fetch(`/hotel_reservations/api/manager/customers/${customer.id}/reservations`);
+            const response = await fetch(pageUrl(`${CUSTOMERS_API}/${customer.id}/reservations`, cursor));
             const data = await response.json();
-            setReservations(data.reservations || []);
+            setReservations(previous => cursor ? previous.concat(data.reservations || []) : (data.reservations || []));
+            setNextCursor(data.next_cursor || null);
             setLoading(false);
         } catch (err) {
             console.error("Error fetching reservations:", err);
@@ -354,7 +422,7 @@ const CustomerDetailsModal = ({ customer, onClose }) => {
                             <div className="level-right">
                                 <div className="tags">
                                     <span className="tag is-primary">
-                                        Total: {reservations.length}
+                                        Shown: {reservations.length}{nextCursor ? '+' : ''}
                                     </span>
                                 </div>
                             </div>
@@ -419,6 +487,16 @@ const CustomerDetailsModal = ({ customer, onClose }) => {
                                         })}
                                     </tbody>
                                 </table>
+                                {nextCursor && (
+                                    <div className="has-text-centered">
+                                        <button
+                                            className="button is-small is-light"
+                                            onClick={() => fetchCustomerReservations(nextCursor)}
+                                        >
+                                            Load more
+                                        </button>
+                                    </div>
+                                )}
                             </div>
                         )}
                     </div>
@@ -4,6 +4,9 @@ class RoomManager {
         this.rooms = [];
         this.filteredRooms = [];
         this.editingRoom = null;
+        this.nextCursor = null;
+        this.loadingMore = false;
+        this.summary = null;
 
         this.initializeElements();
         this.bindEvents();
@@ -15,6 +18,7 @@ class RoomManager {
         this.searchInput = document.getElementById('search-input');
         this.loadingDiv = document.getElementById('loading');
         this.noRoomsDiv = document.getElementById('no-rooms');
+        this.sentinel = document.getElementById('rooms-sentinel');
         this.alertContainer = document.getElementById('alert-container');
         this.modal = document.getElementById('room-modal');
         this.modalTitle = document.getElementById('modal-title');
@@ -50,17 +54,33 @@ class RoomManager {
                 this.closeModal();
             }
         });
+
+        // infinite scroll: fetch the next page when the end of the grid comes into view
+        new IntersectionObserver((entries) => {
+            if (entries[0].isIntersecting) {
+                this.loadMoreRooms();
+            }
+        }, { rootMargin: '400px' }).observe(this.sentinel);
+    }
+
+    roomsPageUrl(cursor) {
+        const params = new URLSearchParams({ limit: 60 });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        return `${window.roomsApiUrl}?${params}`;
     }
 
     async loadRooms() {
         this.showLoading(true);
         try {
-            const response = await fetch(window.roomsApiUrl);
+            const response = await fetch(this.roomsPageUrl(null));
             const data = await response.json();
 
             this.rooms = data.rooms || [];
-            this.filteredRooms = [...this.rooms];
-            this.renderRooms();
+            this.nextCursor = data.next_cursor || null;
+            this.summary = data.summary || null;
+            this.filterRooms();
             this.updateStats();
         } catch (error) {
             console.error('Error loading rooms:', error);
@@ -70,6 +90,24 @@ class RoomManager {
         }
     }
 
+    async loadMoreRooms() {
+        if (!this.nextCursor || this.loadingMore) return;
+        this.loadingMore = true;
+        try {
+            const response = await fetch(this.roomsPageUrl(this.nextCursor));
+            const data = await response.json();
+
+            this.rooms = this.rooms.concat(data.rooms || []);
+            this.nextCursor = data.next_cursor || null;
+            this.filterRooms();
+        } catch (error) {
+            console.error('Error loading rooms:', error);
+            this.showAlert('Failed to load more rooms. Please try again.', 'danger');
+        } finally {
+            this.loadingMore = false;
+        }
+    }
+
     renderRooms() {
         if (this.filteredRooms.length === 0) {
             this.roomsGrid.innerHTML = '';
@@ -133,6 +171,15 @@ class RoomManager {
     }
 
     updateStats() {
+        if (this.summary) {
+            // the summary covers every room, not only the pages loaded so far
+            this.totalRoomsEl.textContent = this.summary.total;
+            this.avgPriceEl.textContent = `$${this.summary.avg_price.toFixed(2)}`;
+            this.minPriceEl.textContent = `$${this.summary.min_price.toFixed(2)}`;
+            this.maxPriceEl.textContent = `$${this.summary.max_price.toFixed(2)}`;
+            return;
+        }
+
         if (this.rooms.length === 0) {
             this.totalRoomsEl.textContent = '0';
             this.avgPriceEl.textContent = '$0';
@@ -274,13 +321,21 @@ class RoomManager {
         }
     }
 
+    async fetchReservations(roomId, cursor) {
+        const params = new URLSearchParams({ limit: 50 });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        const response = await fetch(`${window.managerRoomsApiUrl}/${roomId}/reservations?${params}`);
+        return response.json();
+    }
+
     async viewReservations(roomId) {
         try {
-            const response = await fetch(`${window.managerRoomsApiUrl}/${roomId}/reservations`);
-            const result = await response.json();
+            const result = await this.fetchReservations(roomId, null);
 
             if (result.success) {
-                this.showReservationsModal(roomId, result.reservations);
+                this.showReservationsModal(roomId, result.reservations, result.next_cursor);
             } else {
                 this.showAlert(result.error, 'danger');
             }
@@ -290,7 +345,18 @@ class RoomManager {
         }
     }
 
-    showReservationsModal(roomId, reservations) {
+    reservationRows(reservations) {
+        return reservations.map(res => `
+            <tr>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">${res.customer_name}</td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">${this.formatDate(res.start_date)}</td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">${this.formatDate(res.end_date)}</td>
+                <td style="padding: 10px; border-bottom: 1px solid #eee;">${res.total_cost.toFixed(2)}</td>
+            </tr>
+        `).join('');
+    }
+
+    showReservationsModal(roomId, reservations, nextCursor) {
         const modal = document.createElement('div');
         modal.className = 'modal active';
         modal.innerHTML = `
@@ -312,17 +378,15 @@ class RoomManager {
                                 </tr>
                             </thead>
                             <tbody>
-                                ${reservations.map(res => `
-                                    <tr>
-                                        <td style="padding: 10px; border-bottom: 1px solid #eee;">${res.customer_name}</td>
-                                        <td style="padding: 10px; border-bottom: 1px solid #eee;">${this.formatDate(res.start_date)}</td>
-                                        <td style="padding: 10px; border-bottom: 1px solid #eee;">${this.formatDate(res.end_date)}</td>
-                                        <td style="padding: 10px; border-bottom: 1px solid #eee;">${res.total_cost.toFixed(2)}</td>
-                                    </tr>
-                                `).join('')}
+                                ${this.reservationRows(reservations)}
                             </tbody>
                         </table>`
             }
+                    <div style="text-align: center; margin-top: 10px;">
+                        <button class="btn btn-secondary btn-small load-more" style="display: ${nextCursor ? 'inline-block' : 'none'};">
+                            Load more
+                        </button>
+                    </div>
                 </div>
                 <div style="text-align: right; margin-top: 20px;">
                     <button class="btn btn-secondary" onclick="this.closest('.modal').remove()">Close</button>
@@ -332,6 +396,27 @@ class RoomManager {
 
         document.body.appendChild(modal);
 
+        let cursor = nextCursor;
+        const loadMore = modal.querySelector('.load-more');
+        loadMore.addEventListener('click', async () => {
+            loadMore.disabled = true;
+            try {
+                const result = await this.fetchReservations(roomId, cursor);
+                if (!result.success) {
+                    this.showAlert(result.error, 'danger');
+                    return;
+                }
+                modal.querySelector('tbody').insertAdjacentHTML('beforeend', this.reservationRows(result.reservations));
+                cursor = result.next_cursor;
+                loadMore.style.display = cursor ? 'inline-block' : 'none';
+            } catch (error) {
+                console.error('Error loading reservations:', error);
+                this.showAlert('Failed to load reservations. Please try again.', 'danger');
+            } finally {
+                loadMore.disabled = false;
+            }
+        });
+
         modal.addEventListener('click', (e) => {
             if (e.target === modal) {
                 modal.remove();
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Multi-threaded stress test for the booking coordinator
+
+Many threads book random stays on a few rooms against a scratch database,
+the way the controllers do (insert inside booking.rooms(), which commits),
+then the script counts overlapping reservations (double-bookings) and
+reports bookings per second. It exits with status 1 if the coordinator let
+a double-booking through.
+
+Run it from the folder that contains apps/:
+
+    python -m apps.hotel_reservations.stress_booking --threads 16 --rooms 8
+    python -m apps.hotel_reservations.stress_booking --mode unlocked
+    python -m apps.hotel_reservations.stress_booking --uri postgres://user:pw@localhost/stress
+
+--mode unlocked runs the old check-then-insert without locks, to show what
+the coordinator prevents; --mode global uses a single lock stripe to show
+the cost of serializing every booking; --mode all runs the three in turn.
+On SQLite every write transaction takes the database-wide lock, so
+different rooms only truly proceed in parallel on PostgreSQL.
+
+booking.py belongs to the app, so the app is loaded first (cli.boot), on an
+in-memory database unless HOTEL_DB_URI says otherwise: the stress itself
+only touches the scratch database.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from pydal import DAL, Field
+
+from .cli import boot
+
+MODES = ("striped", "global", "unlocked")
+
+
+def make_db(uri=None, folder=None):
+    folder = folder or tempfile.mkdtemp(prefix="stress_booking_")
+    db = DAL(uri or "sqlite://stress.db", folder=folder, pool_size=0)
+    db.define_table("rooms", Field("number_of_beds", "integer"))
+    db.define_table(
+        "reservations",
+        Field("room_id", "reference rooms"),
+        Field("start_date", "date"),
+        Field("end_date", "date"),
+    )
+    db(db.reservations).delete()
+    db(db.rooms).delete()
+    db.commit()
+    return db
+
+
+def count_double_bookings(db):
+    return db.executesql(
+        "SELECT COUNT(*) FROM reservations a JOIN reservations b"
+        " ON a.room_id = b.room_id AND a.id < b.id"
+        " AND a.start_date < b.end_date AND a.end_date > b.start_date;"
+    )[0][0]
+
+
+def random_stay(rng, horizon):
+    start = date.today() + timedelta(days=rng.randrange(horizon))
+    end = start + timedelta(days=rng.randint(1, 5))
+    return str(start), str(end)
+
+
+def worker(db, coordinator, mode, room_ids, attempts, horizon, seed, stats):
+    from .booking import RoomUnavailable
+
+    rng = random.Random(seed)
+    booked = conflicts = 0
+    for _ in range(attempts):
+        room_id = rng.choice(room_ids)
+        start_date, end_date = random_stay(rng, horizon)
+        leg = dict(room_id=room_id, start_date=start_date, end_date=end_date)
+        if mode == "unlocked":
+            if coordinator.conflict(room_id, start_date, end_date):
+                conflicts += 1
+                continue
+            time.sleep(0)  # let another thread in between check and insert
+            db.reservations.insert(**leg)
+            db.commit()
+            booked += 1
+            continue
+        try:
+            # as make_reservation: more writes in the transaction, then the commit
+            with coordinator.rooms([room_id]):
+                coordinator.insert([leg])
+                time.sleep(0)  # let another thread in between insert and commit
+            booked += 1
+        except RoomUnavailable:
+            conflicts += 1
+    # close this thread's connection only, db.close() tears down the whole DAL
+    db._adapter.close()
+    with stats["lock"]:
+        stats["booked"] += booked
+        stats["conflicts"] += conflicts
+
+
+def stress(db, mode="striped", threads=16, rooms=8, attempts=200, horizon=60):
+    """
+    Book from threads on new rooms of db (from make_db) in mode, returns
+    booked, conflicts, elapsed, attempts_per_sec, bookings_per_sec and
+    double_bookings
+    """
+    from .booking import BookingCoordinator
+
+    db(db.reservations).delete()
+    db(db.rooms).delete()
+    room_ids = [db.rooms.insert(number_of_beds=1) for _ in range(rooms)]
+    db.commit()
+    coordinator = BookingCoordinator(db, stripes=1 if mode == "global" else 64)
+
+    stats = dict(lock=threading.Lock(), booked=0, conflicts=0)
+    workers = [
+        threading.Thread(
+            target=worker,
+            args=(db, coordinator, mode, room_ids, attempts, horizon, k, stats),
+        )
+        for k in range(threads)
+    ]
+    t0 = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.time() - t0
+    return dict(
+        booked=stats["booked"],
+        conflicts=stats["conflicts"],
+        elapsed=elapsed,
+        attempts_per_sec=threads * attempts / elapsed,
+        bookings_per_sec=stats["booked"] / elapsed,
+        double_bookings=count_double_bookings(db),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--uri", default=None, help="database uri (default: scratch SQLite)")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--rooms", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=200, help="bookings tried per thread")
+    parser.add_argument("--horizon", type=int, default=60, help="days in which stays start")
+    parser.add_argument("--mode", choices=MODES + ("all",), default="striped")
+    args = parser.parse_args()
+
+    os.environ.setdefault("HOTEL_DB_URI", "sqlite:memory")
+    boot()
+    db = make_db(args.uri)
+    found = 0
+    for mode in MODES if args.mode == "all" else [args.mode]:
+        result = stress(db, mode, args.threads, args.rooms, args.attempts, args.horizon)
+        print(f"mode:            {mode} ({db._dbname})")
+        print(f"threads x tries: {args.threads} x {args.attempts}")
+        print(f"booked:          {result['booked']}")
+        print(f"conflicts:       {result['conflicts']}")
+        print(f"elapsed:         {result['elapsed']:.2f}s")
+        print(f"attempts/sec:    {result['attempts_per_sec']:.1f}")
+        print(f"bookings/sec:    {result['bookings_per_sec']:.1f}")
+        print(f"double-bookings: {result['double_bookings']}")
+        if mode != "unlocked":
+            found += result["double_bookings"]
+    db.close()
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
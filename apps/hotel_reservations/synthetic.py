@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic data for scale testing
+
+Run it from the folder that contains apps/, against an empty app database
+(settings.DB_URI, SQLite or PostgreSQL):
+
+    python -m apps.hotel_reservations.synthetic --rooms 50 --customers 2000 --reservations 20000
+    python -m apps.hotel_reservations.synthetic --rooms 2000 --customers 200000 --reservations 10000000
+
+The same arguments and --seed always produce the same rows, whatever the
+day they run: every date and timestamp derives from --end-date (END_DATE
+by default), never from the clock.
+
+- rooms: 1 to 5 beds, a price that grows with the beds, 3 to 7 amenities
+  (linked in room_amenities too) and a code SYN-<n>
+- customers: a name, a unique email, phone and address, and their auth_user
+  account; all the accounts share one password (--password, hashed once
+  with a salt made from the seed)
+- rooms and customers are created at midnight of the first day of history
+- reservations: every room gets a timeline of stays that never overlap,
+  ending on --end-date. Stay lengths follow STAY_WEIGHTS (mostly
+  1 to 3 nights, a bump at a week), the free nights between two stays are
+  drawn so that occupancy follows the seasons (peak in July, --base plus or
+  minus --amplitude) and is higher on Friday and Saturday nights. Guests
+  are skewed towards repeat customers, the booking (created_on) comes an
+  exponential lead time (mean LEAD_DAYS) before the arrival and total_cost
+  is nights x price, like make_reservation.
+
+The history is as long as needed to reach about --reservations stays (or
+--days long). Rows are written with bulk.insert_many (one executemany per
+batch) and committed every group of rooms; --rollup fills daily_room_stats
+from the same arrays. Invoices and outbox messages are not generated.
+"""
+
+import argparse
+import copy
+import math
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from .amenities import sync_rooms
+from .bulk import boolean, insert_many, reset_sequence
+from .cli import boot
+from .customer_import import password_crypt
+
+END_DATE = date(2030, 12, 31)  # the default end of the history
+BATCH_SIZE = 50000  # rows per executemany
+ROOM_GROUP = 100  # rooms generated, inserted and committed together
+STAY_NIGHTS = np.arange(1, 15)
+STAY_WEIGHTS = np.array([22, 24, 17, 11, 7, 5, 8, 2, 1, 1, 0.5, 0.5, 0.5, 0.5])
+STAY_WEIGHTS = STAY_WEIGHTS / STAY_WEIGHTS.sum()
+MEAN_NIGHTS = float((STAY_NIGHTS * STAY_WEIGHTS).sum())
+PEAK_DAY = 196  # mid July, day of the year with the highest occupancy
+WEEKEND = 0.08  # extra occupancy of Friday and Saturday nights
+LEAD_DAYS = 30
+AMENITIES = [
+    "WiFi", "Air Conditioning", "TV", "Private Bathroom", "Mini Fridge", "Balcony",
+    "Kitchenette", "Sofa Bed", "Jacuzzi", "Sea View", "Desk", "Coffee Machine",
+]
+BASE_PRICE = {1: 89.0, 2: 129.0, 3: 169.0, 4: 209.0, 5: 249.0}
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
+    "William", "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Wei", "Aiko", "Omar", "Fatima", "Carlos", "Lucia",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Chen", "Tanaka", "Haddad",
+]
+STREETS = ["Main St", "Oak Ave", "Pine Rd", "Maple Dr", "Cedar Ln", "Elm St", "Lake View", "Hill Rd"]
+
+
+def epoch_day(day):
+    return (day - date(1970, 1, 1)).days
+
+
+def occupancy(days, base, amplitude):
+    """Expected occupancy of the nights days (days since 1970-01-01)"""
+    dates = days.astype("datetime64[D]")
+    day_of_year = (dates - dates.astype("datetime64[Y]")).astype(np.int64)
+    weekday = (days + 3) % 7  # 1970-01-01 was a Thursday, Monday is 0
+    occ = base + amplitude * np.cos(2 * np.pi * (day_of_year - PEAK_DAY) / 365.25)
+    occ = occ + WEEKEND * (weekday >= 4) * (weekday <= 5)
+    return np.clip(occ, 0.05, 0.97)
+
+
+def timelines(rng, rooms, start, end, base, amplitude):
+    """
+    Non overlapping stays of rooms (positions 0..rooms-1) between the days
+    start and end: (room position, first night, nights), ordered by room
+    """
+    t = start + rng.integers(0, 7, rooms)
+    active = np.arange(rooms)
+    parts = []
+    while active.size:
+        occ = occupancy(t[active], base, amplitude)
+        # free nights before the next stay, occupancy = nights / (nights + gap)
+        gap = rng.geometric(1 / (1 + MEAN_NIGHTS * (1 - occ) / occ)) - 1
+        nights = rng.choice(STAY_NIGHTS, size=active.size, p=STAY_WEIGHTS)
+        first = t[active] + gap
+        fits = first + nights <= end
+        parts.append((active[fits], first[fits], nights[fits]))
+        t[active] = first + nights
+        active = active[fits]
+    if not parts:
+        return (np.zeros(0, dtype=np.int64),) * 3
+    room, first, nights = (np.concatenate(column) for column in zip(*parts))
+    order = np.lexsort((first, room))
+    return room[order], first[order], nights[order]
+
+
+def day_strings(days):
+    return np.datetime_as_string(days.astype("datetime64[D]")).tolist()
+
+
+def datetime_strings(seconds):
+    return np.char.replace(
+        np.datetime_as_string(seconds.astype("datetime64[s]"), unit="s"), "T", " "
+    ).tolist()
+
+
+def batches(rows, size=BATCH_SIZE):
+    for k in range(0, len(rows), size):
+        yield rows[k : k + size]
+
+
+def next_id(db, table):
+    return (db(table).select(table.id.max()).first()[table.id.max()] or 0) + 1
+
+
+def make_rooms(db, rng, count, now):
+    """Insert the rooms, returns (ids, prices) as arrays"""
+    first_id = next_id(db, db.rooms)
+    ids = np.arange(first_id, first_id + count)
+    beds = rng.choice([1, 2, 3, 4, 5], size=count, p=[0.2, 0.4, 0.2, 0.12, 0.08])
+    prices = np.round(
+        np.array([BASE_PRICE[b] for b in beds.tolist()]) * rng.uniform(0.85, 1.35, count), 2
+    )
+    amenities = [
+        ", ".join(rng.choice(AMENITIES, size=rng.integers(3, 8), replace=False).tolist())
+        for _ in range(count)
+    ]
+    active = boolean(db, True)
+    rows = [
+        (room_id, "SYN-%06d" % room_id, b, text, price, now, now, active)
+        for room_id, b, text, price in zip(ids.tolist(), beds.tolist(), amenities, prices.tolist())
+    ]
+    fields = ("id", "code", "number_of_beds", "amenities", "price_per_night",
+              "created_on", "modified_on", "is_active")
+    for batch in batches(rows):
+        insert_many(db, db.rooms, fields, batch)
+    sync_rooms(db, dict(zip(ids.tolist(), amenities)))
+    reset_sequence(db, db.rooms)
+    db.commit()
+    return ids, prices
+
+
+def make_customers(db, rng, count, password, salt, now, progress=None):
+    """Insert the customers and their accounts, returns their ids"""
+    first_user = next_id(db, db.auth_user)
+    first_customer = next_id(db, db.customers)
+    crypt = copy.copy(password_crypt(db))
+    crypt.salt = salt
+    hashed = str(crypt(password)[0])
+    active = boolean(db, True)
+    for offset in range(0, count, BATCH_SIZE):
+        size = min(BATCH_SIZE, count - offset)
+        first = rng.choice(FIRST_NAMES, size).tolist()
+        last = rng.choice(LAST_NAMES, size).tolist()
+        phones = rng.integers(10**9, 10**10, size).tolist()
+        numbers = rng.integers(1, 9999, size).tolist()
+        streets = rng.choice(STREETS, size).tolist()
+        users, customers = [], []
+        for k in range(size):
+            n = offset + k
+            email = "%s.%s.%d@example.test" % (first[k].lower(), last[k].lower(), first_customer + n)
+            name = "%s %s" % (first[k], last[k])
+            users.append((first_user + n, email, hashed, first[k], last[k]))
+            customers.append((
+                first_customer + n, first_user + n, name, email, "+1%d" % phones[k],
+                "%d %s" % (numbers[k], streets[k]), now, now, active,
+            ))
+        insert_many(db, db.auth_user, ("id", "email", "password", "first_name", "last_name"), users)
+        insert_many(db, db.customers, ("id", "user_id", "name", "email", "phone_number", "address",
+                                       "created_on", "modified_on", "is_active"), customers)
+        db.commit()
+        if progress:
+            progress("customers", offset + size)
+    reset_sequence(db, db.auth_user)
+    reset_sequence(db, db.customers)
+    return np.arange(first_customer, first_customer + count)
+
+
+def make_reservations(db, seed, room_ids, prices, customer_ids, start, end,
+                      base, amplitude, rollup=False, progress=None):
+    """Insert the reservations of every room, a group of rooms at a time. Returns their number"""
+    fields = ("room_id", "customer_id", "start_date", "end_date", "total_cost",
+              "created_on", "modified_on", "is_active")
+    active = boolean(db, True)
+    total = 0
+    for group, offset in enumerate(range(0, len(room_ids), ROOM_GROUP)):
+        # one generator per group, so the output does not depend on how far others got
+        rng = np.random.default_rng([seed, 1, group])
+        rooms = room_ids[offset : offset + ROOM_GROUP]
+        position, first, nights = timelines(rng, len(rooms), start, end, base, amplitude)
+        if not position.size:
+            continue
+        room = rooms[position]
+        cost = np.round(nights * prices[offset + position], 2)
+        # repeat guests: the lower customer ids come back more often
+        guest = customer_ids[(len(customer_ids) * rng.random(position.size) ** 2).astype(np.int64)]
+        lead = np.minimum(rng.exponential(LEAD_DAYS, position.size), 365).astype(np.int64)
+        created = (first - lead) * 86400 + rng.integers(8 * 3600, 22 * 3600, position.size)
+        created = datetime_strings(created)
+        rows = list(zip(
+            room.tolist(), guest.tolist(), day_strings(first), day_strings(first + nights),
+            cost.tolist(), created, created, [active] * position.size,
+        ))
+        for batch in batches(rows):
+            insert_many(db, db.reservations, fields, batch)
+        if rollup:
+            stay = np.repeat(np.arange(position.size), nights)
+            night = first[stay] + (np.arange(stay.size) - np.repeat(np.cumsum(nights) - nights, nights))
+            share = (cost / nights)[stay]
+            stats = list(zip(day_strings(night), room[stay].tolist(), [1] * stay.size, share.tolist()))
+            for batch in batches(stats):
+                insert_many(db, db.daily_room_stats, ("day", "room_id", "occupied", "revenue"), batch)
+        db.commit()
+        total += position.size
+        if progress:
+            progress("reservations", total)
+    return total
+
+
+def history_days(reservations, rooms, base):
+    """Days of history for about reservations stays over rooms at occupancy base"""
+    return max(1, math.ceil(reservations / max(rooms, 1) * MEAN_NIGHTS / base))
+
+
+def generate(db, rooms, customers, reservations, seed=0, days=None, end_date=END_DATE,
+             base=0.65, amplitude=0.2, password="synthetic", rollup=False, progress=None):
+    """Generate everything, returns the counts and the elapsed seconds"""
+    t0 = time.time()
+    end = epoch_day(end_date)
+    start = end - (days or history_days(reservations, rooms, base))
+    created = datetime_strings(np.array([start * 86400]))[0]
+    room_ids, prices = make_rooms(db, np.random.default_rng([seed, 0]), rooms, created)
+    customer_ids = make_customers(
+        db, np.random.default_rng([seed, 2]), max(customers, 1), password,
+        "synthetic%d" % seed, created, progress,
+    )
+    count = make_reservations(db, seed, room_ids, prices, customer_ids, start, end,
+                              base, amplitude, rollup, progress) if reservations or days else 0
+    return dict(
+        rooms=len(room_ids),
+        customers=len(customer_ids),
+        reservations=count,
+        start_date=str(date(1970, 1, 1) + timedelta(days=int(start))),
+        end_date=str(date(1970, 1, 1) + timedelta(days=int(end))),
+        elapsed=time.time() - t0,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--reservations", type=int, default=100000, help="about how many")
+    parser.add_argument("--days", type=int, default=None, help="days of history (default: from --reservations)")
+    parser.add_argument("--end-date", type=date.fromisoformat, default=END_DATE,
+                        help="YYYY-MM-DD, the end of the history (default: %s)" % END_DATE)
+    parser.add_argument("--base", type=float, default=0.65, help="average occupancy")
+    parser.add_argument("--amplitude", type=float, default=0.2, help="seasonal swing of the occupancy")
+    parser.add_argument("--password", default="synthetic", help="password of every generated account")
+    parser.add_argument("--rollup", action="store_true", help="fill daily_room_stats as well")
+    args = parser.parse_args()
+
+    boot()
+    from .models import db
+
+    t0 = time.time()
+
+    def progress(what, count):
+        elapsed = time.time() - t0
+        print(f"{what}: {count} ({count / elapsed:.0f} rows/sec)" if elapsed else f"{what}: {count}")
+
+    result = generate(
+        db, args.rooms, args.customers, args.reservations, args.seed, args.days, args.end_date,
+        args.base, args.amplitude, args.password, args.rollup, progress,
+    )
+    print(f"rooms:        {result['rooms']}")
+    print(f"customers:    {result['customers']}")
+    print(f"reservations: {result['reservations']}")
+    print(f"history:      {result['start_date']} to {result['end_date']}")
+    print(f"elapsed:      {result['elapsed']:.2f}s")
+    print(f"rows/sec:     {(result['customers'] * 2 + result['reservations']) / result['elapsed']:.0f}")
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
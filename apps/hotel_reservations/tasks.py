@@ -1,4 +1,5 @@
-from .common import scheduler, settings
+from . import changes, invoices, outbox, rollup
+from .common import log, scheduler, settings
 from .models import db
 
 # #######################################################
@@ -7,24 +8,82 @@ from .models import db
 
 
 # define your tasks (or import them from other file)
-def my_task(**inputs):
-    print(f"task running with {inputs}")
+def generate_invoices(**inputs):
+    """Render the queued invoices in a process pool, batch by batch"""
     try:
-        # do something here
+        result = invoices.generate(
+            db,
+            settings.UPLOAD_FOLDER,
+            limit=inputs.get("limit"),
+            batch_size=settings.INVOICE_BATCH_SIZE,
+            processes=settings.INVOICE_PROCESSES,
+        )
+    except Exception:
+        db.rollback()
+        raise
+    log.info("invoices_generated", **result)
+    return result
+
+
+def send_outbox(**inputs):
+    """Send one batch of queued email over a single SMTP connection"""
+    if not settings.SMTP_SERVER:
+        return {"skipped": "SMTP_SERVER is not set"}
+    try:
+        batch = outbox.drain(db, settings, batch_size=settings.OUTBOX_BATCH_SIZE)
+    except Exception:
+        db.rollback()
+        raise
+    if batch["messages"]:
+        log.info("outbox_batch", **batch)
+    return batch
+
+
+def rebuild_daily_room_stats(**inputs):
+    """Recompute the daily_room_stats rollup from the reservations (repair)"""
+    try:
+        rows = rollup.rebuild(db)
         db.commit()
-    except:
-        # rollback on failure
+    except Exception:
         db.rollback()
-    return {}
+        raise
+    log.info("daily_room_stats_rebuilt", rows=rows)
+    return {"rows": rows}
+
+
+def prune_reservation_changes(**inputs):
+    """Trim the change log the availability and occupancy engines follow"""
+    try:
+        deleted = changes.prune(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"deleted": deleted}
 
 
 if settings.USE_SCHEDULER:
     # register your tasks with the scheduler
-    scheduler.register_task("my_task", my_task)
+    scheduler.register_task("generate_invoices", generate_invoices)
+    scheduler.register_task("send_outbox", send_outbox)
+    scheduler.register_task("rebuild_daily_room_stats", rebuild_daily_room_stats)
+    scheduler.register_task("prune_reservation_changes", prune_reservation_changes)
+
+    # drain the invoice queue every minute, actions can also enqueue a run now
+    if db(db.task_run.name == "generate_invoices").isempty():
+        scheduler.enqueue_run("generate_invoices", inputs={}, timeout=3600, period=60)
+
+    # confirmation and cancellation email go out within seconds of the booking
+    if db(db.task_run.name == "send_outbox").isempty():
+        scheduler.enqueue_run("send_outbox", inputs={}, timeout=300, period=10)
 
-    # enqueue runs (here or in actions) for example
-    if db(db.task_run).count() < 1:
-        scheduler.enqueue_run("my_task", inputs={}, timeout=2, period=10)
+    # nightly repair of the rollup, in case a write bypassed the actions
+    if db(db.task_run.name == "rebuild_daily_room_stats").isempty():
+        scheduler.enqueue_run("rebuild_daily_room_stats", inputs={}, timeout=600, period=86400)
+
+    # hourly trim of the reservation change log
+    if db(db.task_run.name == "prune_reservation_changes").isempty():
+        scheduler.enqueue_run("prune_reservation_changes", inputs={}, timeout=300, period=3600)
 
 # manage your tasks via dashboard or Grid(path, db.task_run)
 
@@ -52,22 +111,48 @@ elif settings.USE_CELERY:
     )
 
     # register your tasks
-    @scheduler.task
-    def my_task():
+    @celery_scheduler.task(name="generate_invoices")
+    def celery_generate_invoices():
         # reconnect to database
         db._adapter.reconnect()
-        try:
-            # do something here
-            db.commit()
-        except:
-            # rollback on failure
-            db.rollback()
-
-    # run my_task every 10 seconds
+        return generate_invoices()
+
+    @celery_scheduler.task(name="send_outbox")
+    def celery_send_outbox():
+        db._adapter.reconnect()
+        return send_outbox()
+
+    @celery_scheduler.task(name="rebuild_daily_room_stats")
+    def celery_rebuild_daily_room_stats():
+        db._adapter.reconnect()
+        return rebuild_daily_room_stats()
+
+    @celery_scheduler.task(name="prune_reservation_changes")
+    def celery_prune_reservation_changes():
+        db._adapter.reconnect()
+        return prune_reservation_changes()
+
+    # drain the invoice queue every minute, send email within seconds of the
+    # booking, trim the change log hourly, repair the rollup nightly
     celery_scheduler.conf.beat_schedule = {
-        "my_first_task": {
-            "task": f"apps.{settings.APP_NAME}.tasks.my_task",
+        "generate_invoices": {
+            "task": "generate_invoices",
+            "schedule": 60.0,
+            "args": (),
+        },
+        "send_outbox": {
+            "task": "send_outbox",
             "schedule": 10.0,
             "args": (),
         },
+        "rebuild_daily_room_stats": {
+            "task": "rebuild_daily_room_stats",
+            "schedule": 86400.0,
+            "args": (),
+        },
+        "prune_reservation_changes": {
+            "task": "prune_reservation_changes",
+            "schedule": 3600.0,
+            "args": (),
+        },
     }
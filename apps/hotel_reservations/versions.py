@@ -0,0 +1,169 @@
+"""
+This file defines the per-table data versions and the conditional GET fixture
+
+The versions are counters stored in the database, in db.table_versions, and
+bumped by triggers that watch() installs on the tables (SQLite and
+PostgreSQL), in the transaction of the write. Every writer moves them: the
+other worker processes, the scheduler and Celery tasks, the import tools and
+the executemany inserts of bulk.py. On other databases pydal callbacks bump
+them instead, which only covers writes made through pydal.
+
+An endpoint that only reads watched tables tags its response with an ETag
+made of their versions and of the request path and query string:
+
+    @action.uses(db, auth.user, ConditionalGet("reservations", "rooms"))
+
+When the client sends the same tag back in If-None-Match, the fixture answers
+304 Not Modified from on_request, before the action runs any query or
+serializes anything. List it after the fixtures that authorize the request.
+
+The versions are read before the data: a write committed in between pairs
+the new data with the old version, so the next request just misses the 304.
+The amenity index reloads the same way when a version it depends on has
+moved (the availability and occupancy engines follow changes.py instead).
+
+On PostgreSQL a table has SLOTS counter rows and a transaction bumps the one
+of its backend, so that concurrent bookings do not all wait on the same row
+lock; a version is the sum of the slots.
+"""
+
+import hashlib
+import time
+
+from py4web import request, response
+from py4web.core import HTTP, Fixture
+
+SLOTS = 16
+
+SQLITE_TRIGGER = (
+    "CREATE TRIGGER IF NOT EXISTS %(tablename)s_version_%(event)s AFTER %(event)s ON %(table)s"
+    " BEGIN UPDATE %(versions)s SET %(version)s = %(version)s + 1"
+    " WHERE %(name)s = '%(tablename)s' AND %(slot)s = 0; END;"
+)
+
+POSTGRES_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$"
+    " BEGIN UPDATE %(versions)s SET %(version)s = %(version)s + 1"
+    " WHERE %(name)s = TG_ARGV[0] AND %(slot)s = pg_backend_pid() %% %(slots)d;"
+    " RETURN NULL; END; $$ LANGUAGE plpgsql;"
+)
+
+POSTGRES_TRIGGER = (
+    "DROP TRIGGER IF EXISTS %(tablename)s_version ON %(table)s;"
+    " CREATE TRIGGER %(tablename)s_version AFTER INSERT OR UPDATE OR DELETE ON %(table)s"
+    " FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version('%(tablename)s');"
+)
+
+
+class TableVersions:
+    def __init__(self):
+        self.triggers = False
+
+    def watch(self, db, *tables):
+        """Create the counters of tables and what bumps them, safe to call on every start"""
+        versions = db.table_versions
+        names = dict(
+            versions=versions._rname,
+            name=versions.name._rname,
+            slot=versions.slot._rname,
+            version=versions.version._rname,
+            slots=SLOTS,
+        )
+        tablenames = [table._tablename for table in tables]
+        try:
+            existing = {
+                (row.name, row.slot)
+                for row in db(versions.name.belongs(tablenames)).select(versions.name, versions.slot)
+            }
+            for tablename in tablenames:
+                for slot in range(SLOTS):
+                    if (tablename, slot) not in existing:
+                        # slot 0 starts at the creation time, so that a recreated
+                        # database does not hand out the tags of the old one
+                        version = int(time.time() * 1000) if slot == 0 else 0
+                        versions.insert(name=tablename, slot=slot, version=version)
+            db.commit()
+        except Exception:
+            # another process seeded them at the same time
+            db.rollback()
+        try:
+            # 'sqlite:memory' for an in-memory database
+            dbname = db._dbname.split(":")[0]
+            if dbname == "sqlite":
+                for table in tables:
+                    for event in ("INSERT", "UPDATE", "DELETE"):
+                        db.executesql(SQLITE_TRIGGER % dict(
+                            names, table=table._rname, tablename=table._tablename, event=event
+                        ))
+                self.triggers = True
+            elif dbname == "postgres":
+                db.executesql(POSTGRES_FUNCTION % names)
+                for table in tables:
+                    db.executesql(POSTGRES_TRIGGER % dict(
+                        names, table=table._rname, tablename=table._tablename
+                    ))
+                self.triggers = True
+            db.commit()
+        except Exception:
+            # e.g. no permission to create triggers, fall back to the callbacks
+            db.rollback()
+            self.triggers = False
+        if not self.triggers:
+            for table in tables:
+                bump = lambda *args, tablename=table._tablename, **kwargs: self.bump(db, tablename)
+                table._after_insert.append(bump)
+                table._after_update.append(bump)
+                table._after_delete.append(bump)
+
+    def bump(self, db, tablename):
+        versions = db.table_versions
+        db((versions.name == tablename) & (versions.slot == 0)).update(
+            version=versions.version + 1
+        )
+
+    def get(self, db, *tablenames):
+        """{tablename: version} in one query, 0 for a table that is not watched"""
+        versions = db.table_versions
+        total = versions.version.sum()
+        rows = db(versions.name.belongs(tablenames)).select(
+            versions.name, total, groupby=versions.name
+        )
+        found = {row[versions.name]: row[total] for row in rows}
+        return {tablename: found.get(tablename) or 0 for tablename in tablenames}
+
+    def etag(self, db, tablenames, *parts):
+        current = self.get(db, *tablenames)
+        key = ["%s=%s" % (t, current[t]) for t in tablenames]
+        key.extend(str(part) for part in parts)
+        return '"%s"' % hashlib.sha1("|".join(key).encode("utf8")).hexdigest()[:20]
+
+
+versions = TableVersions()
+
+
+class ConditionalGet(Fixture):
+    """ETag / If-None-Match on the versions of the tables a GET action reads"""
+
+    def __init__(self, *tablenames):
+        # imported here, the worker processes of invoices.pool import this module
+        from .common import db
+
+        self.db = db
+        self.__prerequisites__ = [db]
+        self.tablenames = tablenames
+
+    def on_request(self, context):
+        etag = versions.etag(self.db, self.tablenames, request.path, request.query_string)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        response.headers.update(headers)
+        if request.method in ("GET", "HEAD") and matches(
+            request.headers.get("If-None-Match"), etag
+        ):
+            raise HTTP(304, headers=headers)
+
+
+def matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or "W/" + etag in tags
@@ -0,0 +1,47 @@
+"""
+Load the app once, as benchmark.py does, on an in-memory SQLite database,
+so that the tests can import its modules, and call its actions
+"""
+
+import io
+import os
+import sys
+from json import dumps
+from urllib.parse import urlencode
+
+import pytest
+
+APPS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "apps")
+
+os.environ["HOTEL_DB_URI"] = "sqlite:memory"
+sys.path.insert(0, os.path.dirname(APPS_FOLDER))
+
+from py4web.core import wsgi  # noqa: E402
+
+wsgi(apps_folder=APPS_FOLDER, app_names="hotel_reservations", yes=True)
+
+
+@pytest.fixture
+def call():
+    """
+    Run an action without its fixtures, on a request made of query, json and headers:
+    call(controllers.flexible_search, query=dict(nights=3))
+    """
+    from py4web import request
+
+    def call(action, *args, query=None, json=None, method="GET", headers=None):
+        body = dumps(json).encode("utf8") if json is not None else b""
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": "/hotel_reservations/" + action.__name__,
+            "QUERY_STRING": urlencode(query or {}),
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": io.BytesIO(body),
+        }
+        for name, value in (headers or {}).items():
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+        request.__init__(environ)
+        return action.__wrapped__(*args)
+
+    return call
@@ -0,0 +1,77 @@
+"""
+The amenity index answers AND / OR filters and follows writes it did not see;
+rooms without links are linked once, at setup, not by the index
+"""
+
+from apps.hotel_reservations import bulk
+from apps.hotel_reservations.amenities import amenity_index, link_unlinked_rooms, sync_room, sync_rooms
+from apps.hotel_reservations.models import db
+
+
+def add_room(amenities):
+    room_id = db.rooms.insert(number_of_beds=1, amenities=amenities, price_per_night=100)
+    sync_room(db, room_id, amenities)
+    return room_id
+
+
+def test_index_follows_every_writer():
+    try:
+        a = add_room("WiFi, Jacuzzi")
+        b = add_room("WiFi, Balcony")
+        c = add_room("Kitchenette")
+        db.commit()
+        index = amenity_index.ensure_loaded(db)
+        assert index.matching_room_ids(["wifi"]) == [a, b]
+        assert index.matching_room_ids(["WiFi", "Jacuzzi"]) == [a]
+        assert index.matching_room_ids([], ["Balcony", "kitchenette"]) == [b, c]
+        assert index.matching_room_ids(["WiFi"], ["Balcony", "Kitchenette"]) == [b]
+        assert index.matching_room_ids(["Sauna"]) == []
+        assert index.matching_room_ids() is None
+
+        # a room written as another process would, with a bulk insert
+        bulk.insert_many(
+            db, db.rooms, ["number_of_beds", "amenities", "price_per_night"],
+            [(2, "Jacuzzi, Sauna", 150.0)],
+        )
+        d = db(db.rooms.amenities == "Jacuzzi, Sauna").select(db.rooms.id).first().id
+        sync_rooms(db, {d: "Jacuzzi, Sauna"})
+        db.commit()
+        index = amenity_index.ensure_loaded(db)
+        assert index.matching_room_ids(["jacuzzi"]) == [a, d]
+        assert ("Sauna", 1) in index.catalog()
+
+        db.executesql("DELETE FROM room_amenities WHERE room_id = %d;" % a)
+        db.executesql("DELETE FROM rooms WHERE id = %d;" % a)
+        db.commit()
+        assert amenity_index.ensure_loaded(db).matching_room_ids(["jacuzzi"]) == [d]
+    finally:
+        db.rollback()
+        db(db.room_amenities).delete()
+        db(db.amenities).delete()
+        db(db.rooms).delete()
+        db.commit()
+
+
+def test_unlinked_rooms_are_linked_once():
+    try:
+        bulk.insert_many(
+            db, db.rooms, ["number_of_beds", "amenities", "price_per_night"],
+            [(1, "WiFi, Sauna", 100.0), (1, " , ", 100.0)],
+        )
+        db.commit()
+        sauna = db(db.rooms.amenities == "WiFi, Sauna").select(db.rooms.id).first().id
+
+        # loading the index only reads
+        assert amenity_index.ensure_loaded(db).matching_room_ids(["sauna"]) == []
+        assert db(db.room_amenities).isempty()
+
+        assert link_unlinked_rooms(db) == 1
+        assert amenity_index.ensure_loaded(db).matching_room_ids(["sauna"]) == [sauna]
+        # the room whose amenities have no names is not synced again and again
+        assert link_unlinked_rooms(db) == 0
+    finally:
+        db.rollback()
+        db(db.room_amenities).delete()
+        db(db.amenities).delete()
+        db(db.rooms).delete()
+        db.commit()
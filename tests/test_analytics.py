@@ -0,0 +1,82 @@
+"""
+The revenue analytics match numbers worked out by hand
+"""
+
+import datetime
+
+import pytest
+from py4web.core import bottle
+
+from apps.hotel_reservations import analytics, controllers
+from apps.hotel_reservations.models import db
+
+
+@pytest.fixture
+def hotel():
+    try:
+        a, b, c = [db.rooms.insert(number_of_beds=beds, amenities="WiFi", price_per_night=100)
+                   for beds in (1, 2, 2)]
+        customer = db.customers.insert(name="Kim", email="kim@example.test")
+        stays = [
+            # room, start, end, total_cost, booked on
+            (a, "2030-05-30", "2030-06-02", 300.0, "2030-05-01 12:00:00"),  # 1 night inside
+            (b, "2030-06-02", "2030-06-04", 500.0, "2030-05-20 09:30:00"),
+            (a, "2030-06-04", "2030-06-07", 600.0, "2030-05-20 23:59:00"),  # 1 night inside
+            (c, "2030-06-10", "2030-06-12", 200.0, "2030-05-21 00:00:00"),  # after the window
+            (b, "2030-06-04", "2030-06-05", None, None),  # no cost, no booking day
+        ]
+        for room_id, start, end, cost, created_on in stays:
+            db.reservations.insert(room_id=room_id, customer_id=customer, start_date=start,
+                                   end_date=end, total_cost=cost, created_on=created_on)
+        db.commit()
+        yield a, b, c
+    finally:
+        db.rollback()
+        db(db.reservations).delete()
+        db(db.customers).delete()
+        db(db.rooms).delete()
+        db.commit()
+
+
+def test_report(call, hotel):
+    a, b, c = hotel
+    report = call(controllers.get_analytics, query=dict(start="2030-06-01", end="2030-06-05"))
+    assert report["success"]
+    assert report["totals"] == dict(
+        days=4, rooms=3, sold=5, available=12, revenue=800.0,
+        occupancy=0.4167, adr=160.0, revpar=66.6667, average_lead_days=18.25,
+    )
+    assert [(r["room_id"], r["sold"], r["revenue"], r["occupancy"], r["adr"], r["revpar"])
+            for r in report["by_room"]] == [
+        (a, 2, 300.0, 0.5, 150.0, 75.0),
+        (b, 3, 500.0, 0.75, 166.6667, 125.0),
+        (c, 0, 0.0, 0.0, 0.0, 0.0),
+    ]
+    assert [(r["beds"], r["rooms"], r["sold"], r["available"], r["revpar"])
+            for r in report["by_beds"]] == [(1, 1, 2, 4, 75.0), (2, 2, 3, 8, 62.5)]
+    assert [(r["date"], r["sold"], r["revenue"], r["available"]) for r in report["daily"]] == [
+        ("2030-06-01", 1, 100.0, 3),
+        ("2030-06-02", 1, 250.0, 3),
+        ("2030-06-03", 1, 250.0, 3),
+        ("2030-06-04", 2, 200.0, 3),
+    ]
+    assert report["pickup"] == [
+        dict(date="2030-05-01", room_nights=1, revenue=100.0, on_the_books=1),
+        dict(date="2030-05-20", room_nights=3, revenue=700.0, on_the_books=4),
+    ]
+
+
+def test_room_filter_and_empty_window(call, hotel):
+    a, b, c = hotel
+    query = dict(start="2030-06-01", end="2030-06-05", room="%d,%d" % (a, c))
+    totals = call(controllers.get_analytics, query=query)["totals"]
+    assert (totals["rooms"], totals["sold"], totals["available"]) == (2, 2, 8)
+    assert totals["revenue"] == 300.0
+
+    report = analytics.report(db, datetime.date(2031, 1, 1), datetime.date(2031, 1, 3))
+    assert report["totals"]["sold"] == 0 and report["totals"]["average_lead_days"] is None
+    assert report["pickup"] == [] and len(report["daily"]) == 2
+
+    with pytest.raises(bottle.HTTPError) as e:
+        call(controllers.get_analytics, query=dict(start="June"))
+    assert e.value.status_code == 400
@@ -0,0 +1,107 @@
+"""
+The availability index applies its own writes and follows the change log
+for reservations written by other processes
+"""
+
+from apps.hotel_reservations import changes
+from apps.hotel_reservations.availability import availability
+from apps.hotel_reservations.models import db
+
+
+def test_index_follows_every_writer(monkeypatch):
+    try:
+        room = db.rooms.insert(number_of_beds=1, amenities="WiFi", price_per_night=100)
+        customer = db.customers.insert(name="Kim", email="kim@example.test")
+        db.commit()
+        assert availability.ensure_loaded(db).conflict(room, "2030-07-01", "2030-07-05") is None
+
+        # from now on only the changes are applied, the table is not read again
+        loads = []
+        monkeypatch.setattr(availability, "load", lambda db: loads.append(db))
+
+        # written as another process would, this process never hears of it
+        db.executesql(
+            "INSERT INTO reservations (room_id, customer_id, start_date, end_date)"
+            " VALUES (%d, %d, '2030-07-02', '2030-07-04');" % (room, customer)
+        )
+        db.commit()
+        reservation = db(db.reservations).select().first().id
+        index = availability.ensure_loaded(db)
+        assert index.conflict(room, "2030-07-01", "2030-07-05") == reservation
+        assert index.conflict(room, "2030-07-04", "2030-07-06") is None
+
+        # a write of this process is applied at once, then replayed from the log
+        other = db.reservations.insert(
+            room_id=room, customer_id=customer, start_date="2030-07-10", end_date="2030-07-12"
+        )
+        db.commit()
+        availability.add(other, room, "2030-07-10", "2030-07-12")
+        assert availability.conflict(room, "2030-07-11", "2030-07-13") == other
+        assert [item[2] for item in availability.ensure_loaded(db).rooms[room]] == [
+            reservation, other
+        ]
+
+        db.executesql("DELETE FROM reservations WHERE id = %d;" % reservation)
+        db.commit()
+        index = availability.ensure_loaded(db)
+        assert index.conflict(room, "2030-07-01", "2030-07-05") is None
+        assert index.conflict(room, "2030-07-11", "2030-07-13") == other
+        assert loads == []
+
+        # changes pruned before the index read them: it loads the table again
+        db.executesql("DELETE FROM reservations WHERE id = %d;" % other)
+        db.reservations.insert(
+            room_id=room, customer_id=customer, start_date="2030-08-01", end_date="2030-08-03"
+        )
+        db.commit()
+        changes.prune(db, keep=1)
+        db.commit()
+        availability.ensure_loaded(db)
+        assert loads == [db]
+    finally:
+        db.rollback()
+        db(db.reservations).delete()
+        db(db.customers).delete()
+        db(db.rooms).delete()
+        db.commit()
+
+
+def test_feed_waits_for_a_missing_change(monkeypatch):
+    feed = changes.ChangeFeed()
+    clock = [1000.0]
+    monkeypatch.setattr(changes.time, "monotonic", lambda: clock[0])
+    log = db.reservation_changes
+    try:
+        feed.start(db)
+        feed.read(db)
+        first = feed.seen + 1
+        # first + 1 is taken by a transaction that has not committed yet
+        for id in (first, first + 2):
+            log.insert(id=id, reservation_id=id, room_id=1,
+                       start_date="2030-07-01", end_date="2030-07-02", op="add")
+        db.commit()
+        assert [row.id for row in feed.read(db)] == [first, first + 2]
+        assert feed.seen == first
+        # the changes above the missing one are read again until it shows up
+        clock[0] += 10
+        assert [row.id for row in feed.read(db)] == [first + 2]
+        log.insert(id=first + 1, reservation_id=first + 1, room_id=1,
+                   start_date="2030-07-01", end_date="2030-07-02", op="del")
+        db.commit()
+        assert [row.id for row in feed.read(db)] == [first + 1, first + 2]
+        assert feed.seen == first + 2
+
+        # or until it has been missing for GRACE seconds
+        log.insert(id=first + 4, reservation_id=first + 4, room_id=1,
+                   start_date="2030-07-01", end_date="2030-07-02", op="add")
+        db.commit()
+        assert [row.id for row in feed.read(db)] == [first + 4]
+        assert feed.seen == first + 2
+        clock[0] += changes.GRACE + 1
+        feed.read(db)
+        assert feed.seen == first + 4
+        assert not feed.read(db)
+    finally:
+        db.rollback()
+        db(log.id >= first).delete()
+        db.commit()
@@ -0,0 +1,73 @@
+"""
+The booking coordinator never double-books a room, also under many threads
+
+The threaded tests run on a scratch SQLite file (stress_booking.make_db):
+every thread has its own connection, and each connection to sqlite:memory
+would be its own database.
+"""
+
+import os
+import subprocess
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+from apps.hotel_reservations.booking import RoomUnavailable, booking
+from apps.hotel_reservations.models import db
+from apps.hotel_reservations.stress_booking import make_db, stress
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DAY = date(2030, 7, 1)
+
+
+def test_conflicting_leg_rolls_back_the_booking():
+    """On the app's in-memory database, inside an already open transaction"""
+    try:
+        rooms = [db.rooms.insert(number_of_beds=1, amenities="WiFi", price_per_night=100)
+                 for _ in range(2)]
+        customer = db.customers.insert(name="Kim", email="kim@example.test")
+        db.commit()
+        leg = lambda room, start, end: dict(
+            room_id=room, customer_id=customer,
+            start_date=DAY + timedelta(days=start), end_date=DAY + timedelta(days=end),
+        )
+        assert len(booking.book([leg(rooms[0], 0, 3)])) == 1
+        db(db.rooms).count()  # a read opens the transaction, as in an action
+        with pytest.raises(RoomUnavailable) as e:
+            with booking.rooms(rooms):
+                booking.insert([leg(rooms[1], 0, 2), leg(rooms[0], 2, 4)])
+        assert e.value.room_id == rooms[0]
+        # neither leg was kept, the half-open ranges touch without overlapping
+        assert db(db.reservations).count() == 1
+        assert len(booking.book([leg(rooms[1], 0, 2), leg(rooms[0], 3, 4)])) == 2
+    finally:
+        db.rollback()
+        db(db.reservations).delete()
+        db(db.customers).delete()
+        db(db.rooms).delete()
+        db.commit()
+
+
+@pytest.mark.parametrize("mode", ["striped", "global"])
+def test_threads_never_double_book(tmp_path, mode, record_property):
+    scratch = make_db(folder=str(tmp_path))
+    result = stress(scratch, mode, threads=8, rooms=3, attempts=40, horizon=20)
+    scratch.close()
+    record_property("bookings_per_sec", round(result["bookings_per_sec"], 1))
+    assert result["booked"] and result["double_bookings"] == 0
+    assert result["booked"] + result["conflicts"] == 8 * 40
+    # a floor far below what any machine does, to catch a coordinator that stalls
+    assert result["bookings_per_sec"] > 5
+
+
+def test_stress_command_line():
+    done = subprocess.run(
+        [sys.executable, "-m", "apps.hotel_reservations.stress_booking", "--mode", "all",
+         "--threads", "4", "--attempts", "20"],
+        cwd=ROOT, env={k: v for k, v in os.environ.items() if k != "HOTEL_DB_URI"},
+        capture_output=True, text=True, timeout=120,
+    )
+    assert done.returncode == 0, done.stdout + done.stderr
+    assert done.stdout.count("bookings/sec:") == 3
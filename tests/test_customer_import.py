@@ -0,0 +1,61 @@
+"""
+The customer import skips the emails it already knows, whatever their case,
+from Python and from the command line
+"""
+
+import os
+import subprocess
+import sys
+
+from apps.hotel_reservations.customer_import import import_customers, password_crypt
+from apps.hotel_reservations.models import db
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_duplicates_ignore_case():
+    try:
+        user_id = db.auth_user.insert(email="Kim@Example.com", first_name="Kim")
+        db.customers.insert(user_id=user_id, name="Kim Lee", email="Kim@Example.com")
+        db.commit()
+        records = [
+            dict(name="Kim Lee", email="kim@example.com"),
+            dict(name="Ann Roe", email="ANN@example.com", password="secret-1"),
+            dict(name="Ann Roe", email="ann@Example.com"),
+            dict(name="Bob Poe", email="not an email"),
+            dict(name="Bob Poe", email="bob@example.com", phone="5551234567"),
+        ]
+        totals = import_customers(db, enumerate(records, 1), processes=1)
+        counts = [totals[key] for key in ("inserted", "existing", "duplicates", "invalid")]
+        assert counts == [2, 1, 1, 1]
+        assert [position for position, error in totals["errors"]] == [4]
+
+        rows = db(db.customers.email.lower().like("%@example.com")).select(orderby=db.customers.id)
+        assert [row.email for row in rows] == ["Kim@Example.com", "ann@example.com", "bob@example.com"]
+        ann = db(db.auth_user.email == "ann@example.com").select().first()
+        assert ann.password and ann.password != "secret-1"
+        # the hash of the given password, as add_customer would store it
+        assert password_crypt(db)("secret-1")[0] == ann.password
+    finally:
+        db.rollback()
+        db(db.customers).delete()
+        db(db.auth_user).delete()
+        db.commit()
+
+
+def test_command_line(tmp_path):
+    path = tmp_path / "guests.csv"
+    path.write_text(
+        "name,email,phone\n"
+        "Kim Lee,kim@example.com,5551234567\n"
+        "Ann Roe,ANN@example.com,\n"
+        "Ann Roe,ann@example.com,\n"
+    )
+    done = subprocess.run(
+        [sys.executable, "-m", "apps.hotel_reservations.customer_import", str(path),
+         "--processes", "1", "--default-password", "welcome-1"],
+        cwd=ROOT, env=dict(os.environ, HOTEL_DB_URI="sqlite:memory"),
+        capture_output=True, text=True, timeout=120,
+    )
+    assert done.returncode == 0, done.stderr
+    assert "inserted:   2" in done.stdout and "duplicates: 1" in done.stdout
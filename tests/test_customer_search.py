@@ -0,0 +1,46 @@
+"""
+A booking is only made for the customer an identifier designates exactly
+"""
+
+import pytest
+
+from apps.hotel_reservations import customer_search
+from apps.hotel_reservations.customer_search import AmbiguousCustomer, identify
+from apps.hotel_reservations.models import db
+
+
+@pytest.fixture
+def customers():
+    try:
+        yield dict(
+            bobby=db.customers.insert(name="Bobby Tables", email="bt@x.com"),
+            kim=db.customers.insert(name="Kim Lee", email="Kim@Example.com"),
+            ann=db.customers.insert(name="Ann Roe", email="ann.roe@example.com"),
+            ann2=db.customers.insert(name="ANN ROE", email="ann.r@example.com"),
+        )
+    finally:
+        db.rollback()
+
+
+def test_unknown_email_matches_nobody(customers):
+    # the typeahead does offer Bobby for it...
+    assert [c.id for c in customer_search.lookup(db, "bob@x.com")] == [customers["bobby"]]
+    # ...but nobody is booked for it
+    assert identify(db, "bob@x.com") is None
+
+
+def test_email_ignores_case(customers):
+    assert identify(db, "kim@example.com").id == customers["kim"]
+    assert identify(db, " Kim@Example.com ").id == customers["kim"]
+
+
+def test_exact_name_only(customers):
+    assert identify(db, "kim lee").id == customers["kim"]
+    assert identify(db, "Kim") is None
+    assert identify(db, "Bobby Table") is None
+
+
+def test_ambiguous_name(customers):
+    with pytest.raises(AmbiguousCustomer):
+        identify(db, "Ann Roe")
+    assert identify(db, "ann.r@example.com").id == customers["ann2"]
@@ -0,0 +1,72 @@
+"""
+The flexible search lists every stay of N nights that fits in the span
+"""
+
+import datetime
+
+import pytest
+
+from apps.hotel_reservations import controllers
+from apps.hotel_reservations.models import db
+
+DAY = datetime.date(2030, 3, 1)
+
+
+@pytest.fixture
+def hotel():
+    try:
+        rooms = [db.rooms.insert(number_of_beds=beds, amenities="WiFi", price_per_night=price)
+                 for beds, price in ((2, 100), (2, 80), (1, 50))]
+        customer = db.customers.insert(name="Kim", email="kim@example.test")
+        # room 0 is booked on days 2 and 3, room 1 from day 1 to the end of the span
+        for room_id, start, end in ((rooms[0], 2, 4), (rooms[1], 1, 30)):
+            db.reservations.insert(room_id=room_id, customer_id=customer,
+                                   start_date=DAY + datetime.timedelta(days=start),
+                                   end_date=DAY + datetime.timedelta(days=end))
+        db.commit()
+        yield rooms
+    finally:
+        db.rollback()
+        db(db.reservations).delete()
+        db(db.customers).delete()
+        db(db.rooms).delete()
+        db.commit()
+
+
+def search(call, **query):
+    return call(controllers.flexible_search, query=dict(
+        dict(start_date="2030-03-01", end_date="2030-03-08", nights=2), **query
+    ))
+
+
+def windows(result):
+    return [(w["room_id"], w["start_date"], w["total_cost"]) for w in result["windows"]]
+
+
+def test_every_window_that_fits(call, hotel):
+    result = search(call, beds=2)
+    assert result["success"] and result["total"] == 3
+    # room 1 has no free pair of nights, room 0 none across days 2 and 3
+    assert windows(result) == [
+        (hotel[0], "2030-03-01", 200.0),
+        (hotel[0], "2030-03-05", 200.0),
+        (hotel[0], "2030-03-06", 200.0),
+    ]
+    assert result["windows"][0]["end_date"] == "2030-03-03"
+
+
+def test_sorted_by_date_then_cost_and_limited(call, hotel):
+    result = search(call, limit=2)
+    assert result["total"] == 3 + 6
+    assert windows(result) == [(hotel[2], "2030-03-01", 100.0), (hotel[0], "2030-03-01", 200.0)]
+    assert search(call, max_price=60)["total"] == 6
+    assert search(call, nights=7)["total"] == 1
+    assert search(call, nights=8)["total"] == 0
+
+
+def test_invalid_queries(call, hotel):
+    assert not search(call, nights=0)["success"]
+    assert not search(call, end_date="2030-03-01")["success"]
+    assert not search(call, end_date="2031-03-08")["success"]
+    assert not search(call, start_date="March")["success"]
+    assert not search(call, beds="two")["success"]
@@ -0,0 +1,76 @@
+"""
+A group reservation books every leg or none of them
+"""
+
+import pytest
+
+from apps.hotel_reservations import controllers
+from apps.hotel_reservations.availability import AvailabilityIndex
+from apps.hotel_reservations.models import db
+
+
+@pytest.fixture
+def hotel():
+    try:
+        rooms = [db.rooms.insert(number_of_beds=2, amenities="WiFi", price_per_night=price)
+                 for price in (100, 150)]
+        db.customers.insert(name="Kim Lee", email="kim@example.test")
+        db.commit()
+        yield rooms
+    finally:
+        db.rollback()
+        for table in (db.outbox, db.invoices, db.daily_room_stats, db.reservations,
+                      db.customers, db.rooms):
+            db(table).delete()
+        db.commit()
+
+
+def book(call, legs):
+    return call(controllers.make_group_reservation, method="POST", json=dict(
+        customer_identifier="kim@example.test",
+        legs=[dict(room_id=room_id, start_date=start, end_date=end)
+              for room_id, start, end in legs],
+    ))
+
+
+def kept():
+    return [db(table).count() for table in (db.reservations, db.invoices, db.outbox)]
+
+
+def test_every_leg_is_booked(call, hotel):
+    result = book(call, [(hotel[0], "2030-07-01", "2030-07-03"),
+                         (hotel[1], "2030-07-01", "2030-07-04")])
+    assert result["success"], result
+    assert result["total_cost"] == 2 * 100 + 3 * 150
+    assert [leg["nights"] for leg in result["legs"]] == [2, 3]
+    # one invoice and one confirmation per leg, with the reservations
+    assert kept() == [2, 2, 2]
+    assert db(db.daily_room_stats).count() == 5
+
+
+def test_unavailable_leg_books_nothing(call, hotel):
+    assert book(call, [(hotel[0], "2030-07-02", "2030-07-04")])["success"]
+    result = book(call, [(hotel[1], "2030-07-01", "2030-07-03"),
+                         (hotel[0], "2030-07-03", "2030-07-05")])
+    assert (result["success"], result["leg"]) == (False, 1)
+    assert kept() == [1, 1, 1]
+
+
+def test_conflict_found_under_the_lock_books_nothing(call, hotel, monkeypatch):
+    assert book(call, [(hotel[0], "2030-07-02", "2030-07-04")])["success"]
+    # the pre-check misses the booking, as when it lands right after it
+    monkeypatch.setattr(AvailabilityIndex, "conflict", lambda *args: None)
+    result = book(call, [(hotel[1], "2030-07-01", "2030-07-03"),
+                         (hotel[0], "2030-07-03", "2030-07-05")])
+    assert not result["success"] and str(hotel[0]) in result["error"]
+    assert kept() == [1, 1, 1]
+
+
+def test_invalid_leg_books_nothing(call, hotel):
+    result = book(call, [(hotel[0], "2030-07-01", "2030-07-03"),
+                         (hotel[1], "2030-07-03", "2030-07-03")])
+    assert (result["success"], result["leg"]) == (False, 1)
+    result = book(call, [(hotel[0], "2030-07-01", "2030-07-03"),
+                         (-1, "2030-07-01", "2030-07-02")])
+    assert result["error"] == "Room -1 not found"
+    assert kept() == [0, 0, 0]
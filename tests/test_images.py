@@ -0,0 +1,72 @@
+"""
+Room image variants: rendered once, cached by the browser for good, and the
+original sent when there is no variant to render
+"""
+
+import os
+
+import pytest
+from py4web import HTTP
+
+from apps.hotel_reservations import common, images
+from apps.hotel_reservations.models import db
+
+FILENAME = "rooms.image.8a3f0c1e2b4d6f70.70686f746f.jpg"
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(db.rooms.image, "uploadfolder", str(tmp_path))
+    return tmp_path
+
+
+def test_variants_are_rendered_and_cached(uploads, call):
+    Image = pytest.importorskip("PIL.Image")
+    Image.new("RGB", (800, 400), (200, 30, 30)).save(uploads / FILENAME, "JPEG")
+
+    response = call(common.image_variant, "thumb", FILENAME, headers={"Accept": "image/webp,*/*"})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "image/webp"
+    assert response.headers["Cache-Control"] == images.IMMUTABLE
+    etag = response.headers["ETag"]
+    path = uploads / images.variant_path(etag.strip('"'), "webp")
+    with Image.open(path) as variant:
+        assert variant.size == images.VARIANTS["thumb"]
+
+    # the browser has it: 304 before the file is even opened
+    with pytest.raises(HTTP) as answer:
+        call(common.image_variant, "thumb", FILENAME,
+             headers={"Accept": "image/webp", "If-None-Match": etag})
+    assert answer.value.status == 304
+    assert answer.value.headers["ETag"] == etag
+
+    # JPEG for a browser without WebP, under another key
+    response = call(common.image_variant, "card", FILENAME)
+    assert response.headers["Content-Type"] == "image/jpeg"
+    assert response.headers["ETag"] != etag
+    with Image.open(uploads / images.variant_path(response.headers["ETag"].strip('"'), "jpeg")) as variant:
+        assert variant.size == images.VARIANTS["card"]
+
+
+@pytest.mark.parametrize("name,filename", [
+    ("thumb", "customers.photo.8a3f0c1e2b4d6f70.70686f746f.jpg"),
+    ("thumb", "../" + FILENAME),
+    ("huge", FILENAME),
+    ("thumb", "rooms.image.0000000000000000.6d697373696e67.jpg"),
+])
+def test_only_variants_of_room_images(uploads, name, filename):
+    (uploads / FILENAME).write_bytes(b"not served")
+    with pytest.raises(HTTP) as answer:
+        images.serve(db, str(uploads), name, filename)
+    assert answer.value.status == 404
+
+
+def test_unreadable_image_falls_back_to_the_original(uploads, call):
+    (uploads / FILENAME).write_bytes(b"this is not an image")
+    assert images.serve(db, str(uploads), "thumb", FILENAME) is None
+
+    response = call(common.image_variant, "thumb", FILENAME)
+    assert response.status_code == 200
+    assert response.body.read() == b"this is not an image"
+    response.body.close()
+    assert not os.path.exists(uploads / images.SUBFOLDER)
@@ -0,0 +1,94 @@
+"""
+The lookup indexes of models.py are used by the queries they were made for
+
+The schema and indexes are those of the app loaded by conftest.py on an
+in-memory SQLite database; every query is checked with EXPLAIN QUERY PLAN.
+"""
+
+import datetime
+
+import pytest
+
+from apps.hotel_reservations.customer_search import identify
+from apps.hotel_reservations.models import db, free_rooms, overlapping
+
+START = datetime.date(2030, 1, 10)
+END = datetime.date(2030, 1, 15)
+
+
+def plan(query):
+    """The details of the EXPLAIN QUERY PLAN rows of a SELECT"""
+    rows = db.executesql("EXPLAIN QUERY PLAN " + query.rstrip(";"))
+    return " | ".join(str(row[-1]) for row in rows)
+
+
+@pytest.mark.parametrize(
+    "query, index",
+    [
+        (
+            lambda: db((db.reservations.room_id == 1) & overlapping(START, END))._select(
+                db.reservations.id
+            ),
+            "reservations_room_dates_idx",
+        ),
+        (
+            lambda: db(db.rooms)(free_rooms(START, END))._select(db.rooms.id),
+            "reservations_room_dates_idx",
+        ),
+        (
+            lambda: db(db.reservations.customer_id == 1)._select(
+                db.reservations.id, orderby=db.reservations.start_date
+            ),
+            "reservations_customer_start_idx",
+        ),
+        (
+            lambda: db(db.customers.user_id == 1)._select(db.customers.id),
+            "customers_user_id_idx",
+        ),
+        (
+            lambda: db(db.customers.name > "m")._select(
+                db.customers.id, orderby=db.customers.name | db.customers.id, limitby=(0, 50)
+            ),
+            "customers_name_id_idx",
+        ),
+        (
+            lambda: db(db.rooms.code == "SAMPLE-101")._select(db.rooms.id),
+            "rooms_code_idx",
+        ),
+        (
+            lambda: db(db.managers.user_id == 1)._select(db.managers.id),
+            "managers_user_id_idx",
+        ),
+        (
+            lambda: db(db.customers.name.lower() == "kim lee")._select(
+                db.customers.id, orderby=db.customers.id, limitby=(0, 2)
+            ),
+            "customers_lower_name_idx",
+        ),
+        (
+            lambda: db(db.customers.email.lower() == "kim@example.com")._select(
+                db.customers.id, orderby=db.customers.id, limitby=(0, 2)
+            ),
+            "customers_lower_email_idx",
+        ),
+    ],
+    ids=["overlap", "free_rooms", "customer_history", "customer_user",
+         "customers_page", "room_code", "manager_user", "identify_name", "identify_email"],
+)
+def test_index_is_used(query, index):
+    details = plan(query())
+    # a SEARCH on the index, and no sort left to do
+    assert "INDEX %s (" % index in details, details
+    assert "TEMP B-TREE" not in details, details
+
+
+@pytest.mark.parametrize(
+    "identifier, index",
+    [("Kim  Lee", "customers_lower_name_idx"), ("Kim@Example.com", "customers_lower_email_idx")],
+    ids=["name", "email"],
+)
+def test_identify_searches_an_index(identifier, index):
+    # no customer, so the case insensitive query is the last one identify() runs
+    assert identify(db, identifier) is None
+    details = plan(db._lastsql[0])
+    assert "INDEX %s (" % index in details, details
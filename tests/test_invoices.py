@@ -0,0 +1,47 @@
+"""
+invoices.generate renders the queued invoices in its worker processes
+"""
+
+import datetime
+
+from apps.hotel_reservations import invoices
+from apps.hotel_reservations.models import db
+
+
+def test_generate(tmp_path):
+    try:
+        room = db.rooms.insert(number_of_beds=2, amenities="WiFi", price_per_night=80)
+        customer = db.customers.insert(name="Kim <Lee>", email="kim@example.test")
+        reservation = db.reservations.insert(
+            room_id=room, customer_id=customer, total_cost=240,
+            start_date=datetime.date(2030, 5, 1), end_date=datetime.date(2030, 5, 4),
+        )
+        gone = db.reservations.insert(
+            room_id=room, customer_id=customer, total_cost=80,
+            start_date=datetime.date(2030, 6, 1), end_date=datetime.date(2030, 6, 2),
+        )
+        invoices.enqueue(db, [reservation, gone])
+        db.commit()
+        # a reservation removed without its invoice (foreign_keys is a no-op in a transaction)
+        db.executesql("PRAGMA foreign_keys = OFF;")
+        db.executesql("DELETE FROM reservations WHERE id = %d;" % gone)
+        db.commit()
+        db.executesql("PRAGMA foreign_keys = ON;")
+
+        assert invoices.generate(db, str(tmp_path), processes=2) == dict(rendered=1, failed=1)
+
+        done = db(db.invoices.reservation_id == reservation).select().first()
+        assert done.status == "rendered"
+        path = invoices.content_path(str(tmp_path), done.content_hash, "html")
+        with open(path, encoding="utf8") as stream:
+            content = stream.read()
+        assert "INV-%06d" % reservation in content and "Kim &lt;Lee&gt;" in content
+        failed = db(db.invoices.reservation_id == gone).select().first()
+        assert failed.status == "failed" and failed.error
+        # nothing is left for the next run
+        assert invoices.generate(db, str(tmp_path)) == dict(rendered=0, failed=0)
+    finally:
+        db.rollback()
+        for table in (db.invoices, db.reservations, db.customers, db.rooms):
+            db(table).delete()
+        db.commit()
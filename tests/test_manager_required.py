@@ -0,0 +1,65 @@
+"""
+Manager-only actions: 403 (or a redirect for the pages) for anyone but a
+manager, with the role looked up on every request
+"""
+
+import pytest
+from py4web import HTTP, URL, response
+from py4web.core import bottle
+
+from apps.hotel_reservations import common
+from apps.hotel_reservations.models import db
+
+
+@pytest.fixture
+def users(monkeypatch):
+    try:
+        customer = db.auth_user.insert(email="kim@example.test", first_name="Kim")
+        db.customers.insert(user_id=customer, name="Kim", email="kim@example.test")
+        manager = db.auth_user.insert(email="lee@example.test", first_name="Lee")
+        db.managers.insert(user_id=manager, name="Lee", phone_number="+15550100",
+                           email="lee@example.test")
+        db.commit()
+        logged_in = {}
+        monkeypatch.setattr(common.auth, "get_user", lambda: logged_in.get("user") or {})
+        yield logged_in, dict(id=customer), dict(id=manager)
+    finally:
+        db.rollback()
+        db(db.managers).delete()
+        db(db.customers).delete()
+        db(db.auth_user).delete()
+        db.commit()
+
+
+def test_only_managers_reach_the_manager_api(users):
+    logged_in, customer, manager = users
+
+    for user in (None, customer):
+        logged_in["user"] = user
+        with pytest.raises(bottle.HTTPError) as answer:
+            common.manager_required.on_request({})
+        assert answer.value.status_code == 403
+
+    logged_in["user"] = manager
+    assert common.manager_required.on_request({}) is None
+
+    # a revoked manager is refused at the next request, not at the next login
+    db(db.managers.user_id == manager["id"]).delete()
+    db.commit()
+    with pytest.raises(bottle.HTTPError) as answer:
+        common.manager_required.on_request({})
+    assert answer.value.status_code == 403
+
+
+def test_manager_pages_redirect_everyone_else(users):
+    logged_in, customer, manager = users
+    response.headers.pop("Location", None)
+
+    logged_in["user"] = customer
+    with pytest.raises(HTTP) as answer:
+        common.manager_page.on_request({})
+    assert answer.value.status == 303
+    assert response.headers["Location"] == URL("index")
+
+    logged_in["user"] = manager
+    assert common.manager_page.on_request({}) is None
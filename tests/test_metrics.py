@@ -0,0 +1,35 @@
+"""
+The metrics keep the counters of the threads that ended, not their shards
+"""
+
+import gc
+import threading
+
+from apps.hotel_reservations.metrics import RequestMetrics
+
+
+def test_ended_threads_are_folded():
+    metrics = RequestMetrics()
+
+    def serve(count):
+        counters = metrics.shard().route("/hotel_reservations/api/rooms")
+        for _ in range(count):
+            counters.observe("GET", 200, 0.002, 512)
+        metrics.shard().route("/hotel_reservations/api/rooms").queries += count
+
+    for _ in range(5):
+        threads = [threading.Thread(target=serve, args=(k,)) for k in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    serve(3)
+    gc.collect()
+
+    # only the shard of this thread is left
+    assert len(metrics.shards) == 1
+    counters = metrics.collect()["/hotel_reservations/api/rooms"]
+    assert counters.requests == {("GET", 200): 5 * 10 + 3}
+    assert counters.queries == 5 * 10 + 3
+    assert sum(counters.latency) == sum(counters.sizes) == 5 * 10 + 3
+    assert "hotel_http_requests_total{" in metrics.exposition()
@@ -0,0 +1,78 @@
+"""
+The occupancy matrix finds free rooms and stays, applies its own writes and
+follows the change log for reservations written by other processes
+"""
+
+from apps.hotel_reservations.models import db
+from apps.hotel_reservations.occupancy import occupancy
+
+
+def test_matrix_follows_every_writer(monkeypatch):
+    try:
+        rooms = [db.rooms.insert(number_of_beds=1, amenities="WiFi", price_per_night=100)
+                 for _ in range(2)]
+        customer = db.customers.insert(name="Kim", email="kim@example.test")
+        db.commit()
+        matrix = occupancy.ensure_loaded(db)
+        assert matrix.free_windows(rooms, "2030-07-01", "2030-07-06", 4) == {
+            rooms[0]: [0, 1], rooms[1]: [0, 1]
+        }
+
+        # from now on only the changes are applied, the table is not read again
+        loads = []
+        monkeypatch.setattr(occupancy, "load", lambda db: loads.append(db))
+
+        # written as another process would, this process never hears of it
+        db.executesql(
+            "INSERT INTO reservations (room_id, customer_id, start_date, end_date)"
+            " VALUES (%d, %d, '2030-07-02', '2030-07-04');" % (rooms[0], customer)
+        )
+        db.commit()
+        matrix = occupancy.ensure_loaded(db)
+        assert matrix.free_windows(rooms, "2030-07-01", "2030-07-06", 2) == {
+            rooms[0]: [3], rooms[1]: [0, 1, 2, 3]
+        }
+        assert matrix.free_windows(rooms, "2030-07-01", "2030-07-06", 1) == {
+            rooms[0]: [0, 3, 4], rooms[1]: [0, 1, 2, 3, 4]
+        }
+        chart = matrix.chart(rooms, "2030-07-01", "2030-07-05")
+        assert chart["daily_occupancy"] == [0, 1, 1, 0]
+        assert chart["booked_slots"] == 2
+        assert matrix.free_room_ids(rooms, "2030-07-01", "2030-07-03") == [rooms[1]]
+        assert matrix.free_room_ids(rooms, "2030-07-04", "2030-07-06") == rooms
+        assert matrix.daily_counts("2030-07-01", "2030-07-05") == [0, 1, 1, 0]
+
+        # a write of this process sets its bits at once, then is replayed from the log
+        reservation = db.reservations.insert(
+            room_id=rooms[1], customer_id=customer, start_date="2030-07-04", end_date="2030-07-05"
+        )
+        db.commit()
+        occupancy.add(rooms[1], "2030-07-04", "2030-07-05")
+        assert occupancy.daily_counts("2030-07-01", "2030-07-05") == [0, 1, 1, 1]
+        assert occupancy.ensure_loaded(db).daily_counts("2030-07-01", "2030-07-05") == [0, 1, 1, 1]
+        db(db.reservations.id == reservation).delete()
+        db.commit()
+        occupancy.discard(rooms[1], "2030-07-04", "2030-07-05")
+        assert occupancy.daily_counts("2030-07-01", "2030-07-05") == [0, 1, 1, 0]
+
+        # far outside the days the matrix covers, it grows
+        db.executesql(
+            "INSERT INTO reservations (room_id, customer_id, start_date, end_date)"
+            " VALUES (%d, %d, '2029-01-01', '2029-01-03');" % (rooms[1], customer)
+        )
+        db.commit()
+        matrix = occupancy.ensure_loaded(db)
+        assert matrix.free_room_ids(rooms, "2029-01-02", "2029-01-04") == [rooms[0]]
+        assert matrix.daily_counts("2030-07-01", "2030-07-05") == [0, 1, 1, 0]
+
+        db.executesql("DELETE FROM reservations;")
+        db.commit()
+        assert occupancy.ensure_loaded(db).chart(rooms, "2030-07-01", "2030-07-05")["booked_slots"] == 0
+        assert occupancy.free_room_ids(rooms, "2029-01-01", "2031-01-01") == rooms
+        assert loads == []
+    finally:
+        db.rollback()
+        db(db.reservations).delete()
+        db(db.customers).delete()
+        db(db.rooms).delete()
+        db.commit()
@@ -0,0 +1,121 @@
+"""
+outbox.drain sends every due message once, retries with backoff and claims
+its batch against overlapping runs
+"""
+
+import smtplib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from apps.hotel_reservations import outbox
+from apps.hotel_reservations.models import db
+
+SETTINGS = SimpleNamespace(
+    SMTP_SERVER="localhost:1025", SMTP_SSL=False, SMTP_TLS=False,
+    SMTP_LOGIN="user:password", SMTP_SENDER="hotel@example.test",
+)
+
+
+class Server:
+    def __init__(self, refuse=(), on_send=None):
+        self.refuse = refuse
+        self.on_send = on_send
+        self.sent = []
+        self.closed = False
+
+    def send_message(self, msg):
+        if self.on_send:
+            self.on_send()
+        if msg["To"] in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({msg["To"]: (550, b"no such user")})
+        self.sent.append(msg["To"])
+
+    def quit(self):
+        self.closed = True
+
+
+@pytest.fixture
+def messages():
+    try:
+        yield [outbox.queue(db, "guest%d@example.test" % k, "Subject", "Body") for k in range(3)]
+    finally:
+        db.rollback()
+        db(db.outbox).delete()
+        db.commit()
+
+
+def test_retry_with_backoff_then_fail(monkeypatch, messages):
+    server = Server(refuse={"guest1@example.test"})
+    monkeypatch.setattr(outbox, "connect", lambda settings: server)
+
+    batch = outbox.drain(db, SETTINGS, max_attempts=2, backoff=60)
+    assert (batch["sent"], batch["retried"], batch["failed"]) == (2, 1, 0)
+    assert server.sent == ["guest0@example.test", "guest2@example.test"] and server.closed
+    row = db.outbox[messages[1]]
+    assert (row.status, row.attempts, row.claim) == ("queued", 1, None)
+    assert row.next_attempt_on > datetime.now() + timedelta(seconds=50)
+
+    # not due yet
+    assert outbox.drain(db, SETTINGS)["messages"] == 0
+    db(db.outbox.id == messages[1]).update(next_attempt_on=datetime.now())
+    batch = outbox.drain(db, SETTINGS, max_attempts=2, backoff=60)
+    assert (batch["messages"], batch["failed"]) == (1, 1)
+    assert db.outbox[messages[1]].status == "failed"
+    assert [db.outbox[k].status for k in (messages[0], messages[2])] == ["sent", "sent"]
+
+
+def test_connection_failure_reschedules_the_batch(monkeypatch, messages):
+    def refuse(settings):
+        raise ConnectionRefusedError("connection refused")
+
+    monkeypatch.setattr(outbox, "connect", refuse)
+    batch = outbox.drain(db, SETTINGS)
+    assert (batch["messages"], batch["retried"]) == (3, 3)
+    assert {row.status for row in db(db.outbox).select()} == {"queued"}
+
+
+def test_overlapping_runs_send_once(monkeypatch, messages):
+    overlapping = []
+
+    def second_run():
+        # a second run starts while the first one is sending
+        if not overlapping:
+            overlapping.append(outbox.drain(db, SETTINGS))
+
+    first, second = Server(on_send=second_run), Server()
+    servers = iter([first, second])
+    monkeypatch.setattr(outbox, "connect", lambda settings: next(servers))
+
+    assert outbox.drain(db, SETTINGS)["sent"] == 3
+    assert overlapping[0]["messages"] == 0 and second.sent == []
+    assert len(first.sent) == 3
+
+
+def test_expired_claim_is_taken_over(monkeypatch, messages):
+    # a run that died after claiming
+    expired = datetime.now() - timedelta(seconds=1)
+    db(db.outbox).update(status="sending", claim="dead", next_attempt_on=expired)
+    server = Server()
+    monkeypatch.setattr(outbox, "connect", lambda settings: server)
+    assert outbox.drain(db, SETTINGS)["sent"] == 3
+
+
+def test_login_failure_closes_the_socket(monkeypatch):
+    closed = []
+
+    class SMTP:
+        def __init__(self, host, port, timeout):
+            pass
+
+        def login(self, user, password):
+            raise smtplib.SMTPAuthenticationError(535, b"bad credentials")
+
+        def close(self):
+            closed.append(True)
+
+    monkeypatch.setattr(smtplib, "SMTP", SMTP)
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        outbox.connect(SETTINGS)
+    assert closed == [True]
@@ -0,0 +1,49 @@
+"""
+rollup.rebuild() recomputes exactly what add() and remove() maintain
+"""
+
+import datetime
+
+from apps.hotel_reservations import rollup
+from apps.hotel_reservations.models import db
+
+DAY = datetime.date(2030, 3, 1)
+
+
+def snapshot():
+    stats = db.daily_room_stats
+    return {
+        (str(row.day), row.room_id): (row.occupied, round(row.revenue, 6))
+        for row in db(stats).select(stats.day, stats.room_id, stats.occupied, stats.revenue)
+    }
+
+
+def test_rebuild_matches_incremental_rollup():
+    try:
+        rooms = [db.rooms.insert(number_of_beds=1, amenities="WiFi", price_per_night=100)
+                 for _ in range(3)]
+        customer = db.customers.insert(name="Kim", email="kim@example.test")
+        stays = [
+            (rooms[0], 0, 3, 300.0),
+            (rooms[0], 3, 5, 250.0),
+            (rooms[1], -2, 200, 1000.0),  # longer than a rebuild range
+            (rooms[2], 10, 11, None),
+            (rooms[2], 4, 4, 0.0),  # no night
+        ]
+        reservations = []
+        for room_id, start, end, cost in stays:
+            values = dict(room_id=room_id, customer_id=customer, total_cost=cost,
+                          start_date=DAY + datetime.timedelta(days=start),
+                          end_date=DAY + datetime.timedelta(days=end))
+            values["id"] = db.reservations.insert(**values)
+            reservations.append(values)
+        rollup.add(db, reservations)
+        rollup.remove(db, reservations[1:2])
+        db(db.reservations.id == reservations[1]["id"]).delete()
+        expected = snapshot()
+        assert len(expected) == 3 + 202 + 1
+
+        assert rollup.rebuild(db, days=30) == len(expected)
+        assert snapshot() == expected
+    finally:
+        db.rollback()
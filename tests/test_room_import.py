@@ -0,0 +1,92 @@
+"""
+The room import upserts by code, skips invalid records and works in chunks,
+from Python and from the command line
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from apps.hotel_reservations.room_import import import_rooms, read_records
+from apps.hotel_reservations.models import db
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CSV = """code,beds,amenities,price
+R-1,1,"WiFi, TV",90
+R-2,2,"WiFi, Balcony",120
+,3,Kitchenette,150
+R-3,9,WiFi,100
+R-4,2,,100
+R-5,two,WiFi,100
+"""
+
+
+@pytest.fixture
+def cleanup():
+    try:
+        yield
+    finally:
+        db.rollback()
+        db(db.room_amenities).delete()
+        db(db.amenities).delete()
+        db(db.rooms).delete()
+        db.commit()
+
+
+def amenities_of(code):
+    room = db(db.rooms.code == code).select().first()
+    links = db(db.room_amenities.room_id == room.id).select(
+        db.amenities.name, join=db.amenities.on(db.amenities.id == db.room_amenities.amenity_id)
+    )
+    return sorted(link.name for link in links)
+
+
+def test_import_then_upsert(tmp_path, cleanup):
+    path = tmp_path / "rooms.csv"
+    path.write_text(CSV)
+    totals = import_rooms(db, read_records(str(path)), chunk_size=2)
+    assert (totals["records"], totals["chunks"]) == (6, 3)
+    assert (totals["inserted"], totals["updated"], totals["invalid"]) == (3, 0, 3)
+    # CSV lines, the header is line 1
+    assert [line for line, error in totals["errors"]] == [5, 6, 7]
+    assert totals["errors"][0][1] == "Number of beds must be between 1 and 5"
+    assert db(db.rooms).count() == 3
+    assert amenities_of("R-2") == ["Balcony", "WiFi"]
+
+    path = tmp_path / "rooms.ndjson"
+    path.write_text(
+        '{"code": "R-1", "beds": 1, "amenities": "WiFi, TV", "price": 90}\n'
+        '{"code": "R-2", "beds": 2, "amenities": ["WiFi", "Jacuzzi"], "price": 130}\n'
+        "not json\n"
+        '{"code": "R-6", "beds": 1, "amenities": "WiFi", "price": 80}\n'
+        '{"code": "R-6", "beds": 1, "amenities": "WiFi", "price": 85}\n'
+    )
+    totals = import_rooms(db, read_records(str(path)), chunk_size=10)
+    assert (totals["unchanged"], totals["updated"], totals["inserted"], totals["invalid"]) == (1, 1, 1, 1)
+    assert totals["errors"] == [(3, "Not a room record")]
+    r2 = db(db.rooms.code == "R-2").select().first()
+    assert (r2.price_per_night, r2.amenities) == (130.0, "WiFi, Jacuzzi")
+    assert amenities_of("R-2") == ["Jacuzzi", "WiFi"]
+    # the last record of a code wins
+    assert db(db.rooms.code == "R-6").select().first().price_per_night == 85.0
+    assert db(db.rooms).count() == 4
+
+
+def test_command_line(tmp_path):
+    path = tmp_path / "rooms.csv"
+    path.write_text(CSV)
+    command = [sys.executable, "-m", "apps.hotel_reservations.room_import", str(path),
+               "--chunk-size", "4"]
+    env = dict(os.environ, HOTEL_DB_URI="sqlite:memory")
+    done = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert done.returncode == 1, done.stderr  # some records are invalid
+    assert "inserted:  3" in done.stdout and "invalid:   3" in done.stdout
+    assert "line 5: Number of beds must be between 1 and 5" in done.stdout
+
+    done = subprocess.run(command[:3] + ["--sample"], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=120)
+    assert done.returncode == 0, done.stderr
+    assert "inserted:  6" in done.stdout
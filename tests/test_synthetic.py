@@ -0,0 +1,81 @@
+"""
+The synthetic data depends on the arguments and the seed only, not on the day
+"""
+
+import datetime
+import os
+import subprocess
+import sys
+
+from apps.hotel_reservations import synthetic
+from apps.hotel_reservations.models import db
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLES = ("daily_room_stats", "reservations", "room_amenities", "amenities", "customers",
+          "auth_user", "rooms")
+
+
+def clock(today):
+    """date and datetime classes whose today() and now() are on the day today"""
+
+    class Date(datetime.date):
+        @classmethod
+        def today(cls):
+            return cls(today.year, today.month, today.day)
+
+    class DateTime(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(today.year, today.month, today.day, 12)
+
+    return Date, DateTime
+
+
+def generate(monkeypatch, today):
+    Date, DateTime = clock(today)
+    monkeypatch.setattr(synthetic, "date", Date)
+    monkeypatch.setattr(datetime, "datetime", DateTime)
+    result = synthetic.generate(db, rooms=12, customers=30, reservations=400, seed=7, rollup=True)
+    # without the ids the database numbers itself, amenities are linked by name
+    names = {row.id: row.name for row in db(db.amenities).select()}
+    rows = {}
+    for name in TABLES:
+        rows[name] = db(db[name]).select(orderby=db[name].id).as_list()
+        for row in rows[name]:
+            if name not in ("rooms", "customers", "auth_user"):
+                del row["id"]
+            if "amenity_id" in row:
+                row["amenity_id"] = names[row["amenity_id"]]
+    for name in TABLES:
+        db(db[name]).delete()
+    db.commit()
+    return result, rows
+
+
+def test_same_seed_same_rows_any_day(monkeypatch):
+    try:
+        first, rows = generate(monkeypatch, datetime.date(2026, 1, 5))
+        second, again = generate(monkeypatch, datetime.date(2027, 8, 20))
+        assert first["reservations"] > 300 and rows["reservations"] and rows["daily_room_stats"]
+        assert first["end_date"] == second["end_date"] == str(synthetic.END_DATE)
+        assert rows == again
+        # the shared password still verifies
+        crypt = db.auth_user.password.requires
+        crypt = crypt[-1] if isinstance(crypt, (list, tuple)) else crypt
+        assert crypt("synthetic")[0] == rows["auth_user"][0]["password"]
+    finally:
+        db.rollback()
+        for name in TABLES:
+            db(db[name]).delete()
+        db.commit()
+
+
+def test_command_line():
+    done = subprocess.run(
+        [sys.executable, "-m", "apps.hotel_reservations.synthetic", "--rooms", "3",
+         "--customers", "5", "--reservations", "40", "--end-date", "2031-03-01"],
+        cwd=ROOT, env=dict(os.environ, HOTEL_DB_URI="sqlite:memory"),
+        capture_output=True, text=True, timeout=120,
+    )
+    assert done.returncode == 0, done.stderr
+    assert "rooms:        3" in done.stdout and "to 2031-03-01" in done.stdout
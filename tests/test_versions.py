@@ -0,0 +1,39 @@
+"""
+The data versions move with every write, however it is made
+"""
+
+from apps.hotel_reservations import bulk
+from apps.hotel_reservations.models import db
+from apps.hotel_reservations.versions import versions
+
+
+def test_every_writer_moves_the_version():
+    try:
+        tags = [versions.etag(db, ["customers", "rooms"], "/api/rooms")]
+        before = versions.get(db, "customers", "rooms")
+
+        # through pydal
+        customer = db.customers.insert(name="Kim", email="kim@example.test")
+        db(db.customers.id == customer).update(phone_number="5551234567")
+        tags.append(versions.etag(db, ["customers", "rooms"], "/api/rooms"))
+        # executemany, no pydal callbacks
+        bulk.insert_many(db, db.customers, ["name", "email"], [("Ann", "ann@example.test")])
+        tags.append(versions.etag(db, ["customers", "rooms"], "/api/rooms"))
+        # raw SQL, as another process or a tool could run
+        db.executesql("DELETE FROM customers WHERE email = 'ann@example.test';")
+        tags.append(versions.etag(db, ["customers", "rooms"], "/api/rooms"))
+
+        after = versions.get(db, "customers", "rooms")
+        assert after["customers"] == before["customers"] + 4
+        assert after["rooms"] == before["rooms"]
+        assert len(set(tags)) == len(tags)
+    finally:
+        db.rollback()
+
+
+def test_rollback_restores_the_version():
+    before = versions.get(db, "rooms")
+    db.rooms.insert(number_of_beds=1, amenities="WiFi", price_per_night=100)
+    assert versions.get(db, "rooms") != before
+    db.rollback()
+    assert versions.get(db, "rooms") == before